@@ -1,18 +1,59 @@
 __version__ = "0.3.2"
 
 import csv
+import importlib
+import io
 import os
 import re
 import shlex
 import struct
 import subprocess
+from collections.abc import Callable
 from pathlib import Path
 
-from lxml import etree
 from loguru import logger
 
 from . import types
 
+# Submodules are imported on first access (mzx.analog, ...), so importing
+# mzx or running a CLI command does not load NumPy, lxml or PySide6 unless
+# that command needs them.
+_SUBMODULES = {
+    "analog",
+    "batch",
+    "bruker",
+    "catalog",
+    "centroid",
+    "compression",
+    "consolidate",
+    "costs",
+    "decimate",
+    "docker",
+    "filters",
+    "follow",
+    "gui",
+    "logbuffer",
+    "mapreduce",
+    "mgf",
+    "mzml",
+    "preview",
+    "progress",
+    "qc",
+    "server",
+    "staging",
+    "supervisor",
+    "vendor",
+    "verify",
+    "waters",
+}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 docker_image = "chambm/pwiz-skyline-i-agree-to-the-vendor-licenses"
 
 
@@ -24,13 +65,21 @@ class RawFileConversionError(Exception):
     pass
 
 
-def run_cmd(cmd):
+def run_cmd(cmd, on_start=None, on_line=None):
     """
     Run a command and return the output.
+
+    Args:
+        cmd: Command line to run.
+        on_start: Optional callable receiving the Popen object once the
+            process has started, e.g. to allow cancelling it.
+        on_line: Optional callable receiving each line of output.
     """
     cmd = shlex.split(cmd, posix=True)
     # logger.info(f"Running command: {cmd}")
     p = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    if on_start is not None:
+        on_start(p)
 
     output = ""
     while True:
@@ -39,6 +88,8 @@ def run_cmd(cmd):
             if not line:
                 break
             (logger.info(line.strip(), flush=True),)
+            if on_line is not None:
+                on_line(line)
             output = output + line
 
     logger.info("Process Complete")
@@ -78,17 +129,22 @@ def modify_waters_scan_header(line):
 
 def process_waters_scan_headers(file_path):
     """
-    Process the Waters scan headers in the given file.
+    Process the Waters scan headers in the given file, which may be
+    gzip-compressed.
     """
+    from . import compression
+
     # TODO address UTF8 encoding issue
-    with open(file_path, encoding="utf8", errors="ignore") as file:
+    raw = compression.open_input(file_path)
+    with io.TextIOWrapper(raw, encoding="utf8", errors="ignore") as file:
         lines = file.readlines()
 
     modified_lines = []
     for line in lines:
         modified_lines.append(modify_waters_scan_header(line))
 
-    with open(file_path, "w") as file:
+    out = compression.open_output(file_path)
+    with io.TextIOWrapper(out, encoding="utf8") as file:
         file.writelines(modified_lines)
 
 
@@ -163,10 +219,9 @@ def get_chromatogram_info(raw_dir):
     Returns:
         List of chromatogram channel metadata from parse_chroinf.
     """
-    for f in os.listdir(raw_dir):
-        if f.lower() == "_chroms.inf":
-            return parse_chroinf(os.path.join(raw_dir, f))
-    return []
+    from .waters import raw_directory
+
+    return raw_directory(raw_dir).chromatogram_info
 
 
 def write_chrom_csv(filename, times, intensities):
@@ -185,20 +240,47 @@ def write_chrom_csv(filename, times, intensities):
             writer.writerow({"time": f"{t:.6f}", "intensity": f"{v:.6f}"})
 
 
-def export_chromatograms(raw_dir, chrom_info):
+def export_chromatograms(
+    raw_dir,
+    chrom_info,
+    decimation=None,
+    decimation_points=2000,
+    full_resolution=True,
+    channels=None,
+    window=None,
+):
     """
     Extract and export all chromatogram channels from a Waters .raw directory to CSV.
 
     Output files are written to the parent directory of the .raw folder,
-    named {raw_name}_{channel_name}.csv.
+    named {raw_name}_{channel_name}.csv. With decimation, a downsampled copy
+    of each channel is written to {raw_name}_{channel_name}_{method}.csv; the
+    trace is read through a memory map, so it is never loaded in full.
 
     Args:
         raw_dir: Path to the Waters .raw directory.
         chrom_info: Channel metadata from get_chromatogram_info().
+        decimation: Optional downsampling method, "lttb" or "minmax".
+        decimation_points: Target number of points per downsampled trace.
+        full_resolution: Whether to write the full-resolution CSVs.
+        channels: Optional channel names or numbers to export instead of
+            all channels.
+        window: Optional (start, end) retention times in minutes; only the
+            samples in between are exported. Either end may be None.
 
     Returns:
         List of output CSV file paths.
+
+    Raises:
+        analog.ChannelError: If a requested channel does not exist.
     """
+    from . import analog, decimate
+
+    store = analog.channel_store(raw_dir)
+    selected = None
+    if channels is not None:
+        selected = {store.channel(key).number for key in channels}
+
     parent_path = Path(raw_dir).parent.absolute()
     raw_name = Path(raw_dir).name
     pattern = re.compile(r"_chro(\d+)", re.IGNORECASE)
@@ -213,79 +295,178 @@ def export_chromatograms(raw_dir, chrom_info):
             continue
 
         number = int(match.group(1))
-        result = parse_chrodat(os.path.join(raw_dir, f))
-        if result is None:
-            logger.warning(f"Skipping empty chromatogram file: {f}")
+        if selected is not None and number not in selected:
             continue
-
-        times, intensities = result
-        # Convert times from minutes to seconds
-        times = [t * 60 for t in times]
-
         if number <= len(chrom_info):
             channel_name = chrom_info[number - 1][0]
         else:
             channel_name = f"channel_{number}"
 
-        csv_name = f"{raw_name}_{channel_name}.csv"
-        csv_path = str(parent_path / csv_name)
-        write_chrom_csv(csv_path, times, intensities)
-        logger.info(f"Exported chromatogram: {csv_path}")
-        output_files.append(csv_path)
+        # Only the channels that are exported are mapped
+        dat_path = os.path.join(raw_dir, f)
+        if window is not None:
+            samples = store.samples(number)
+        else:
+            samples = analog.read_chrodat(dat_path)
+        if samples is None:
+            logger.warning(f"Skipping empty chromatogram file: {f}")
+            continue
+
+        if window is not None:
+            times, intensities = store.window(number, *window)
+        else:
+            times, intensities = samples["time"], samples["intensity"]
+        if full_resolution:
+            csv_name = f"{raw_name}_{channel_name}.csv"
+            csv_path = str(parent_path / csv_name)
+            # Convert times from minutes to seconds
+            write_chrom_csv(csv_path, times.astype(float) * 60, intensities)
+            logger.info(f"Exported chromatogram: {csv_path}")
+            output_files.append(csv_path)
+
+        if decimation is not None:
+            d_times, d_intensities = decimate.decimate(
+                times, intensities, decimation_points, decimation
+            )
+            csv_name = f"{raw_name}_{channel_name}_{decimation}.csv"
+            csv_path = str(parent_path / csv_name)
+            write_chrom_csv(csv_path, d_times.astype(float) * 60, d_intensities)
+            logger.info(f"Exported decimated chromatogram: {csv_path}")
+            output_files.append(csv_path)
 
     return output_files
 
 
-def extract_tic_from_mzml(mzml_path, output_csv=None):
+def read_tic_from_mzml(mzml_path):
     """
-    Extract the Total Ion Current (TIC) from an mzML file and write to CSV.
+    Read the Total Ion Current (TIC) trace from an mzML file.
 
     Parses each spectrum element for scan start time and total ion current.
     Times are converted from minutes to seconds.
 
+    Args:
+        mzml_path: Path to the mzML file.
+
+    Returns:
+        Tuple of (times, tics) as lists of floats.
+    """
+    from lxml import etree
+
+    from . import compression
+
+    times = []
+    tics = []
+
+    with compression.open_input(mzml_path) as f:
+        for event, elem in etree.iterparse(
+            f, events=("end",), tag="{http://psi.hupo.org/ms/mzml}spectrum"
+        ):
+            rt = None
+            tic = None
+            # Check cvParams directly under spectrum and under scanList/scan
+            for cv in elem.iterdescendants("{http://psi.hupo.org/ms/mzml}cvParam"):
+                acc = cv.get("accession")
+                if acc == "MS:1000016":  # scan start time
+                    rt = float(cv.get("value"))
+                    unit = cv.get("unitName", "minute")
+                    if unit == "minute":
+                        rt *= 60.0
+                elif acc == "MS:1000285":  # total ion current
+                    tic = float(cv.get("value"))
+            if rt is not None and tic is not None:
+                times.append(rt)
+                tics.append(tic)
+            elem.clear()
+
+    return times, tics
+
+
+def extract_tic_from_mzml(
+    mzml_path,
+    output_csv=None,
+    decimation=None,
+    decimation_points=2000,
+    full_resolution=True,
+):
+    """
+    Extract the Total Ion Current (TIC) from an mzML file and write to CSV.
+
     Args:
         mzml_path: Path to the mzML file.
         output_csv: Output CSV path. Defaults to {mzml_base}_TIC.csv.
+        decimation: Optional downsampling method, "lttb" or "minmax"; the
+            downsampled TIC is written to {output_base}_{method}.csv.
+        decimation_points: Target number of points of the downsampled TIC.
+        full_resolution: Whether to write the full-resolution CSV.
 
     Returns:
-        Path to the output CSV file.
+        Path to the output CSV file (the downsampled one if full_resolution
+        is False).
     """
     if output_csv is None:
-        base = os.path.splitext(mzml_path)[0]
+        from . import compression
+
+        base = compression.splitext(mzml_path)[0]
         output_csv = f"{base}_TIC.csv"
 
-    times = []
-    tics = []
+    times, tics = read_tic_from_mzml(mzml_path)
+    return write_tic_csv(
+        times, tics, output_csv, decimation, decimation_points, full_resolution
+    )
+
+
+def write_tic_csv(
+    times,
+    tics,
+    output_csv,
+    decimation=None,
+    decimation_points=2000,
+    full_resolution=True,
+):
+    """
+    Write a TIC trace to CSV, optionally with a downsampled copy.
+
+    Args:
+        times: Scan times in seconds.
+        tics: Total ion current of each scan.
+        output_csv: Output CSV path.
+        decimation: Optional downsampling method, "lttb" or "minmax"; the
+            downsampled TIC is written to {output_base}_{method}.csv.
+        decimation_points: Target number of points of the downsampled TIC.
+        full_resolution: Whether to write the full-resolution CSV.
+
+    Returns:
+        Path to the output CSV file (the downsampled one if full_resolution
+        is False).
+    """
+    output = output_csv
+    if full_resolution:
+        write_chrom_csv(output_csv, times, tics)
+        logger.info(f"Exported TIC: {output_csv} ({len(times)} scans)")
+    if decimation is not None:
+        import numpy as np
+
+        from . import decimate
+
+        decimated_csv = f"{os.path.splitext(output_csv)[0]}_{decimation}.csv"
+        d_times, d_tics = decimate.decimate(
+            np.asarray(times), np.asarray(tics), decimation_points, decimation
+        )
+        write_chrom_csv(decimated_csv, d_times, d_tics)
+        logger.info(f"Exported decimated TIC: {decimated_csv} ({len(d_times)} scans)")
+        if not full_resolution:
+            output = decimated_csv
+    return output
+
 
-    for event, elem in etree.iterparse(
-        mzml_path, events=("end",), tag="{http://psi.hupo.org/ms/mzml}spectrum"
-    ):
-        rt = None
-        tic = None
-        # Check cvParams directly under spectrum and under scanList/scan
-        for cv in elem.iterdescendants("{http://psi.hupo.org/ms/mzml}cvParam"):
-            acc = cv.get("accession")
-            if acc == "MS:1000016":  # scan start time
-                rt = float(cv.get("value"))
-                unit = cv.get("unitName", "minute")
-                if unit == "minute":
-                    rt *= 60.0
-            elif acc == "MS:1000285":  # total ion current
-                tic = float(cv.get("value"))
-        if rt is not None and tic is not None:
-            times.append(rt)
-            tics.append(tic)
-        elem.clear()
-
-    write_chrom_csv(output_csv, times, tics)
-    logger.info(f"Exported TIC: {output_csv} ({len(times)} scans)")
-    return output_csv
-
-
-def waters_convert(params: types.TConfig) -> str:
+def waters_convert(
+    params: types.TConfig, runner: Callable[[str], str] | None = None
+) -> str:
     """
     Convert Waters raw file to mzML format.
     """
+    from .waters import raw_directory
+
     logger.info(f"Converting Waters file: {params['infile']}")
 
     # Find the lockmass reference in the _extern.inf file
@@ -293,31 +474,19 @@ def waters_convert(params: types.TConfig) -> str:
 
     if not params["lockmass_disabled"]:
         logger.info("Using Lockmass reference is enabled if present.")
-    # get the list of files in the directory
-    files = os.listdir(params["infile"])
-    # Test if _extern.inf file is present
-
-    extern_file = [f for f in files if "_extern.inf" in f]
-    if not extern_file:
+    raw = raw_directory(params["infile"])
+    if raw.extern_path is None:
         raise WatersConvertException(
             "Unable to convert Waters file, no _extern.inf file found!"
         )
-    else:
-        logger.info("Found _extern.inf file.")
-        # Read the _extern.inf file
-        ex_file_path: str = os.path.join(params["infile"], extern_file[0])
-        with open(ex_file_path, "r", encoding="latin-1", errors="strict") as f:
-            lines = f.readlines()
-            # Identify the function file for the REFERENCE
-            for line in lines:
-                if "REFERENCE" in line:
-                    function_string, function_number = format_function_number(line)
-                    logger.info(f"Lockmass Reference found: {function_string}")
-                    logger.info(
-                        f"Lockmass ScanEvent Function number: {function_number}"
-                    )
-                    lockmass_present = True
-                    break
+    logger.info("Found _extern.inf file.")
+    # Identify the function file for the REFERENCE
+    lockmass_function = raw.lockmass_function
+    if lockmass_function is not None:
+        function_string, function_number = lockmass_function
+        logger.info(f"Lockmass Reference found: {function_string}")
+        logger.info(f"Lockmass ScanEvent Function number: {function_number}")
+        lockmass_present = True
 
     waters_params: types.TConfig = dict(
         type="mzml",
@@ -330,7 +499,7 @@ def waters_convert(params: types.TConfig) -> str:
         remove_zeros=params["remove_zeros"],
         outfile=None,
         overwrite=False,
-        verbose=False,
+        verbose=params["verbose"],
         lockmass_disabled=params["lockmass_disabled"],
         lockmass=True if lockmass_present else False,
         neg_lockmass=params["neg_lockmass"],
@@ -339,32 +508,37 @@ def waters_convert(params: types.TConfig) -> str:
         lockmass_function_exclude=function_number if lockmass_present else None,
     )
 
-    outfile = msconvert(waters_params)
+    outfile = msconvert(waters_params, runner=runner)
 
     return outfile
 
 
-def convert_raw_file(params: types.TConfig) -> str:
+def convert_raw_file(
+    params: types.TConfig, runner: Callable[[str], str] | None = None
+) -> str:
     """
     Convert the raw file to mzML format based on the vendor.
+
+    runner, if given, is used instead of run_cmd to execute the conversion
+    command.
     """
     logger.info(f"Converting {params['vendor']} file: {params['infile']}")
     match params["vendor"].lower():
         case "thermo":
-            return msconvert(params)
+            return msconvert(params, runner=runner)
         case "agilent":
-            return msconvert(params)
+            return msconvert(params, runner=runner)
         case "waters":
             try:
-                return waters_convert(params)
+                return waters_convert(params, runner=runner)
             except WatersConvertException as e:
                 logger.error(str(e))
                 raise RawFileConversionError(str(e))
         case "bruker":
-            return msconvert(params)
+            return msconvert(params, runner=runner)
         case "unspecified":
             logger.error("Vendor not supported, trying msconvert.")
-            return msconvert(params)
+            return msconvert(params, runner=runner)
         case _:
             raise RawFileConversionError("Unsupported vendor!")
 
@@ -390,45 +564,56 @@ def exclusion_string(x: int) -> str:
         if x - 1 == 1:
             parts.append("1")
         else:
-            parts.append(f"1-{x-1}")
+            parts.append(f"1-{x - 1}")
 
     # Always allow (x+1)..∞, shown as "(x+1)-"
-    parts.append(f"{x+1}-")
+    parts.append(f"{x + 1}-")
 
     return " ".join(parts)
 
 
-def msconvert(params):
-    """
-    Converts the given file to the mzML format using the msconvert tool.
-    """
+def _msconvert_paths(params):
     raw_path: str = os.path.abspath(params["infile"])
     path = raw_path.strip("/") if raw_path.endswith("/") else raw_path
     directory = os.path.dirname(path)
     filename = os.path.basename(path)
 
-    logger.info(f"Raw path = {raw_path}")
-    logger.info(f"File path = {path}")
-    logger.info(f"Converting {params['infile']} to {params['type']} format.")
-    logger.info(f"Input directory: {directory}")
-    logger.info(f"Input filename: {filename}")
-
     if params["outfile"] is not None:
         outfilename = os.path.basename(params["outfile"])
         base = os.path.splitext(outfilename)[0]
     else:
         base = os.path.splitext(filename)[0]
+    extension = {"mzxml": ".mzXML", "mgf": ".mgf"}.get(params["type"], ".mzML")
+    return raw_path, path, directory, filename, base + extension
+
+
+def msconvert_output_path(params):
+    """
+    The path msconvert writes its output to for the given parameters.
+    """
+    _, _, directory, _, outfile = _msconvert_paths(params)
+    return os.path.join(directory, outfile)
+
+
+def msconvert(params, runner=None):
+    """
+    Converts the given file to the mzML format using the msconvert tool.
+    """
+    raw_path, path, directory, filename, outfile = _msconvert_paths(params)
+
+    logger.info(f"Raw path = {raw_path}")
+    logger.info(f"File path = {path}")
+    logger.info(f"Converting {params['infile']} to {params['type']} format.")
+    logger.info(f"Input directory: {directory}")
+    logger.info(f"Input filename: {filename}")
 
     filter_string = ""
     if params["type"] == "mzxml":
         filter_string += " --mzXML"
-        outfile = base + ".mzXML"
     elif params["type"] == "mgf":
         filter_string += " --mgf"
-        outfile = base + ".mgf"
     else:
         filter_string += " --mzML"
-        outfile = base + ".mzML"
 
     logger.info(f"Output file: {outfile}")
     filter_string += f' --outfile "/data/{outfile}"'
@@ -436,6 +621,13 @@ def msconvert(params):
     if params["index"] is False:
         filter_string += " --noindex"
 
+    from .supervisor import needs_output
+
+    if params["verbose"] or needs_output(runner):
+        # Reports "writing spectra: i/n" progress lines, which also keep an
+        # idle watchdog from stopping a healthy conversion
+        filter_string += " -v"
+
     if params["peak_picking"] == "all":
         filter_string += " --filter 'peakPicking true 1-'"
     elif params["peak_picking"] == "ms1":
@@ -466,13 +658,15 @@ def msconvert(params):
         if params["lockmass_function_exclude"] is not None:
             filter_string += f" --filter 'scanEvent {exclusion_string(params['lockmass_function_exclude'])}'"
 
-    cmd = "docker run --rm -v '{}':/data {} wine msconvert '/data/{}' {}".format(
-        directory, docker_image, filename, filter_string
+    from .docker import container_name
+
+    cmd = "docker run --rm --name {} -v '{}':/data {} wine msconvert '/data/{}' {}".format(
+        container_name(raw_path), directory, docker_image, filename, filter_string
     )
 
     logger.info("Running msconvert")
 
-    _output = run_cmd(cmd)
+    _output = (runner or run_cmd)(cmd)
 
     logger.info("Conversion complete.")
 
@@ -1,6 +1,8 @@
 """Run the CLI entry point via ``python -m mzx`` (same as the ``mzx`` console script)."""
 
+import sys
+
 from .cli import main
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
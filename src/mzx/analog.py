@@ -0,0 +1,339 @@
+"""
+NumPy access to Waters analog channel files (_CHRO*.DAT).
+"""
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from loguru import logger
+
+from . import compression, mzml
+from .waters import raw_directory
+
+PRESSURE_UNITS = {"psi", "bar", "mbar", "kpa", "mpa", "pa"}
+ABSORBANCE_UNITS = {"au", "mau"}
+
+CHRODAT_DATA_START = 0x80
+# Each sample is two little-endian float32 values: time (minutes), intensity
+SAMPLE_DTYPE = np.dtype([("time", "<f4"), ("intensity", "<f4")])
+# Windows kept per ChannelStore, and stores kept per process
+WINDOW_CACHE_SIZE = 1024
+STORE_CACHE_SIZE = 256
+
+
+class ChannelError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class AnalogChannel:
+    number: int
+    name: str
+    unit: str
+    path: str
+
+
+def read_chrodat(path: str) -> np.ndarray | None:
+    """
+    Memory-map a Waters _CHRO*.DAT file as a structured array.
+
+    Unlike parse_chrodat, nothing is read until the array is accessed, so
+    slicing a window or iterating in chunks never loads the whole trace.
+
+    Args:
+        path: Path to the _CHRO*.DAT file.
+
+    Returns:
+        Read-only array with "time" (minutes) and "intensity" fields, or None
+        if the file holds no samples.
+    """
+    num_samples = (os.path.getsize(path) - CHRODAT_DATA_START) // SAMPLE_DTYPE.itemsize
+    if num_samples <= 0:
+        return None
+    return np.memmap(
+        path,
+        dtype=SAMPLE_DTYPE,
+        mode="r",
+        offset=CHRODAT_DATA_START,
+        shape=(num_samples,),
+    )
+
+
+def analog_channels(raw_dir: str, chrom_info: list) -> list[AnalogChannel]:
+    """
+    List the analog channel files in a Waters .raw directory.
+
+    Args:
+        raw_dir: Path to the Waters .raw directory.
+        chrom_info: Channel metadata from get_chromatogram_info().
+
+    Returns:
+        Channels sorted by channel number, named and with units from
+        chrom_info where available.
+    """
+    channels = []
+    for number, path in raw_directory(raw_dir).analog_files.items():
+        if number <= len(chrom_info):
+            info = chrom_info[number - 1]
+            name = info[0]
+            unit = info[1].strip() if len(info) > 1 else ""
+        else:
+            name = f"channel_{number}"
+            unit = ""
+        channels.append(AnalogChannel(number, name, unit, path))
+    return channels
+
+
+class ChannelStore:
+    """
+    Time-windowed access to the analog channels of a Waters .raw directory.
+
+    Each channel file is memory-mapped once and its time column, which the
+    instrument writes in ascending order, is binary searched, so a window
+    reads only the samples in it. Windows are cached, so repeating a query
+    costs a dictionary lookup.
+
+    Args:
+        raw_dir: Path to the Waters .raw directory.
+    """
+
+    def __init__(self, raw_dir: str):
+        self.raw_dir = raw_dir
+        self._samples: dict[int, np.ndarray | None] = {}
+        self._windows: OrderedDict[tuple, tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def channels(self) -> list[AnalogChannel]:
+        raw = raw_directory(self.raw_dir)
+        return analog_channels(self.raw_dir, raw.chromatogram_info)
+
+    @property
+    def names(self) -> list[str]:
+        return [channel.name for channel in self.channels]
+
+    def channel(self, key: str | int) -> AnalogChannel:
+        """
+        Look up a channel by its name in _CHROMS.INF, ignoring case if there
+        is no exact match, or by its number.
+
+        Raises:
+            ChannelError: If there is no such channel.
+        """
+        if isinstance(key, int):
+            matches = [c for c in self.channels if c.number == key]
+        else:
+            matches = [c for c in self.channels if c.name == key] or [
+                c for c in self.channels if c.name.lower() == key.strip().lower()
+            ]
+        if not matches:
+            available = ", ".join(repr(name) for name in self.names) or "none"
+            raise ChannelError(
+                f"No channel {key!r} in {self.raw_dir} (available: {available})"
+            )
+        return matches[0]
+
+    def samples(self, key: str | int) -> np.ndarray | None:
+        """
+        The memory-mapped samples of a channel, or None if it is empty.
+        """
+        channel = self.channel(key)
+        with self._lock:
+            if channel.number not in self._samples:
+                self._samples[channel.number] = read_chrodat(channel.path)
+            return self._samples[channel.number]
+
+    def window(
+        self, key: str | int, start: float | None = None, end: float | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The samples of a channel between two retention times.
+
+        Args:
+            key: Channel name or number.
+            start: Start time in minutes, inclusive; None for the beginning.
+            end: End time in minutes, inclusive; None for the end.
+
+        Returns:
+            Read-only arrays of times (minutes) and intensities.
+
+        Raises:
+            ChannelError: If there is no such channel.
+        """
+        number = self.channel(key).number
+        cache_key = (number, start, end)
+        with self._lock:
+            if cache_key in self._windows:
+                self._windows.move_to_end(cache_key)
+                return self._windows[cache_key]
+
+        samples = self.samples(number)
+        if samples is None:
+            times = np.empty(0, np.float32)
+            intensities = np.empty(0, np.float32)
+        else:
+            column = samples["time"]
+            # Compared at the precision the times are stored at, so a bound
+            # written as 4.2 includes the sample stored as float32(4.2)
+            lo, hi = 0, len(column)
+            if start is not None:
+                lo = int(np.searchsorted(column, column.dtype.type(start), "left"))
+            if end is not None:
+                hi = int(np.searchsorted(column, column.dtype.type(end), "right"))
+            selected = np.array(samples[lo : max(lo, hi)])
+            times, intensities = selected["time"], selected["intensity"]
+        times.flags.writeable = False
+        intensities.flags.writeable = False
+
+        result = (times, intensities)
+        with self._lock:
+            self._windows[cache_key] = result
+            while len(self._windows) > WINDOW_CACHE_SIZE:
+                self._windows.popitem(last=False)
+        return result
+
+
+@functools.lru_cache(maxsize=STORE_CACHE_SIZE)
+def _cached_store(path: str, mtime_ns: int) -> ChannelStore:
+    return ChannelStore(path)
+
+
+def channel_store(raw_dir: str | os.PathLike) -> ChannelStore:
+    """
+    Return the shared ChannelStore of a Waters .raw directory, so windows
+    queried by different callers are cached once. Like
+    waters.raw_directory, a change to the directory gives a fresh store.
+    """
+    path = os.path.abspath(raw_dir)
+    return _cached_store(path, os.stat(path).st_mtime_ns)
+
+
+def read_windows(
+    raw_dirs: list[str],
+    key: str | int,
+    start: float | None = None,
+    end: float | None = None,
+    workers: int = 8,
+) -> list[tuple[np.ndarray, np.ndarray] | None]:
+    """
+    Read the same channel window from many runs in parallel.
+
+    Args:
+        raw_dirs: Paths to .raw directories.
+        key: Channel name or number.
+        start: Start time in minutes; None for the beginning.
+        end: End time in minutes; None for the end.
+        workers: Number of threads; the work is file system bound.
+
+    Returns:
+        One (times, intensities) per run, in order, or None for a run that
+        lacks the channel or cannot be read.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read(raw_dir: str) -> tuple[np.ndarray, np.ndarray] | None:
+        try:
+            return channel_store(raw_dir).window(key, start, end)
+        except (ChannelError, OSError) as e:
+            logger.warning(f"Skipping {raw_dir}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(read, raw_dirs))
+
+
+def channel_kind(unit: str) -> tuple[str, str]:
+    """
+    The chromatogram type and value array accessions for a channel unit.
+    """
+    unit = unit.strip().lower()
+    if unit in PRESSURE_UNITS:
+        return mzml.PRESSURE_CHROMATOGRAM, mzml.PRESSURE_ARRAY
+    if unit.endswith("/min"):
+        return mzml.FLOW_RATE_CHROMATOGRAM, mzml.FLOW_RATE_ARRAY
+    if unit in ABSORBANCE_UNITS:
+        return mzml.ABSORPTION_CHROMATOGRAM, mzml.INTENSITY_ARRAY
+    return mzml.CHROMATOGRAM_TYPE, mzml.INTENSITY_ARRAY
+
+
+def analog_chromatograms(raw_dir: str, chrom_info: list) -> list[mzml.Chromatogram]:
+    """
+    Read the analog channels of a Waters .raw directory as mzML
+    chromatograms, with times in seconds. Empty channels are skipped and
+    duplicate channel names are numbered.
+    """
+    chromatograms = []
+    ids: set[str] = set()
+    for channel in analog_channels(raw_dir, chrom_info):
+        samples = read_chrodat(channel.path)
+        if samples is None:
+            continue
+        chrom_id = channel.name
+        if chrom_id in ids or chrom_id == "TIC":
+            chrom_id = f"{channel.name} ({channel.number})"
+        ids.add(chrom_id)
+        kind, array = channel_kind(channel.unit)
+        chromatograms.append(
+            mzml.Chromatogram(
+                chrom_id,
+                samples["time"].astype(np.float64) * 60,
+                samples["intensity"],
+                kind,
+                array,
+                channel.unit,
+            )
+        )
+    return chromatograms
+
+
+def embed_analog_channels(
+    mzml_path: str,
+    raw_dir: str,
+    chrom_info: list | None = None,
+    output_path: str | None = None,
+    workers: int = mzml.DEFAULT_WORKERS,
+) -> int:
+    """
+    Add the analog channels of a Waters run to the chromatogram list of its
+    mzML file, so no CSV files are needed next to it.
+
+    The mzML file is copied once, with its index and checksum regenerated.
+
+    Args:
+        mzml_path: Path to the mzML file converted from raw_dir.
+        raw_dir: Path to the Waters .raw directory.
+        chrom_info: Channel metadata, read from raw_dir by default.
+        output_path: Output path; by default mzml_path is replaced.
+        workers: Number of worker threads.
+
+    Returns:
+        Number of chromatograms added.
+    """
+    if chrom_info is None:
+        chrom_info = raw_directory(raw_dir).chromatogram_info
+    chromatograms = analog_chromatograms(raw_dir, chrom_info)
+    if not chromatograms:
+        return 0
+    target = output_path or mzml_path
+    base, ext = compression.splitext(target)
+    tmp_path = f"{base}.{os.getpid()}.tmp{ext}"
+    try:
+        mzml.rewrite_spectra(
+            mzml_path,
+            tmp_path,
+            lambda spectrum: spectrum,
+            decode=False,
+            workers=workers,
+            chromatograms=chromatograms,
+        )
+        os.replace(tmp_path, target)
+        if os.path.exists(compression.index_path(tmp_path)):
+            os.replace(compression.index_path(tmp_path), compression.index_path(target))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(chromatograms)
@@ -0,0 +1,379 @@
+"""
+Manifest-driven batch conversion split into shards.
+
+A manifest lists one input per line. Every array task of a cluster job reads
+the same manifest and independently computes the same size-balanced
+assignment of inputs to shards, so tasks need no coordinator: each converts
+its own shard and appends one JSON record per input to its own ledger, and
+merging the ledgers afterwards shows what succeeded, failed or never ran.
+Given earlier ledgers as history, inputs are balanced by their predicted
+run time instead of their size (see costs). Planning a manifest once with
+plan_manifest records the size and function count of every input in it, so
+that no task has to inspect every input to balance the shards.
+"""
+
+import glob
+import json
+import os
+import re
+import socket
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from loguru import logger
+
+from . import RawFileConversionError, costs
+from .staging import StagingArea, disk_usage, staged_inputs
+
+SHARD_RE = re.compile(r"^(\d+)/(\d+)$")
+
+
+class BatchError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    path: str
+    size: int
+    functions: int | None = None
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """
+    Parse a shard given as "i/N" (0 <= i < N), or "slurm" to take it from
+    the SLURM array task environment.
+    """
+    if value == "slurm":
+        try:
+            task = int(os.environ["SLURM_ARRAY_TASK_ID"])
+            first = int(os.environ.get("SLURM_ARRAY_TASK_MIN", "0"))
+            count = int(os.environ["SLURM_ARRAY_TASK_COUNT"])
+        except (KeyError, ValueError):
+            raise BatchError("Not running in a SLURM array job")
+        return task - first, count
+    match = SHARD_RE.match(value)
+    if not match:
+        raise BatchError(f"Invalid shard {value!r}, expected i/N")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 0 <= index < count:
+        raise BatchError(f"Shard index {index} is not in 0..{count - 1}")
+    return index, count
+
+
+def read_manifest(path: str) -> list[ManifestEntry]:
+    """
+    Read a manifest.
+
+    Each non-empty line not starting with # holds an input path, optionally
+    followed by a tab and its size in bytes, which saves every task from
+    measuring directory inputs, and another tab and its function count (see
+    plan_manifest). Relative paths are relative to the manifest. Duplicate
+    inputs are listed once.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    seen = set()
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, _, rest = line.partition("\t")
+            size, _, functions = rest.partition("\t")
+            infile = os.path.normpath(os.path.join(base, name.strip()))
+            if infile in seen:
+                continue
+            seen.add(infile)
+            try:
+                entries.append(
+                    ManifestEntry(
+                        infile,
+                        int(size) if size.strip() else disk_usage(infile),
+                        int(functions) if functions.strip() else None,
+                    )
+                )
+            except ValueError:
+                raise BatchError(f"{path}:{number}: invalid size {rest!r}")
+    return entries
+
+
+def balance(weights: list[float], count: int) -> list[list[int]]:
+    """
+    Assign items to count bins, heaviest first, each to the lightest bin
+    (longest processing time first). Ties are broken by item and bin
+    position, so the result depends only on the inputs.
+
+    Returns:
+        The item indices of each bin.
+    """
+    bins: list[list[int]] = [[] for _ in range(count)]
+    loads = [0.0] * count
+    for item in sorted(range(len(weights)), key=lambda i: (-weights[i], i)):
+        target = min(range(count), key=lambda b: (loads[b], b))
+        bins[target].append(item)
+        loads[target] += weights[item]
+    return bins
+
+
+def shard_entries(
+    entries: list[ManifestEntry],
+    index: int,
+    count: int,
+    weights: dict[str, float] | None = None,
+) -> list[ManifestEntry]:
+    """
+    The entries of one shard, balanced by size, in manifest order. With
+    weights (e.g. predicted seconds) by input path, they are balanced by
+    weight instead and returned heaviest first, so the longest jobs do not
+    start last.
+    """
+    ordered = sorted(entries, key=lambda e: e.path)
+    if weights is None:
+        items = balance([e.size for e in ordered], count)[index]
+        chosen = {ordered[i].path for i in items}
+        return [e for e in entries if e.path in chosen]
+    items = balance([weights[e.path] for e in ordered], count)[index]
+    return [ordered[i] for i in items]
+
+
+def describe_entries(
+    entries: list[ManifestEntry], filters: str = "", inspect: bool = True
+) -> dict[str, costs.Job]:
+    """
+    The cost features of entries. A function count missing from the
+    manifest is read from the input, or taken as 1 unless inspect is set.
+    """
+    return {
+        e.path: costs.describe(
+            e.path,
+            e.size,
+            filters,
+            e.functions if e.functions is not None or inspect else 1,
+        )
+        for e in entries
+    }
+
+
+def plan_manifest(manifest: str, output: str | None = None) -> list[ManifestEntry]:
+    """
+    Record the size and function count of every input in a manifest, once
+    before its tasks run, so that no task has to inspect every input to
+    balance the shards by predicted run time.
+
+    Args:
+        manifest: Path to the manifest.
+        output: Path of the planned manifest, the manifest itself by default.
+
+    Returns:
+        The planned entries.
+    """
+    jobs = describe_entries(read_manifest(manifest))
+    entries = [ManifestEntry(j.path, j.size, j.functions) for j in jobs.values()]
+    output = output or manifest
+    tmp = f"{output}.tmp"
+    with open(tmp, "w") as f:
+        f.writelines(f"{e.path}\t{e.size}\t{e.functions}\n" for e in entries)
+    os.replace(tmp, output)
+    logger.info(f"Planned {len(entries)} input(s) in {output}")
+    return entries
+
+
+def estimate_batch(
+    manifest: str, count: int, model: costs.CostModel, filters: str = ""
+) -> costs.Estimate:
+    """
+    Estimate the wall time, total time and output size of converting a
+    manifest in count shards, as balanced by run_shard.
+    """
+    entries = sorted(read_manifest(manifest), key=lambda e: e.path)
+    jobs = describe_entries(entries, filters, inspect=False)
+    weights = [model.seconds(jobs[e.path]) for e in entries]
+    return costs.estimate(
+        [jobs[e.path] for e in entries], model, balance(weights, count)
+    )
+
+
+def ledger_path(
+    manifest: str, index: int, count: int, ledger_dir: str | None = None
+) -> str:
+    stem = os.path.splitext(os.path.basename(manifest))[0]
+    directory = ledger_dir or os.path.dirname(os.path.abspath(manifest))
+    return os.path.join(directory, f"{stem}.shard-{index}-of-{count}.jsonl")
+
+
+def read_ledger(path: str) -> list[dict]:
+    """
+    Read the records of a ledger, ignoring a truncated last line left by a
+    killed task.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring a malformed record in {path}")
+    return records
+
+
+def append_record(path: str, record: dict) -> None:
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def run_shard(
+    manifest: str,
+    index: int,
+    count: int,
+    convert: Callable[[str], list[str]],
+    ledger_dir: str | None = None,
+    force: bool = False,
+    model: costs.CostModel | None = None,
+    filters: str = "",
+    area: StagingArea | None = None,
+) -> list[dict]:
+    """
+    Convert the inputs of one shard and record each outcome in its ledger.
+
+    Inputs that the ledger already records as done are skipped unless force
+    is set, so a failed task can simply be run again.
+
+    Args:
+        manifest: Path to the manifest.
+        index: Shard index, 0 <= index < count.
+        count: Number of shards.
+        convert: Converts one input and returns its output paths; raises on
+            failure.
+        ledger_dir: Directory of the ledgers, the manifest's by default.
+        force: Convert inputs that are already done.
+        model: Cost model to balance the shards by predicted run time; it
+            must be the same for every shard, so fit it from ledgers that
+            are not being written to. Only the function counts in the
+            manifest are used for balancing, so plan it first (see
+            plan_manifest) rather than have every task inspect every input.
+        filters: The conversion options, recorded for the cost model.
+        area: Staging area to prefetch the next input into while the
+            current one converts; convert should stage through the same
+            area, which then returns the prefetched copy.
+
+    Returns:
+        The records written by this run.
+    """
+    entries = read_manifest(manifest)
+    if model is None:
+        entries = shard_entries(entries, index, count)
+    else:
+        balancing = describe_entries(entries, filters, inspect=False)
+        weights = {path: model.seconds(job) for path, job in balancing.items()}
+        entries = shard_entries(entries, index, count, weights)
+        logger.info(
+            f"Shard {index}/{count}: about "
+            f"{sum(weights[e.path] for e in entries) / 3600:.1f} h predicted"
+        )
+    # The ledger records exact features, of this shard's inputs only
+    jobs = describe_entries(entries, filters)
+    ledger = ledger_path(manifest, index, count, ledger_dir)
+    done = set()
+    if os.path.exists(ledger) and not force:
+        done = {r["input"] for r in read_ledger(ledger) if r["status"] == "done"}
+    logger.info(
+        f"Shard {index}/{count}: {len(entries)} input(s), "
+        f"{sum(e.path in done for e in entries)} already done"
+    )
+    records = []
+    todo = {e.path: e for e in entries if e.path not in done}
+    for path, _local in staged_inputs(area, todo):
+        entry = todo[path]
+        started = time.monotonic()
+        record: dict[str, Any] = {
+            "input": entry.path,
+            "size": entry.size,
+            "shard": index,
+            "shards": count,
+            "host": socket.gethostname(),
+        }
+        error: Exception | None = None
+        try:
+            record["outputs"] = convert(entry.path)
+        except (RawFileConversionError, OSError) as e:
+            logger.error(f"Failed to convert {entry.path}: {e}")
+            error = e
+        # Anything else is a bug; log its traceback and go on with the shard
+        except Exception as e:  # noqa: BLE001
+            logger.exception(f"Failed to convert {entry.path}: {e}")
+            error = e
+        if error is None:
+            record["status"] = "done"
+        else:
+            record["status"] = "failed"
+            record["error"] = str(error) or type(error).__name__
+        record.update(
+            costs.record_features(jobs[entry.path], record.get("outputs", []))
+        )
+        record["seconds"] = round(time.monotonic() - started, 3)
+        record["finished"] = time.time()
+        append_record(ledger, record)
+        records.append(record)
+    return records
+
+
+@dataclass
+class MergeResult:
+    records: list[dict]
+    missing: list[str]
+
+    @property
+    def failed(self) -> list[dict]:
+        return [r for r in self.records if r["status"] != "done"]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing and not self.failed
+
+
+def merge_ledgers(
+    manifest: str, ledger_dir: str | None = None, output: str | None = None
+) -> MergeResult:
+    """
+    Combine the shard ledgers of a manifest.
+
+    The latest record of each input wins, so retried inputs count once.
+    Ledgers of runs with a different shard count are included as well.
+
+    Args:
+        manifest: Path to the manifest.
+        ledger_dir: Directory of the ledgers, the manifest's by default.
+        output: Where to write the merged ledger, {manifest}.ledger.jsonl
+            next to the shard ledgers by default.
+
+    Returns:
+        The merged records in manifest order and the inputs without one.
+    """
+    entries = read_manifest(manifest)
+    pattern = ledger_path(manifest, 0, 1, ledger_dir).replace(
+        ".shard-0-of-1.", ".shard-*-of-*."
+    )
+    latest: dict[str, dict] = {}
+    for path in sorted(glob.glob(pattern)):
+        for record in read_ledger(path):
+            current = latest.get(record["input"])
+            if current is None or record["finished"] >= current["finished"]:
+                latest[record["input"]] = record
+    records = [latest[e.path] for e in entries if e.path in latest]
+    missing = [e.path for e in entries if e.path not in latest]
+    if output is None:
+        output = pattern.replace(".shard-*-of-*.", ".ledger.")
+    with open(output, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    result = MergeResult(records, missing)
+    logger.info(
+        f"Merged {len(records)} record(s) into {output}: "
+        f"{len(result.failed)} failed, {len(missing)} missing"
+    )
+    return result
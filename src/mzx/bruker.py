@@ -0,0 +1,203 @@
+"""
+Frame-level traces straight from Bruker timsTOF analysis.tdf files.
+
+A timsTOF .d directory holds an SQLite database, analysis.tdf, whose Frames
+table already records the retention time, MS type and summed and maximum
+intensity of every frame. For a TIC or base peak trace that table is all
+that is needed, so it is read with one query instead of converting the run
+with msconvert, which takes minutes under Wine.
+"""
+
+import os
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from . import write_chrom_csv, write_tic_csv
+
+TDF_NAME = "analysis.tdf"
+# Frames.MsMsType of MS1 frames; PASEF MS/MS frames are 8 (DDA) and 9 (DIA)
+MS1_TYPE = 0
+
+FRAMES_QUERY = """
+SELECT Id, Time, MsMsType, SummedIntensities, MaxIntensity, NumScans, NumPeaks
+FROM Frames ORDER BY Id
+"""
+FRAME_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("time", "<f8"),
+        ("ms_type", "<i4"),
+        ("summed_intensity", "<f8"),
+        ("max_intensity", "<f8"),
+        ("num_scans", "<i4"),
+        ("num_peaks", "<i8"),
+    ]
+)
+
+
+class TdfError(Exception):
+    pass
+
+
+def tdf_path(d_dir: str) -> str | None:
+    """
+    The analysis.tdf of a .d directory, or None if it is not a timsTOF run.
+    """
+    path = os.path.join(d_dir, TDF_NAME)
+    return path if os.path.isfile(path) else None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open an analysis.tdf read-only, so a run on a read-only share or still
+    open in the acquisition software is never locked or modified.
+    """
+    uri = Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+
+@dataclass
+class Frames:
+    """
+    The frame table of a timsTOF run, one array element per frame, with
+    times in seconds.
+    """
+
+    path: str
+    data: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.data["time"]
+
+    @property
+    def ms1(self) -> np.ndarray:
+        """
+        Mask of the MS1 frames.
+        """
+        return self.data["ms_type"] == MS1_TYPE
+
+    def tic(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Times and summed intensities of the MS1 frames.
+        """
+        ms1 = self.data[self.ms1]
+        return ms1["time"], ms1["summed_intensity"]
+
+    def bpc(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Times and maximum intensities of the MS1 frames.
+        """
+        ms1 = self.data[self.ms1]
+        return ms1["time"], ms1["max_intensity"]
+
+
+def read_frames(d_dir: str) -> Frames:
+    """
+    Read the frame table of a timsTOF .d directory.
+
+    Args:
+        d_dir: Path to the .d directory, or to its analysis.tdf.
+
+    Returns:
+        The frames, in acquisition order.
+
+    Raises:
+        TdfError: If there is no readable analysis.tdf.
+    """
+    path = d_dir if os.path.isfile(d_dir) else tdf_path(d_dir)
+    if path is None:
+        raise TdfError(f"No {TDF_NAME} in {d_dir}")
+    try:
+        db = connect(path)
+        try:
+            rows = db.execute(FRAMES_QUERY).fetchall()
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        raise TdfError(f"Cannot read frames from {path}: {e}") from e
+    return Frames(path, np.array(rows, dtype=FRAME_DTYPE))
+
+
+def read_metadata(d_dir: str) -> dict[str, str]:
+    """
+    The GlobalMetadata key/value table of a timsTOF run, e.g.
+    AcquisitionDateTime and InstrumentName.
+
+    Raises:
+        TdfError: If there is no readable analysis.tdf.
+    """
+    path = tdf_path(d_dir)
+    if path is None:
+        raise TdfError(f"No {TDF_NAME} in {d_dir}")
+    try:
+        db = connect(path)
+        try:
+            return dict(db.execute("SELECT Key, Value FROM GlobalMetadata"))
+        finally:
+            db.close()
+    except sqlite3.Error as e:
+        raise TdfError(f"Cannot read metadata from {path}: {e}") from e
+
+
+def export_chromatograms(
+    d_dir: str,
+    decimation: str | None = None,
+    decimation_points: int = 2000,
+    full_resolution: bool = True,
+) -> list[str]:
+    """
+    Export the MS1 TIC and base peak chromatogram of a timsTOF run to CSV.
+
+    The files are written next to the .d directory as {name}_TIC.csv, the
+    same file extract_tic_from_mzml writes for the converted mzML, and
+    {name}_BPC.csv.
+
+    Args:
+        d_dir: Path to the .d directory.
+        decimation: Optional downsampling method, "lttb" or "minmax".
+        decimation_points: Target number of points per downsampled trace.
+        full_resolution: Whether to write the full-resolution CSVs.
+
+    Returns:
+        List of output CSV file paths.
+
+    Raises:
+        TdfError: If there is no readable analysis.tdf.
+    """
+    frames = read_frames(d_dir)
+    base = os.path.splitext(os.path.abspath(d_dir).rstrip(os.sep))[0]
+    times, tics = frames.tic()
+    outputs = [
+        write_tic_csv(
+            times,
+            tics,
+            f"{base}_TIC.csv",
+            decimation,
+            decimation_points,
+            full_resolution,
+        )
+    ]
+    times, peaks = frames.bpc()
+    bpc_csv = f"{base}_BPC.csv"
+    if full_resolution:
+        write_chrom_csv(bpc_csv, times, peaks)
+        outputs.append(bpc_csv)
+    if decimation is not None:
+        from . import decimate
+
+        decimated_csv = f"{base}_BPC_{decimation}.csv"
+        d_times, d_peaks = decimate.decimate(
+            times, peaks, decimation_points, decimation
+        )
+        write_chrom_csv(decimated_csv, d_times, d_peaks)
+        outputs.append(decimated_csv)
+    logger.info(f"Exported TIC and BPC of {len(times)} MS1 frames from {d_dir}")
+    return outputs
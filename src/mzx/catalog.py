@@ -0,0 +1,326 @@
+"""
+SQLite catalog of the spectra of converted runs.
+
+Every spectrum of an indexed run is recorded with its run, native id, scan
+numbers, retention time, MS level, precursor, TIC and byte offset, so
+questions across many runs ("which runs have an MS2 of precursor 785.84
++/- 10 ppm between 20 and 25 min") are answered from the catalog indexes,
+and matching spectra are read directly at their offset.
+"""
+
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from . import compression, mzml
+
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    spectra INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spectra (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    native_id TEXT NOT NULL,
+    scan INTEGER,
+    fscan INTEGER,
+    rt REAL,
+    ms_level INTEGER,
+    precursor_mz REAL,
+    charge INTEGER,
+    tic REAL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (run_id, idx)
+);
+CREATE INDEX IF NOT EXISTS spectra_precursor ON spectra (precursor_mz, rt);
+CREATE INDEX IF NOT EXISTS spectra_rt ON spectra (ms_level, rt);
+CREATE INDEX IF NOT EXISTS spectra_scan ON spectra (run_id, scan);
+"""
+
+# scan and fscan as written by msconvert and modify_waters_scan_header
+SCAN_RE = re.compile(r"(?<![A-Za-z])scan=(\d+)")
+FSCAN_RE = re.compile(r"\bfscan=(\d+)")
+
+# Rows inserted per executemany call
+INSERT_BATCH = 5000
+
+
+class CatalogError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """
+    A spectrum recorded in the catalog. rt is in seconds.
+    """
+
+    path: str
+    index: int
+    native_id: str
+    scan: int | None
+    fscan: int | None
+    rt: float | None
+    ms_level: int | None
+    precursor_mz: float | None
+    charge: int | None
+    tic: float | None
+    offset: int
+
+
+def scan_numbers(native_id: str) -> tuple[int | None, int | None]:
+    """
+    Extract the scan and fscan numbers from a native spectrum id.
+    """
+    scan = SCAN_RE.search(native_id)
+    fscan = FSCAN_RE.search(native_id)
+    return (
+        int(scan.group(1)) if scan else None,
+        int(fscan.group(1)) if fscan else None,
+    )
+
+
+def _row(run_id: int, spectrum: mzml.Spectrum) -> tuple:
+    scan, fscan = scan_numbers(spectrum.id)
+    return (
+        run_id,
+        spectrum.index,
+        spectrum.id,
+        scan,
+        fscan,
+        spectrum.rt,
+        spectrum.ms_level,
+        spectrum.precursor_mz,
+        spectrum.charge,
+        spectrum.tic,
+        spectrum.offset,
+    )
+
+
+class Catalog:
+    """
+    A spectrum catalog stored in one SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Not shared, but handed over: a followed run is recorded on the
+        # follower thread and committed by the converting one after it ended
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        # Keeps the planner statistics current so it picks the precursor index
+        self.db.execute("PRAGMA optimize")
+        self.db.close()
+
+    def __enter__(self) -> "Self":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def add_run(
+        self, mzml_path: str, force: bool = False, workers: int = mzml.DEFAULT_WORKERS
+    ) -> int:
+        """
+        Record the spectra of an mzML file, replacing an earlier entry for
+        the same path. Unchanged files (same size and modification time)
+        are skipped unless force is set.
+
+        Returns:
+            Number of spectra recorded, 0 if the run was skipped.
+        """
+        path = os.path.abspath(mzml_path)
+        stat = os.stat(path)
+        row = self.db.execute(
+            "SELECT size, mtime FROM runs WHERE path = ?", (path,)
+        ).fetchone()
+        if (
+            row is not None
+            and not force
+            and tuple(row) == (stat.st_size, stat.st_mtime)
+        ):
+            logger.info(f"Catalog is up to date for {path}")
+            return 0
+
+        with self.db:
+            writer = RunWriter(self, path)
+            for spectrum in mzml.iter_spectra(path, decode=False, workers=workers):
+                writer.add(spectrum)
+            return writer.finish()
+
+    def run_writer(self, mzml_path: str) -> "RunWriter":
+        """
+        Start recording the spectra of an mzML file one at a time, e.g. while
+        it is still being written. Commit after RunWriter.finish.
+        """
+        return RunWriter(self, os.path.abspath(mzml_path))
+
+    def _insert(self, rows: list[tuple]) -> None:
+        self.db.executemany(
+            "INSERT INTO spectra VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def remove_run(self, mzml_path: str) -> None:
+        with self.db:
+            self.db.execute(
+                "DELETE FROM runs WHERE path = ?", (os.path.abspath(mzml_path),)
+            )
+
+    def runs(self) -> list[str]:
+        return [r[0] for r in self.db.execute("SELECT path FROM runs ORDER BY path")]
+
+    def query(
+        self,
+        precursor_mz: float | None = None,
+        ppm: float = 10.0,
+        rt_range: tuple[float, float] | None = None,
+        ms_level: int | None = None,
+        charge: int | None = None,
+        run: str | None = None,
+        limit: int | None = None,
+    ) -> list[CatalogEntry]:
+        """
+        Find spectra in the catalog.
+
+        Args:
+            precursor_mz: Precursor m/z to match within ppm.
+            ppm: Precursor tolerance in parts per million.
+            rt_range: (start, end) retention time window in seconds.
+            ms_level: MS level of the spectra.
+            charge: Precursor charge.
+            run: Run name or path.
+            limit: Maximum number of results.
+
+        Returns:
+            Matching spectra ordered by run and retention time.
+        """
+        where = []
+        args: list = []
+        if ms_level is not None:
+            where.append("s.ms_level = ?")
+            args.append(ms_level)
+        if precursor_mz is not None:
+            tolerance = precursor_mz * ppm * 1e-6
+            where.append("s.precursor_mz BETWEEN ? AND ?")
+            args += [precursor_mz - tolerance, precursor_mz + tolerance]
+        if rt_range is not None:
+            where.append("s.rt BETWEEN ? AND ?")
+            args += list(rt_range)
+        if charge is not None:
+            where.append("s.charge = ?")
+            args.append(charge)
+        if run is not None:
+            where.append("(r.name = ? OR r.path = ?)")
+            args += [run, os.path.abspath(run)]
+
+        sql = (
+            "SELECT r.path, s.idx, s.native_id, s.scan, s.fscan, s.rt, s.ms_level, "
+            "s.precursor_mz, s.charge, s.tic, s.offset "
+            "FROM spectra s JOIN runs r ON r.id = s.run_id"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.path, s.rt"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return [CatalogEntry(*row) for row in self.db.execute(sql, args)]
+
+
+def open_spectrum(entry: CatalogEntry, decode: bool = True) -> mzml.Spectrum:
+    """
+    Read a cataloged spectrum from its mzML file by byte offset.
+
+    Raises:
+        CatalogError: If the file changed since it was cataloged.
+    """
+    try:
+        spectrum = mzml.read_spectrum(entry.path, entry.offset, decode=decode)
+    except (OSError, ValueError) as e:
+        raise CatalogError(f"Cannot read {entry.native_id} from {entry.path}: {e}")
+    if spectrum.id != entry.native_id:
+        raise CatalogError(f"Catalog is out of date for {entry.path}")
+    return spectrum
+
+
+class RunWriter:
+    """
+    Records the spectra of one run as they are read. The size and
+    modification time of the file are taken by finish, so the file may grow
+    until then.
+    """
+
+    def __init__(self, catalog: Catalog, path: str):
+        self.catalog = catalog
+        self.path = path
+        self.count = 0
+        self.batch: list[tuple] = []
+        db = catalog.db
+        db.execute("DELETE FROM runs WHERE path = ?", (path,))
+        cursor = db.execute(
+            "INSERT INTO runs (path, name, size, mtime, spectra, indexed_at) "
+            "VALUES (?, ?, 0, 0, 0, ?)",
+            (path, compression.splitext(os.path.basename(path))[0], time.time()),
+        )
+        assert cursor.lastrowid is not None
+        self.run_id = cursor.lastrowid
+
+    def add(self, spectrum: mzml.Spectrum) -> None:
+        self.batch.append(_row(self.run_id, spectrum))
+        if len(self.batch) >= INSERT_BATCH:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.catalog._insert(self.batch)
+        self.count += len(self.batch)
+        self.batch = []
+
+    def finish(self, path: str | None = None) -> int:
+        """
+        Record the last spectra and the file's size and modification time.
+
+        Args:
+            path: Where the file is now, if it was moved since reading, e.g.
+                from a scratch directory.
+
+        Returns:
+            Number of spectra recorded.
+        """
+        self._flush()
+        db = self.catalog.db
+        if path is not None and os.path.abspath(path) != self.path:
+            self.path = os.path.abspath(path)
+            db.execute("DELETE FROM runs WHERE path = ?", (self.path,))
+            db.execute(
+                "UPDATE runs SET path = ?, name = ? WHERE id = ?",
+                (
+                    self.path,
+                    compression.splitext(os.path.basename(self.path))[0],
+                    self.run_id,
+                ),
+            )
+        stat = os.stat(self.path)
+        db.execute(
+            "UPDATE runs SET size = ?, mtime = ?, spectra = ? WHERE id = ?",
+            (stat.st_size, stat.st_mtime, self.count, self.run_id),
+        )
+        logger.info(f"Cataloged {self.count} spectra of {self.path}")
+        return self.count
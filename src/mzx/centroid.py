@@ -0,0 +1,135 @@
+"""
+Centroiding of profile-mode spectra in mzML files.
+
+Peaks are the local maxima of each profile spectrum. The apex of every peak
+is refined by fitting a Gaussian through the maximum and its two neighbours
+(a parabola through the log intensities), which is done for all peaks of a
+spectrum at once with array operations.
+"""
+
+import numpy as np
+from loguru import logger
+
+from . import compression, mzml
+
+# MS levels (min, max) covered by each --peak_picking value, max None = any
+PEAK_PICKING_LEVELS: dict[str, tuple[int, int | None]] = {
+    "all": (1, None),
+    "ms1": (1, 1),
+    "msms": (2, None),
+}
+
+
+def estimate_noise(intensity: np.ndarray) -> float:
+    """
+    Estimate the noise level of a spectrum as the median of its non-zero
+    intensities.
+    """
+    positive = intensity[intensity > 0]
+    return float(np.median(positive)) if len(positive) else 0.0
+
+
+def centroid(
+    mz: np.ndarray, intensity: np.ndarray, snr: float | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Centroid one profile spectrum.
+
+    Args:
+        mz: Profile m/z values, ascending.
+        intensity: Profile intensities.
+        snr: If given, drop peaks whose apex is below snr times the noise
+            level from estimate_noise.
+
+    Returns:
+        Tuple of (m/z, intensity) arrays of the peak apexes.
+    """
+    mz = np.asarray(mz, dtype=np.float64)
+    y = np.asarray(intensity, dtype=np.float64)
+    if len(y) == 0:
+        return mz, y
+
+    padded = np.concatenate(([0.0], y, [0.0]))
+    left, center, right = padded[:-2], padded[1:-1], padded[2:]
+    peaks = np.flatnonzero((center > left) & (center >= right) & (center > 0))
+
+    apex_mz = mz[peaks]
+    apex = y[peaks]
+    # Gaussian fit needs both neighbours inside the spectrum and non-zero
+    fit = (peaks > 0) & (peaks < len(y) - 1)
+    fit[fit] &= (left[peaks[fit]] > 0) & (right[peaks[fit]] > 0)
+    i = peaks[fit]
+    if len(i):
+        la, lb, lc = np.log(y[i - 1]), np.log(y[i]), np.log(y[i + 1])
+        denom = la - 2.0 * lb + lc
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = np.where(denom < 0, 0.5 * (la - lc) / denom, 0.0)
+        delta = np.clip(delta, -0.5, 0.5)
+        spacing = np.where(delta >= 0, mz[i + 1] - mz[i], mz[i] - mz[i - 1])
+        apex_mz[fit] = mz[i] + delta * spacing
+        apex[fit] = np.exp(lb - 0.25 * (la - lc) * delta)
+
+    if snr is not None:
+        keep = apex >= snr * estimate_noise(y)
+        apex_mz, apex = apex_mz[keep], apex[keep]
+    return apex_mz, apex
+
+
+def centroid_spectrum(
+    spectrum: mzml.Spectrum,
+    levels: tuple[int, int | None] = PEAK_PICKING_LEVELS["all"],
+    snr: float | None = None,
+) -> mzml.Spectrum:
+    """
+    Centroid a spectrum read with decode=False, if it is a profile spectrum
+    within levels. Other spectra are returned untouched.
+    """
+    low, high = levels
+    ms_level = spectrum.ms_level or 1
+    if spectrum.centroided or ms_level < low or (high is not None and ms_level > high):
+        return spectrum
+    mzml.decode_spectrum(spectrum)
+    if spectrum.mz is None or spectrum.intensity is None:
+        return spectrum
+    spectrum.mz, spectrum.intensity = centroid(spectrum.mz, spectrum.intensity, snr=snr)
+    spectrum.centroided = True
+    return spectrum
+
+
+def centroid_mzml(
+    mzml_path: str,
+    output_path: str | None = None,
+    peak_picking: str = "all",
+    snr: float | None = None,
+    workers: int = mzml.DEFAULT_WORKERS,
+) -> str:
+    """
+    Write a centroided copy of a profile-mode mzML file.
+
+    Args:
+        mzml_path: Path to the profile mzML file.
+        output_path: Output path. Defaults to {mzml_base}_centroid.mzML, or
+            .mzML.gz for compressed input; .gz paths are written compressed.
+        peak_picking: MS levels to centroid: "all", "ms1" or "msms".
+        snr: Minimum signal-to-noise ratio of the kept peaks.
+        workers: Number of worker threads.
+
+    Returns:
+        Path to the centroided mzML file.
+    """
+    if peak_picking not in PEAK_PICKING_LEVELS:
+        raise ValueError(f"Unknown peak picking mode: {peak_picking}")
+    if output_path is None:
+        base, ext = compression.splitext(mzml_path)
+        output_path = f"{base}_centroid{ext}"
+    levels = PEAK_PICKING_LEVELS[peak_picking]
+
+    count = mzml.rewrite_spectra(
+        mzml_path,
+        output_path,
+        lambda spectrum: centroid_spectrum(spectrum, levels, snr),
+        decode=False,
+        workers=workers,
+    )
+    logger.info(f"Centroided mzML: {output_path} ({count} spectra)")
+    return output_path
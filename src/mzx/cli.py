@@ -1,23 +1,558 @@
 import argparse
+import json
 import os
+import sys
+from typing import cast
 
 from . import (
+    RawFileConversionError,
     convert_raw_file,
     export_chromatograms,
     extract_tic_from_mzml,
     get_chromatogram_info,
+    msconvert_output_path,
     types,
     vendor,
 )
 from loguru import logger
 
+# Feature modules are imported by the commands that use them, keeping
+# start-up fast for plain conversions and --help.
+
+
+def consolidate_main(argv):
+    from . import consolidate
+
+    parser = argparse.ArgumentParser(
+        prog="mzx consolidate",
+        description="Combine the chromatograms of many runs into one dataset "
+        "on a common time grid.",
+    )
+    parser.add_argument(
+        "runs", nargs="+", help="Waters .raw directories and/or mzML files."
+    )
+    parser.add_argument(
+        "--output", type=str, required=True, help="The output .npz file."
+    )
+    parser.add_argument(
+        "--step", type=float, default=None, help="Time grid step in seconds."
+    )
+    parser.add_argument(
+        "--points", type=int, default=None, help="Number of time grid points."
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        default=False,
+        help="Compress the output file.",
+    )
+    args = parser.parse_args(argv)
+    dataset = consolidate.consolidate_chromatograms(
+        args.runs, step=args.step, points=args.points
+    )
+    consolidate.save_dataset(dataset, args.output, compress=args.compress)
+
+
+def batch_main(argv):
+    from . import batch
+
+    parser = argparse.ArgumentParser(
+        prog="mzx batch",
+        description="Convert the inputs of one shard of a manifest, recording "
+        "each outcome in the shard's ledger.",
+        epilog="Other options are passed on to the conversion of each input, "
+        "e.g. mzx batch --manifest runs.txt --shard 3/100 --type mzml,mgf.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        required=True,
+        help="File listing one input per line, optionally followed by a tab "
+        "and its size in bytes.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default="0/1",
+        help="The shard to convert as i/N with 0 <= i < N, or slurm to use "
+        "the SLURM array task.",
+    )
+    parser.add_argument(
+        "--ledger_dir",
+        type=str,
+        default=None,
+        help="Directory of the shard ledgers, the manifest's by default.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Convert inputs the ledger already records as done.",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        default=False,
+        help="Combine the shard ledgers instead of converting; exits with "
+        "status 1 if any input failed or was not converted.",
+    )
+    parser.add_argument(
+        "--cost_history",
+        nargs="+",
+        default=None,
+        metavar="LEDGER",
+        help="Ledgers (or glob patterns) of earlier batches to predict run "
+        "times from; shards are then balanced by predicted time and start "
+        "with their longest inputs. Every shard must be given the same files.",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        default=False,
+        help="Print the predicted wall time, total time and output size of "
+        "the batch instead of converting.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Record the size and function count of every input in the "
+        "manifest instead of converting; run once before the array job so "
+        "that --cost_history tasks need not inspect every input.",
+    )
+    args, conversion_args = parser.parse_known_args(argv)
+    if args.merge:
+        result = batch.merge_ledgers(args.manifest, args.ledger_dir)
+        for path in result.missing:
+            logger.warning(f"Not converted: {path}")
+        return 0 if result.complete else 1
+    if args.plan:
+        batch.plan_manifest(args.manifest)
+        return 0
+
+    try:
+        index, count = batch.parse_shard(args.shard)
+    except batch.BatchError as e:
+        parser.error(str(e))
+    filters = " ".join(conversion_args)
+    model = None
+    if args.cost_history or args.estimate:
+        from . import costs
+
+        model = costs.CostModel.from_records(
+            costs.load_history(args.cost_history or [])
+        )
+    if args.estimate:
+        import shutil
+
+        assert model is not None
+        estimate = batch.estimate_batch(args.manifest, count, model, filters)
+        print(estimate.describe())
+        free = shutil.disk_usage(os.path.dirname(os.path.abspath(args.manifest)))
+        if estimate.output_bytes > free.free:
+            logger.warning(f"Only {free.free / 1e9:.1f} GB free next to the manifest")
+        return 0
+    conversion_parser = build_parser()
+    conversion_parser.prog = "mzx batch"
+    # Reject invalid conversion options before converting anything
+    options = conversion_parser.parse_args(["input", *conversion_args])
+    # One staging area for the shard, so the next input is copied to scratch
+    # while the current one converts
+    area = _staging_area(options) if options.scratch else None
+
+    def convert_input(infile):
+        return convert(
+            conversion_parser.parse_args([infile, *conversion_args]),
+            conversion_parser,
+            area=area,
+        )
+
+    try:
+        records = batch.run_shard(
+            args.manifest,
+            index,
+            count,
+            convert_input,
+            ledger_dir=args.ledger_dir,
+            force=args.force,
+            model=model,
+            filters=filters,
+            area=area,
+        )
+    finally:
+        if area is not None:
+            area.close()
+    return 1 if any(r["status"] != "done" for r in records) else 0
+
+
+def centroid_main(argv):
+    from . import centroid
+
+    parser = argparse.ArgumentParser(
+        prog="mzx centroid",
+        description="Centroid the profile spectra of an mzML file without "
+        "reconverting the vendor raw file.",
+    )
+    parser.add_argument("file", type=str, help="The profile mzML file.")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="The output mzML file (default: {file}_centroid.mzML).",
+    )
+    parser.add_argument(
+        "--peak_picking",
+        type=str,
+        default="all",
+        choices=list(centroid.PEAK_PICKING_LEVELS),
+        help="The MS levels to centroid.",
+    )
+    parser.add_argument(
+        "--snr",
+        type=float,
+        default=None,
+        help="Drop peaks below this signal-to-noise ratio.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker threads."
+    )
+    args = parser.parse_args(argv)
+    centroid.centroid_mzml(
+        args.file,
+        args.output,
+        peak_picking=args.peak_picking,
+        snr=args.snr,
+        workers=args.workers,
+    )
+
+
+def filter_main(argv):
+    from . import filters
+
+    parser = argparse.ArgumentParser(
+        prog="mzx filter",
+        description="Filter the spectra of an existing mzML file.",
+    )
+    parser.add_argument("file", type=str, help="The mzML file.")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="The output mzML file (default: {file}_filtered.mzML).",
+    )
+    parser.add_argument(
+        "--ms_levels",
+        type=filters.parse_levels,
+        default=None,
+        help='The MS levels to keep, e.g. "1", "1-2" or "2-".',
+    )
+    parser.add_argument(
+        "--rt",
+        type=float,
+        nargs=2,
+        default=None,
+        metavar=("START", "END"),
+        help="Keep spectra in this scan time window (seconds).",
+    )
+    parser.add_argument(
+        "--mz",
+        type=float,
+        nargs=2,
+        default=None,
+        metavar=("LOW", "HIGH"),
+        help="Keep peaks in this m/z window.",
+    )
+    parser.add_argument(
+        "--remove_zeros",
+        action="store_true",
+        default=False,
+        help="Remove zero intensity samples.",
+    )
+    parser.add_argument(
+        "--min_intensity",
+        type=float,
+        default=None,
+        help="Remove peaks below this intensity.",
+    )
+    parser.add_argument(
+        "--top_n", type=int, default=None, help="Keep the N most intense peaks."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker threads."
+    )
+    args = parser.parse_args(argv)
+    spectrum_filter = filters.SpectrumFilter(
+        ms_levels=args.ms_levels,
+        rt_window=tuple(args.rt) if args.rt else None,
+        mz_window=tuple(args.mz) if args.mz else None,
+        remove_zeros=args.remove_zeros,
+        min_intensity=args.min_intensity,
+        top_n=args.top_n,
+    )
+    filters.filter_mzml(args.file, spectrum_filter, args.output, workers=args.workers)
+
+
+def preview_main(argv):
+    from . import preview
+
+    parser = argparse.ArgumentParser(
+        prog="mzx preview",
+        description="Write a retention time by m/z heatmap of mzML files as "
+        "{file}_preview.npz and {file}_preview.png.",
+    )
+    parser.add_argument("files", nargs="+", help="The mzML files.")
+    parser.add_argument(
+        "--rt_bins", type=int, default=preview.RT_BINS, help="Retention time rows."
+    )
+    parser.add_argument(
+        "--mz_bins", type=int, default=preview.MZ_BINS, help="m/z columns."
+    )
+    parser.add_argument(
+        "--mz",
+        type=float,
+        nargs=2,
+        default=preview.MZ_RANGE,
+        metavar=("LOW", "HIGH"),
+        help="The m/z range of the heatmap.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker threads."
+    )
+    args = parser.parse_args(argv)
+    if args.rt_bins < 2 or args.rt_bins % 2:
+        parser.error("--rt_bins must be an even number")
+    if args.mz[0] >= args.mz[1]:
+        parser.error("--mz LOW must be below HIGH")
+    for path in args.files:
+        try:
+            preview.write_preview(
+                path,
+                rt_bins=args.rt_bins,
+                mz_bins=args.mz_bins,
+                mz_range=args.mz,
+                workers=args.workers,
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to preview {path}: {e}")
+
+
+def qc_main(argv):
+    from . import compression, qc
+
+    parser = argparse.ArgumentParser(
+        prog="mzx qc",
+        description="Write the QC metrics of mzML files to {file}_qc.json. The "
+        "Waters .raw directory next to a file, if any, is included.",
+    )
+    parser.add_argument("files", nargs="+", help="The mzML files.")
+    parser.add_argument(
+        "--table",
+        type=str,
+        default=None,
+        help="Also append one row per file to this tab-separated table.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker threads."
+    )
+    args = parser.parse_args(argv)
+    failed = False
+    for path in args.files:
+        raw_dir = f"{compression.splitext(path)[0]}.raw"
+        try:
+            qc.run_qc(
+                path,
+                raw_dir if os.path.isdir(raw_dir) else None,
+                table=args.table,
+                workers=args.workers,
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to check {path}: {e}")
+            failed = True
+    return 1 if failed else 0
+
+
+def index_main(argv):
+    from . import catalog
+
+    parser = argparse.ArgumentParser(
+        prog="mzx index",
+        description="Record the spectra of mzML files in a SQLite catalog.",
+    )
+    parser.add_argument("files", nargs="+", help="The mzML files.")
+    parser.add_argument(
+        "--catalog", type=str, required=True, help="The catalog database file."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Re-index files that did not change.",
+    )
+    args = parser.parse_args(argv)
+    with catalog.Catalog(args.catalog) as cat:
+        for path in args.files:
+            try:
+                cat.add_run(path, force=args.force)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to index {path}: {e}")
+
+
+def verify_main(argv):
+    from . import verify
+
+    parser = argparse.ArgumentParser(
+        prog="mzx verify",
+        description="Check that mzML files are complete and their index and "
+        "checksum are valid.",
+    )
+    parser.add_argument("files", nargs="+", help="The mzML files.")
+    parser.add_argument(
+        "--no_checksum",
+        action="store_true",
+        default=False,
+        help="Skip the SHA-1 checksum verification.",
+    )
+    args = parser.parse_args(argv)
+    failed = 0
+    for path in args.files:
+        result = verify.verify_mzml(path, checksum=not args.no_checksum)
+        if result.ok:
+            logger.info(f"OK {path} ({result.spectra} spectra)")
+        else:
+            failed += 1
+            for error in result.errors:
+                logger.error(f"{path}: {error}")
+    return 1 if failed else 0
+
+
+def preflight_main(argv):
+    from . import waters
+
+    parser = argparse.ArgumentParser(
+        prog="mzx preflight",
+        description="Report the lockmass function, function count, polarity "
+        "and acquisition time of Waters .raw directories without converting "
+        "them.",
+    )
+    parser.add_argument("runs", nargs="+", help="The Waters .raw directories.")
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        default=False,
+        help="Print one JSON object per run instead of a table.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of runs read in parallel.",
+    )
+    args = parser.parse_args(argv)
+    summaries = waters.preflight(args.runs, workers=args.workers)
+    if not args.json:
+        print("run\tfunctions\tlockmass\tpolarity\tacquired\tproblems")
+    for summary in summaries:
+        if args.json:
+            print(json.dumps(summary))
+            continue
+        row = [
+            summary["name"],
+            summary.get("functions"),
+            summary.get("lockmass_function"),
+            summary.get("polarity"),
+            summary.get("acquired"),
+            "; ".join(summary["problems"]),
+        ]
+        print("\t".join("" if v is None else str(v) for v in row))
+    return 1 if any(summary["problems"] for summary in summaries) else 0
+
+
+def serve_main(argv):
+    from . import server
 
-def main():
     parser = argparse.ArgumentParser(
-        description="Converts a file to mzML format using msconvert."
+        prog="mzx serve",
+        description="Run a local HTTP service that queues conversion and "
+        "chromatogram jobs and runs them on a pool of workers.",
+    )
+    parser.add_argument(
+        "--root",
+        type=str,
+        default=os.path.join(os.path.expanduser("~"), ".mzx", "serve"),
+        help="Directory for the job database and job logs.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=server.DEFAULT_PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="Number of jobs (msconvert containers) run at once.",
+    )
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        default=False,
+        help="Write empty outputs instead of running msconvert, for testing.",
+    )
+    parser.add_argument(
+        "--scratch",
+        type=str,
+        default=None,
+        help="Copy inputs to this local scratch directory and convert them "
+        "there, copying the next queued input while a job converts.",
+    )
+    parser.add_argument(
+        "--scratch_budget",
+        type=float,
+        default=None,
+        help="Maximum size of the scratch directory in GB.",
+    )
+    args = parser.parse_args(argv)
+    server.serve(
+        args.root,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        runner=server.fake_runner if args.fake else None,
+        scratch=args.scratch,
+        scratch_budget=(
+            int(args.scratch_budget * 1e9) if args.scratch_budget is not None else None
+        ),
+    )
+    return 0
+
+
+OUTPUT_TYPES = ("mzml", "mgf", "mzxml")
+
+COMMANDS = {
+    "batch": batch_main,
+    "centroid": centroid_main,
+    "consolidate": consolidate_main,
+    "filter": filter_main,
+    "index": index_main,
+    "preflight": preflight_main,
+    "preview": preview_main,
+    "qc": qc_main,
+    "serve": serve_main,
+    "verify": verify_main,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Converts a file to mzML format using msconvert.",
+        epilog=f"Other commands: {', '.join(COMMANDS)} (see mzx <command> --help).",
     )
     parser.add_argument("file", type=str, help="The file to convert.")
-    parser.add_argument("--type", type=str, default="mzml", help="The output format.")
+    parser.add_argument(
+        "--type",
+        type=str,
+        default="mzml",
+        help="The output format(s): mzml, mgf or mzxml, comma separated. MGF is "
+        "written natively (without Docker) from mzML input or from an mzML "
+        "converted in the same run, e.g. --type mzml,mgf.",
+    )
     parser.add_argument(
         "--overwrite",
         action="store_true",
@@ -97,9 +632,254 @@ def main():
         default=False,
         help="Export Waters chromatograms (UV, pressure, etc.) to CSV.",
     )
+    parser.add_argument(
+        "--chromatograms_only",
+        action="store_true",
+        default=False,
+        help="Export the chromatograms without converting the input, where "
+        "the vendor files allow it (Waters channels, Bruker timsTOF TIC).",
+    )
+    parser.add_argument(
+        "--embed_chromatograms",
+        action="store_true",
+        default=False,
+        help="Add Waters analog channels (UV, pressure, etc.) to the "
+        "chromatogram list of the mzML output.",
+    )
+    parser.add_argument(
+        "--channels",
+        nargs="+",
+        default=None,
+        metavar="NAME",
+        help="Export only these Waters channels, by name or number.",
+    )
+    parser.add_argument(
+        "--window",
+        nargs=2,
+        type=float,
+        default=None,
+        metavar=("START", "END"),
+        help="Export only the chromatogram samples between these retention "
+        "times in minutes.",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        default=False,
+        help="Write a retention time by m/z heatmap of the mzML output "
+        "(see mzx preview).",
+    )
+    parser.add_argument(
+        "--qc",
+        action="store_true",
+        default=False,
+        help="Write QC metrics of the mzML output (and the Waters analog "
+        "channels) to {output}_qc.json.",
+    )
+    parser.add_argument(
+        "--qc_table",
+        type=str,
+        default=None,
+        help="Also append the QC metrics to this tab-separated batch table; "
+        "implies --qc.",
+    )
+    parser.add_argument(
+        "--decimate",
+        choices=["lttb", "minmax"],
+        default=None,
+        help="Also write chromatograms downsampled with this method.",
+    )
+    parser.add_argument(
+        "--decimate_points",
+        type=int,
+        default=2000,
+        help="Number of points per downsampled chromatogram (at least 3 for lttb).",
+    )
+    parser.add_argument(
+        "--decimate_only",
+        action="store_true",
+        default=False,
+        help="Write only the downsampled chromatograms.",
+    )
+    parser.add_argument(
+        "--scratch",
+        type=str,
+        default=None,
+        help="Copy the input to this local scratch directory and convert it there.",
+    )
+    parser.add_argument(
+        "--scratch_budget",
+        type=float,
+        default=None,
+        help="Maximum size of the scratch directory in GB.",
+    )
+    parser.add_argument(
+        "--copy_workers",
+        type=int,
+        default=8,
+        help="Number of parallel file copies when staging to scratch.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=900.0,
+        help="Stop msconvert after this many seconds, plus an hour per GB of "
+        "input; 0 disables the limit.",
+    )
+    parser.add_argument(
+        "--idle_timeout",
+        type=float,
+        default=600.0,
+        help="Stop msconvert after this many seconds without output, plus "
+        "10 minutes per GB of input; msconvert then reports its progress as "
+        "with --verbose. 0 disables the limit.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="Retries after msconvert timed out or failed transiently.",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="Export the TIC and catalog the spectra while msconvert is still "
+        "writing the mzML.",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        default=False,
+        help="Compress the mzML output in parallel to .mzML.gz with a block "
+        "index for random access.",
+    )
+    parser.add_argument(
+        "--no_verify",
+        action="store_true",
+        default=False,
+        help="Skip the integrity check of the converted mzML.",
+    )
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        default=None,
+        help="Record the spectra of the mzML output in this SQLite catalog.",
+    )
     parser.add_argument("--output", type=str, default=None, help="The output file.")
-    args = parser.parse_args()
+    return parser
+
+
+def channel_keys(channels):
+    """
+    Channel names from the command line, with plain numbers as channel
+    numbers.
+    """
+    if channels is None:
+        return None
+    return [int(c) if c.isdigit() else c for c in channels]
+
+
+def qc_raw_dir(args):
+    """
+    The Waters .raw directory to include in QC, if the input is one.
+    """
+    if os.path.isdir(args.file) and vendor.vendor_name_from_file(args.file) == "waters":
+        return args.file
+    return None
+
+
+def follow_pipeline(args, path, tic=True):
+    """
+    The post-processing stages to run while the mzML at path is written.
+    """
+    from . import follow
+
+    stages: list[follow.Stage] = []
+    if args.chromatograms and tic:
+        stages.append(
+            follow.TicStage(
+                decimation=args.decimate,
+                decimation_points=args.decimate_points,
+                full_resolution=not (args.decimate and args.decimate_only),
+            )
+        )
+    if args.preview:
+        stages.append(follow.PreviewStage())
+    if args.qc or args.qc_table:
+        stages.append(follow.QcStage(qc_raw_dir(args), args.qc_table))
+    # Embedding rewrites the spectra, which moves their offsets
+    if args.catalog and not args.embed_chromatograms:
+        stages.append(follow.CatalogStage(args.catalog, path))
+    return follow.Pipeline(stages)
+
+
+def _staging_area(args):
+    from . import staging
+
+    budget = int(args.scratch_budget * 1e9) if args.scratch_budget is not None else None
+    return staging.StagingArea(
+        args.scratch, budget_bytes=budget, workers=args.copy_workers
+    )
+
+
+def convert(args, parser, area=None):
+    """
+    Convert one input as requested by the parsed command line.
+
+    Args:
+        args: The parsed command line.
+        parser: The parser, for reporting usage errors.
+        area: A staging area shared with other conversions; by default one
+            is created for this input if --scratch is given.
+
+    Returns:
+        The paths of the files written.
+
+    Raises:
+        RawFileConversionError: If the conversion failed; chromatograms that
+            do not depend on it are still exported.
+    """
+    requested = [t.strip().lower() for t in args.type.split(",") if t.strip()]
+    unknown = set(requested) - set(OUTPUT_TYPES)
+    if not requested or unknown:
+        parser.error(f"unsupported output type: {args.type}")
+    input_is_mzml = args.file.lower().endswith((".mzml", ".mzml.gz"))
+    native_mgf = "mgf" in requested and (input_is_mzml or "mzml" in requested)
+    docker_types = [
+        t
+        for t in requested
+        if not (t == "mgf" and native_mgf) and not (t == "mzml" and input_is_mzml)
+    ]
+
     vendor_name = vendor.vendor_name_from_file(args.file)
+    # timsTOF runs have their TIC in analysis.tdf, no conversion needed
+    native_tic = False
+    if vendor_name == "bruker":
+        from . import bruker
+
+        native_tic = bruker.tdf_path(args.file) is not None
+    if args.chromatograms_only:
+        if not (vendor_name == "waters" or native_tic or input_is_mzml):
+            parser.error(
+                "--chromatograms_only needs Waters, Bruker timsTOF or mzML input"
+            )
+        args.chromatograms = True
+        docker_types = []
+        native_mgf = False
+    if args.window is not None and args.window[0] > args.window[1]:
+        parser.error("--window START must not be after END")
+    if args.decimate == "lttb" and args.decimate_points < 3:
+        parser.error("--decimate_points must be at least 3 with --decimate lttb")
+    if args.chromatograms and args.channels and vendor_name == "waters":
+        from . import analog
+
+        # Fail before converting rather than after
+        try:
+            for key in channel_keys(args.channels):
+                analog.channel_store(args.file).channel(key)
+        except analog.ChannelError as e:
+            parser.error(str(e))
     params: types.TConfig = {
         "infile": args.file,
         "index": args.index,
@@ -108,7 +888,7 @@ def main():
         "remove_zeros": args.remove_zeros,
         "vendor": vendor_name,
         "outfile": None,
-        "type": args.type,
+        "type": cast(types.TOutputType, (docker_types or requested)[0]),
         "overwrite": args.overwrite,
         "debug": args.debug,
         "verbose": args.verbose,
@@ -120,12 +900,104 @@ def main():
         "lockmass_function_exclude": None,
     }
 
-    mzml_path = None
+    # Only the docker conversion reads the staged copy
+    if not docker_types:
+        area = None
+    own_area = area is None and bool(args.scratch and docker_types)
+    if own_area:
+        area = _staging_area(args)
+    if area is not None:
+        from . import staging
+
+        try:
+            params["infile"] = area.stage(args.file)
+        except (OSError, staging.StagingError) as e:
+            logger.warning(f"Staging failed, converting in place: {e}")
+
+    from . import supervisor
+
+    runner = supervisor.Supervisor(
+        supervisor.Limits.for_input(params["infile"], args.timeout, args.idle_timeout),
+        retries=args.retries,
+    )
+    mzml_path = args.file if input_is_mzml else None
+    outputs = []
+    failure = None
+    pipeline = None
+    followed: set[str] = set()
     try:
-        mzml_path = convert_raw_file(params)
+        for output_type in docker_types:
+            params["type"] = cast(types.TOutputType, output_type)
+            if args.pipeline and output_type == "mzml":
+                pipeline = follow_pipeline(
+                    args, msconvert_output_path(params), tic=not native_tic
+                )
+            if pipeline is not None and pipeline.stages:
+                from . import follow
+
+                outfile = follow.run_following(
+                    lambda: convert_raw_file(params, runner=runner),
+                    msconvert_output_path(params),
+                    pipeline,
+                )
+            else:
+                outfile = convert_raw_file(params, runner=runner)
+            if (
+                output_type == "mzml"
+                and args.embed_chromatograms
+                and vendor_name == "waters"
+            ):
+                from . import analog
+
+                added = analog.embed_analog_channels(outfile, params["infile"])
+                logger.info(f"Embedded {added} analog channel(s) in {outfile}")
+            if output_type == "mzml" and not args.no_verify:
+                from . import verify
+
+                verify.check_output(outfile)
+            compressed = args.gzip and output_type == "mzml"
+            if compressed:
+                from . import compression
+
+                outfile = compression.compress_file(outfile)
+            if area is not None and params["infile"] != args.file:
+                dest = staging.output_dir_for(args.file)
+                if compressed:
+                    area.publish(compression.index_path(outfile), dest)
+                outfile = area.publish(outfile, dest)
+            outputs.append(outfile)
+            if output_type == "mzml":
+                mzml_path = outfile
+                if pipeline is not None and pipeline.complete:
+                    followed = {stage.name for stage in pipeline.stages}
+                    outputs += pipeline.finish(outfile)
+        if native_mgf and mzml_path is not None:
+            from . import mgf
+
+            outputs.append(mgf.mzml_to_mgf(mzml_path))
+        if args.catalog and mzml_path is not None and "catalog" not in followed:
+            from . import catalog
+
+            with catalog.Catalog(args.catalog) as cat:
+                cat.add_run(mzml_path)
+        qc_wanted = args.qc or args.qc_table
+        if qc_wanted and mzml_path is not None and "qc" not in followed:
+            from . import qc
+
+            outputs.append(qc.run_qc(mzml_path, qc_raw_dir(args), table=args.qc_table))
+        if args.preview and mzml_path is not None and "preview" not in followed:
+            from . import preview
+
+            outputs += preview.write_preview(mzml_path)
     except Exception as e:
         logger.error("Raw file conversion failed!")
         logger.error(str(e))
+        failure = e
+        if pipeline is not None:
+            pipeline.abort()
+    finally:
+        if own_area:
+            area.close()
 
     if args.chromatograms:
         if vendor_name == "waters":
@@ -133,11 +1005,59 @@ def main():
             if not chrom_info:
                 logger.warning("No chromatogram metadata found in Waters file.")
             else:
-                exported = export_chromatograms(args.file, chrom_info)
+                exported = export_chromatograms(
+                    args.file,
+                    chrom_info,
+                    decimation=args.decimate,
+                    decimation_points=args.decimate_points,
+                    full_resolution=not (args.decimate and args.decimate_only),
+                    channels=channel_keys(args.channels),
+                    window=args.window,
+                )
                 logger.info(f"Exported {len(exported)} chromatogram(s).")
+                outputs += exported
+
+        elif native_tic:
+            from . import bruker
+
+            try:
+                outputs += bruker.export_chromatograms(
+                    args.file,
+                    decimation=args.decimate,
+                    decimation_points=args.decimate_points,
+                    full_resolution=not (args.decimate and args.decimate_only),
+                )
+                followed.add("tic")
+            except bruker.TdfError as e:
+                logger.warning(f"{e}, reading the TIC from the mzML instead")
+
+        if mzml_path and os.path.exists(mzml_path) and "tic" not in followed:
+            outputs.append(
+                extract_tic_from_mzml(
+                    mzml_path,
+                    decimation=args.decimate,
+                    decimation_points=args.decimate_points,
+                    full_resolution=not (args.decimate and args.decimate_only),
+                )
+            )
 
-        if mzml_path and os.path.exists(mzml_path):
-            extract_tic_from_mzml(mzml_path)
+    if failure is not None:
+        raise RawFileConversionError(str(failure)) from failure
+    return outputs
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        convert(args, parser)
+    except RawFileConversionError:
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,310 @@
+"""
+Transparent gzip input and block-parallel gzip output for mzML files.
+
+Compressed files are written as a series of independent gzip members, each
+holding BLOCK_SIZE bytes of the original, so members are compressed on a
+thread pool (zlib releases the GIL) and any gzip reader still sees one
+stream. The start of every member is recorded in a sidecar index
+({file}.gzi, laid out like the index written by ``bgzip -i``), which lets
+IndexedGzipReader seek to an uncompressed offset, e.g. one taken from the
+mzML index, by decompressing at most one block.
+"""
+
+import bisect
+import gzip
+import io
+import os
+import shutil
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, cast
+
+if TYPE_CHECKING:
+    from typing_extensions import Buffer
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Uncompressed bytes per gzip member
+BLOCK_SIZE = 4 << 20
+# Compressed bytes read from the file at once
+READ_SIZE = 256 << 10
+COMPRESS_LEVEL = 6
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def is_gzip(path: str) -> bool:
+    """
+    Whether a file is gzip-compressed, judged by its magic bytes.
+    """
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def splitext(path: str) -> tuple[str, str]:
+    """
+    Like os.path.splitext, but keeps a .gz suffix with the extension:
+    "run.mzML.gz" gives ("run", ".mzML.gz").
+    """
+    if path.lower().endswith(".gz"):
+        base, ext = os.path.splitext(path[:-3])
+        return base, ext + path[-3:]
+    return os.path.splitext(path)
+
+
+def index_path(path: str) -> str:
+    return path + ".gzi"
+
+
+def read_index(path: str) -> list[tuple[int, int]] | None:
+    """
+    Read the block index of a compressed file.
+
+    Returns:
+        (compressed offset, uncompressed offset) of every member after the
+        first, or None if the file has no index or the index does not match
+        the file.
+    """
+    try:
+        with open(index_path(path), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    (count,) = struct.unpack_from("<Q", data)
+    points = [struct.unpack_from("<QQ", data, 8 + 16 * i) for i in range(count)]
+    # A stale index from an earlier version of the file points into the
+    # middle of a member
+    with open(path, "rb") as f:
+        for compressed, _ in points[-1:]:
+            f.seek(compressed)
+            if f.read(2) != GZIP_MAGIC:
+                return None
+    return points
+
+
+def write_index(path: str, points: list[tuple[int, int]]) -> None:
+    with open(index_path(path), "wb") as f:
+        f.write(struct.pack("<Q", len(points)))
+        f.writelines(struct.pack("<QQ", *point) for point in points)
+
+
+class IndexedGzipReader(io.RawIOBase):
+    """
+    A seekable reader of a multi-member gzip file with a block index.
+
+    Seeking restarts decompression at the member holding the target offset
+    instead of at the start of the file. Wrap it in io.BufferedReader (as
+    open_input does) for line iteration.
+    """
+
+    def __init__(self, path: str, points: list[tuple[int, int]]):
+        # Owned by the reader and closed in close()
+        self._f = open(path, "rb")  # noqa: SIM115
+        self._points = [(0, 0)] + sorted(points, key=lambda p: p[1])
+        self._starts = [u for _, u in self._points]
+        self._start_member(0)
+
+    def _start_member(self, member: int) -> None:
+        compressed, uncompressed = self._points[member]
+        self._f.seek(compressed)
+        self._decompressor = zlib.decompressobj(wbits=31)
+        self._pending = b""
+        self._buf = b""
+        self._buf_pos = 0
+        self._pos = uncompressed
+
+    def _fill(self) -> bool:
+        """
+        Decompress more data into the buffer; False at the end of the file.
+        """
+        while True:
+            data = self._pending or self._f.read(READ_SIZE)
+            self._pending = b""
+            if not data:
+                return False
+            out = self._decompressor.decompress(data)
+            if self._decompressor.eof:
+                self._pending = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(wbits=31)
+            if out:
+                self._buf = out
+                self._buf_pos = 0
+                return True
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b: "Buffer") -> int:
+        if self._buf_pos >= len(self._buf) and not self._fill():
+            return 0
+        view = memoryview(b).cast("B")
+        n = min(len(view), len(self._buf) - self._buf_pos)
+        view[:n] = self._buf[self._buf_pos : self._buf_pos + n]
+        self._buf_pos += n
+        self._pos += n
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Cannot seek from the end of a gzip file")
+        member = bisect.bisect_right(self._starts, offset) - 1
+        if offset < self._pos or self._starts[member] > self._pos:
+            self._start_member(member)
+        while self._pos < offset:
+            if self._buf_pos >= len(self._buf) and not self._fill():
+                break
+            skip = min(offset - self._pos, len(self._buf) - self._buf_pos)
+            self._buf_pos += skip
+            self._pos += skip
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def open_input(path: str) -> BinaryIO:
+    """
+    Open a possibly gzip-compressed file for binary reading.
+
+    Compressed files with a block index get an IndexedGzipReader, so seeks
+    are cheap; other compressed files are read with gzip.GzipFile, where a
+    seek decompresses everything before the target.
+    """
+    if not is_gzip(path):
+        return open(path, "rb")
+    points = read_index(path)
+    if points is None:
+        return cast(BinaryIO, gzip.open(path, "rb"))
+    return cast(BinaryIO, io.BufferedReader(IndexedGzipReader(path, points), READ_SIZE))
+
+
+def _compress(block: bytes, level: int) -> bytes:
+    return zlib.compress(block, level, wbits=31)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Write a gzip file as independent members compressed on a thread pool.
+
+    Args:
+        path: Output path.
+        workers: Number of compression threads.
+        block_size: Uncompressed bytes per member.
+        index: Whether to write the {path}.gzi block index on close.
+        level: zlib compression level.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        workers: int = DEFAULT_WORKERS,
+        block_size: int = BLOCK_SIZE,
+        index: bool = True,
+        level: int = COMPRESS_LEVEL,
+    ):
+        self.path = path
+        self.block_size = block_size
+        self.index = index
+        self.level = level
+        self.workers = max(workers, 1)
+        # Owned by the writer and closed in close()
+        self._out = open(path, "wb")  # noqa: SIM115
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending: deque[tuple[Future, int]] = deque()
+        self._buffer = bytearray()
+        self._compressed = 0
+        self._uncompressed = 0
+        self._points: list[tuple[int, int]] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: "Buffer") -> int:
+        size = memoryview(data).nbytes
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return size
+
+    def _submit(self, block: bytes) -> None:
+        future = self._executor.submit(_compress, block, self.level)
+        self._pending.append((future, len(block)))
+        if len(self._pending) >= 2 * self.workers:
+            self._write_member()
+
+    def _write_member(self) -> None:
+        future, size = self._pending.popleft()
+        member = future.result()
+        if self._uncompressed:
+            self._points.append((self._compressed, self._uncompressed))
+        self._out.write(member)
+        self._compressed += len(member)
+        self._uncompressed += size
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._uncompressed and not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_member()
+        finally:
+            self._executor.shutdown()
+            self._out.close()
+            super().close()
+        if self.index:
+            write_index(self.path, self._points)
+
+
+def open_output(path: str, workers: int = DEFAULT_WORKERS) -> BinaryIO:
+    """
+    Open a file for binary writing, compressed with ParallelGzipWriter if
+    the path ends with .gz.
+    """
+    if path.lower().endswith(".gz"):
+        return cast(BinaryIO, ParallelGzipWriter(path, workers=workers))
+    return open(path, "wb")
+
+
+def compress_file(
+    src: str,
+    dst: str | None = None,
+    workers: int = DEFAULT_WORKERS,
+    index: bool = True,
+    remove: bool = True,
+) -> str:
+    """
+    Compress a file with ParallelGzipWriter.
+
+    Args:
+        src: The file to compress.
+        dst: Output path, {src}.gz by default.
+        workers: Number of compression threads.
+        index: Whether to write the block index.
+        remove: Whether to delete src afterwards.
+
+    Returns:
+        The output path.
+    """
+    dst = dst or src + ".gz"
+    with (
+        open(src, "rb") as f,
+        ParallelGzipWriter(dst, workers=workers, index=index) as out,
+    ):
+        shutil.copyfileobj(f, out, BLOCK_SIZE)
+    if remove:
+        os.remove(src)
+    return dst
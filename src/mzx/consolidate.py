@@ -0,0 +1,254 @@
+"""
+Consolidate chromatograms from many runs into one dataset on a shared time
+grid.
+
+Instead of one CSV per channel per run, the analog channels of each Waters
+run and the TIC of its converted mzML are resampled onto a common grid and
+stored as a single run x channel x time array, so cross-run overlays load
+with one read.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+from loguru import logger
+
+from . import analog, compression, get_chromatogram_info, read_tic_from_mzml
+
+TIC_CHANNEL = "TIC"
+MAX_POINTS = 100_000
+
+
+@dataclass
+class ChromatogramDataset:
+    """
+    Chromatograms of several runs sampled on one time grid.
+
+    data has shape (len(runs), len(channels), len(time)); samples outside a
+    trace's acquired time range are NaN.
+    """
+
+    time: np.ndarray
+    runs: list[str]
+    channels: list[str]
+    units: list[str]
+    data: np.ndarray
+    metadata: dict = field(default_factory=dict)
+
+    def channel(self, name: str) -> np.ndarray:
+        """
+        Return the (runs, time) array of one channel.
+        """
+        return self.data[:, self.channels.index(name), :]
+
+    def run(self, name: str) -> np.ndarray:
+        """
+        Return the (channels, time) array of one run.
+        """
+        return self.data[self.runs.index(name), :, :]
+
+
+def run_name(path: str) -> str:
+    return compression.splitext(os.path.basename(os.path.abspath(path)))[0]
+
+
+def run_names(paths: list[str]) -> list[str]:
+    """
+    Unique names of runs: the stem of each path, followed by a hash of the
+    absolute path for stems that occur more than once, e.g. run1.raw from
+    two plate directories.
+    """
+    stems = [run_name(path) for path in paths]
+    return [
+        stem
+        if stems.count(stem) == 1
+        else f"{stem}-{hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]}"
+        for stem, path in zip(stems, paths)
+    ]
+
+
+def _tic_source(path: str) -> str | None:
+    """
+    Return the mzML holding the TIC for a run: the path itself, or the mzML
+    msconvert writes next to a raw input.
+    """
+    path = os.path.abspath(path)
+    if path.lower().endswith((".mzml", ".mzml.gz")):
+        return path
+    for ext in (".mzML", ".mzML.gz"):
+        candidate = os.path.join(os.path.dirname(path), f"{run_name(path)}{ext}")
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def collect_traces(path: str) -> tuple[dict, dict, dict]:
+    """
+    Collect the analog channels and TIC of one run.
+
+    Args:
+        path: A Waters .raw directory or an mzML file.
+
+    Returns:
+        Tuple of (traces, units, sources) where traces maps channel name to
+        (times in seconds, values) arrays.
+    """
+    traces: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    units: dict[str, str] = {}
+    sources: dict[str, str] = {}
+
+    if os.path.isdir(path):
+        chrom_info = get_chromatogram_info(path)
+        for channel in analog.analog_channels(path, chrom_info):
+            samples = analog.read_chrodat(channel.path)
+            if samples is None:
+                continue
+            traces[channel.name] = (
+                samples["time"].astype(np.float64) * 60.0,
+                samples["intensity"].astype(np.float64),
+            )
+            units[channel.name] = channel.unit
+            sources[channel.name] = os.path.basename(channel.path)
+
+    mzml_path = _tic_source(path)
+    if mzml_path is not None:
+        times, tics = read_tic_from_mzml(mzml_path)
+        if times:
+            traces[TIC_CHANNEL] = (np.asarray(times), np.asarray(tics))
+            units[TIC_CHANNEL] = "counts"
+            sources[TIC_CHANNEL] = os.path.basename(mzml_path)
+    return traces, units, sources
+
+
+def common_grid(
+    traces: list[np.ndarray],
+    step: float | None = None,
+    points: int | None = None,
+) -> np.ndarray:
+    """
+    Build a time grid spanning all traces.
+
+    Args:
+        traces: Time arrays (seconds) of every trace.
+        step: Grid spacing in seconds.
+        points: Number of grid points; used if step is not given.
+
+    Returns:
+        Evenly spaced time grid. Without step or points, the spacing is the
+        finest median sampling interval among the traces, limited to
+        MAX_POINTS points.
+    """
+    start = min(float(t[0]) for t in traces)
+    end = max(float(t[-1]) for t in traces)
+    span = end - start
+    if points is None:
+        if step is None:
+            intervals = [np.median(np.diff(t)) for t in traces if len(t) > 1]
+            step = min((i for i in intervals if i > 0), default=1.0)
+        points = int(np.floor(span / step)) + 1 if span > 0 else 1
+        points = min(points, MAX_POINTS)
+    return np.linspace(start, end, max(points, 1))
+
+
+def consolidate_chromatograms(
+    paths: list[str],
+    step: float | None = None,
+    points: int | None = None,
+) -> ChromatogramDataset:
+    """
+    Resample the chromatograms of many runs onto one time grid.
+
+    Args:
+        paths: Waters .raw directories and/or mzML files.
+        step: Grid spacing in seconds.
+        points: Number of grid points, if step is not given.
+
+    Returns:
+        The consolidated dataset.
+    """
+    found: list[str] = []
+    per_run = []
+    per_run_sources = []
+    units: dict[str, str] = {}
+    for path in dict.fromkeys(os.path.abspath(p) for p in paths):
+        traces, run_units, sources = collect_traces(path)
+        if not traces:
+            logger.warning(f"No chromatograms found for {path}")
+            continue
+        found.append(path)
+        per_run.append(traces)
+        per_run_sources.append(sources)
+        for name, unit in run_units.items():
+            units.setdefault(name, unit)
+    runs = run_names(found)
+    metadata: dict = {
+        "runs": {
+            run: {"path": path, "sources": sources}
+            for run, path, sources in zip(runs, found, per_run_sources)
+        }
+    }
+
+    channels = list(dict.fromkeys(name for traces in per_run for name in traces))
+    all_times = [t for traces in per_run for t, _v in traces.values() if len(t)]
+    if not all_times:
+        return ChromatogramDataset(
+            np.empty(0), runs, channels, [], np.empty((len(runs), 0, 0)), metadata
+        )
+
+    grid = common_grid(all_times, step=step, points=points)
+    data = np.full((len(runs), len(channels), len(grid)), np.nan, dtype=np.float32)
+    for r, traces in enumerate(per_run):
+        for name, (t, v) in traces.items():
+            order = np.argsort(t, kind="stable")
+            data[r, channels.index(name)] = np.interp(
+                grid, t[order], v[order], left=np.nan, right=np.nan
+            )
+    logger.info(
+        f"Consolidated {len(runs)} run(s) x {len(channels)} channel(s) "
+        f"x {len(grid)} time points"
+    )
+    return ChromatogramDataset(
+        grid, runs, channels, [units.get(c, "") for c in channels], data, metadata
+    )
+
+
+def save_dataset(
+    dataset: ChromatogramDataset, path: str, compress: bool = False
+) -> str:
+    """
+    Write a dataset to a NumPy .npz archive.
+
+    The archive holds "time", "runs", "channels", "units", the
+    (run, channel, time) "data" array and a JSON "metadata" string.
+    """
+    save = np.savez_compressed if compress else np.savez
+    with open(path, "wb") as f:
+        save(
+            f,
+            time=dataset.time,
+            runs=np.asarray(dataset.runs, dtype=str),
+            channels=np.asarray(dataset.channels, dtype=str),
+            units=np.asarray(dataset.units, dtype=str),
+            data=dataset.data,
+            metadata=np.asarray(json.dumps(dataset.metadata)),
+        )
+    logger.info(f"Wrote chromatogram dataset: {path}")
+    return path
+
+
+def load_dataset(path: str) -> ChromatogramDataset:
+    """
+    Read a dataset written by save_dataset.
+    """
+    with np.load(path) as npz:
+        return ChromatogramDataset(
+            time=npz["time"],
+            runs=npz["runs"].tolist(),
+            channels=npz["channels"].tolist(),
+            units=npz["units"].tolist(),
+            data=npz["data"],
+            metadata=json.loads(str(npz["metadata"])),
+        )
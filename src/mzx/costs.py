@@ -0,0 +1,230 @@
+"""
+Conversion cost model learned from batch ledgers.
+
+Every ledger record of mzx batch notes the vendor, size, function count and
+conversion options of its input together with how long the conversion took
+and how much it wrote. Fitting those per vendor predicts the run time and
+output size of new inputs, so a batch can be balanced by expected run time
+instead of input size, start its longest jobs first, and be estimated
+before anything runs: in a mixed batch, a 40 GB Bruker run started last
+would otherwise set the wall time.
+"""
+
+import glob
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+from loguru import logger
+
+from .staging import disk_usage
+
+# Used for a vendor without history
+DEFAULT_SECONDS = 60.0
+DEFAULT_SECONDS_PER_GB = 600.0
+# Output bytes per input byte
+DEFAULT_OUTPUT_RATIO = 2.0
+# Records needed to fit seconds = a + b * GB + c * functions; fewer give a
+# plain seconds-per-GB rate
+MIN_LINEAR_RECORDS = 4
+
+
+@dataclass(frozen=True)
+class Job:
+    """
+    The cost-relevant features of one input.
+    """
+
+    path: str
+    vendor: str
+    size: int
+    functions: int = 1
+    filters: str = ""
+
+    @property
+    def gigabytes(self) -> float:
+        return self.size / 1e9
+
+
+def describe(
+    path: str, size: int | None = None, filters: str = "", functions: int | None = None
+) -> Job:
+    """
+    The features of an input. Only Waters inputs have more than one function;
+    their count is read from the input unless given.
+    """
+    from . import vendor, waters
+
+    name = vendor.vendor_name_from_file(path) or "unspecified"
+    if functions is None:
+        functions = 1
+        if name == "waters":
+            try:
+                functions = max(1, waters.raw_directory(path).function_count)
+            except OSError:
+                pass
+    return Job(
+        path, name, disk_usage(path) if size is None else size, functions, filters
+    )
+
+
+def record_features(job: Job, outputs: list[str]) -> dict:
+    """
+    The fields a ledger record needs to train the model.
+    """
+    return {
+        "vendor": job.vendor,
+        "functions": job.functions,
+        "filters": job.filters,
+        "output_bytes": sum(disk_usage(path) for path in outputs),
+    }
+
+
+@dataclass(frozen=True)
+class Fit:
+    """
+    seconds = intercept + per_gb * GB + per_function * functions
+    """
+
+    intercept: float
+    per_gb: float
+    per_function: float = 0.0
+    output_ratio: float = DEFAULT_OUTPUT_RATIO
+    records: int = 0
+
+    def seconds(self, job: Job) -> float:
+        return max(
+            0.0,
+            self.intercept
+            + self.per_gb * job.gigabytes
+            + self.per_function * job.functions,
+        )
+
+
+DEFAULT_FIT = Fit(DEFAULT_SECONDS, DEFAULT_SECONDS_PER_GB)
+
+
+def fit(records: list[dict]) -> Fit:
+    """
+    Fit the cost of conversions from their ledger records.
+
+    A least-squares fit is used when there are enough records and it gives
+    no negative coefficient; otherwise the time per GB of all records.
+    """
+    sizes = np.array([r["size"] / 1e9 for r in records], dtype=float)
+    functions = np.array([r.get("functions", 1) for r in records], dtype=float)
+    seconds = np.array([r["seconds"] for r in records], dtype=float)
+    outputs = [(r["output_bytes"], r["size"]) for r in records if "output_bytes" in r]
+    total_in = sum(size for _, size in outputs)
+    ratio = (
+        sum(out for out, _ in outputs) / total_in if total_in else DEFAULT_OUTPUT_RATIO
+    )
+
+    if len(records) >= MIN_LINEAR_RECORDS and np.ptp(sizes) > 0:
+        columns = [np.ones_like(sizes), sizes]
+        if np.ptp(functions) > 0:
+            columns.append(functions)
+        coefficients = np.linalg.lstsq(np.column_stack(columns), seconds, rcond=None)[0]
+        if (coefficients >= 0).all():
+            return Fit(
+                float(coefficients[0]),
+                float(coefficients[1]),
+                float(coefficients[2]) if len(coefficients) > 2 else 0.0,
+                ratio,
+                len(records),
+            )
+    if sizes.sum() > 0:
+        return Fit(0.0, float(seconds.sum() / sizes.sum()), 0.0, ratio, len(records))
+    return Fit(float(seconds.mean()), 0.0, 0.0, ratio, len(records))
+
+
+@dataclass
+class CostModel:
+    """
+    Cost fits per vendor and per vendor and conversion options. A job uses
+    the most specific fit available, then the fit of all vendors, then
+    DEFAULT_FIT.
+    """
+
+    fits: dict[tuple[str, str | None], Fit] = field(default_factory=dict)
+    overall: Fit = DEFAULT_FIT
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> "CostModel":
+        usable = [
+            r
+            for r in records
+            if r.get("status") == "done" and "seconds" in r and "size" in r
+        ]
+        groups: dict[tuple[str, str | None], list[dict]] = {}
+        for record in usable:
+            vendor = record.get("vendor") or "unspecified"
+            groups.setdefault((vendor, None), []).append(record)
+            groups.setdefault((vendor, record.get("filters", "")), []).append(record)
+        model = cls({key: fit(group) for key, group in groups.items()})
+        if usable:
+            model.overall = fit(usable)
+        return model
+
+    def fit_for(self, job: Job) -> Fit:
+        for key in ((job.vendor, job.filters), (job.vendor, None)):
+            if key in self.fits:
+                return self.fits[key]
+        return self.overall
+
+    def seconds(self, job: Job) -> float:
+        return self.fit_for(job).seconds(job)
+
+    def output_bytes(self, job: Job) -> float:
+        return self.fit_for(job).output_ratio * job.size
+
+
+def load_history(patterns: list[str]) -> list[dict]:
+    """
+    Read the records of ledgers, given as paths or glob patterns.
+    """
+    from .batch import read_ledger
+
+    records = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern)) or [pattern]
+        for path in paths:
+            if os.path.exists(path):
+                records += read_ledger(path)
+            else:
+                logger.warning(f"No cost history at {path}")
+    return records
+
+
+@dataclass
+class Estimate:
+    """
+    The predicted cost of a batch. makespan is the longest shard's run time
+    in seconds, total the sum over all shards.
+    """
+
+    makespan: float
+    total: float
+    output_bytes: float
+    loads: list[float]
+
+    def describe(self) -> str:
+        return (
+            f"{len(self.loads)} shard(s): about {self.makespan / 3600:.1f} h wall "
+            f"time, {self.total / 3600:.1f} h in total, "
+            f"{self.output_bytes / 1e9:.1f} GB of output"
+        )
+
+
+def estimate(jobs: list[Job], model: CostModel, shards: list[list[int]]) -> Estimate:
+    """
+    Estimate a batch whose jobs are assigned to the given shards.
+    """
+    seconds = [model.seconds(job) for job in jobs]
+    loads = [sum(seconds[i] for i in shard) for shard in shards]
+    return Estimate(
+        max(loads, default=0.0),
+        sum(seconds),
+        sum(model.output_bytes(job) for job in jobs),
+        loads,
+    )
@@ -0,0 +1,127 @@
+"""
+Downsampling of chromatogram traces for visualization.
+
+Both methods walk the trace bucket by bucket and only touch one slice of it
+at a time, so they work directly on memory-mapped files (see
+analog.read_chrodat) without loading the full trace.
+"""
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+# Buckets processed per vectorized step in minmax
+BUCKET_BLOCK = 4096
+
+
+def _bucket_edges(start: int, stop: int, n_buckets: int) -> np.ndarray:
+    return np.linspace(start, stop, n_buckets + 1).astype(np.int64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Select indices with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last samples are always kept. The samples in between are
+    split into n_out - 2 buckets and from each bucket the sample forming the
+    largest triangle with the previously selected sample and the mean of the
+    next bucket is kept.
+
+    Args:
+        x: Sample times (any array-like supporting slicing, e.g. np.memmap).
+        y: Sample values.
+        n_out: Number of samples to keep.
+
+    Returns:
+        Sorted indices of the selected samples.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        raise ValueError("LTTB needs at least 3 output samples")
+
+    edges = _bucket_edges(1, n - 1, n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev_x, prev_y = float(x[0]), float(y[0])
+
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b + 1 < n_out - 2:
+            next_lo, next_hi = edges[b + 1], edges[b + 2]
+        else:
+            next_lo, next_hi = n - 1, n
+        avg_x = float(np.mean(x[next_lo:next_hi], dtype=np.float64))
+        avg_y = float(np.mean(y[next_lo:next_hi], dtype=np.float64))
+
+        bx = np.asarray(x[lo:hi], dtype=np.float64)
+        by = np.asarray(y[lo:hi], dtype=np.float64)
+        area = np.abs(
+            (prev_x - avg_x) * (by - prev_y) - (prev_x - bx) * (avg_y - prev_y)
+        )
+        best = int(np.argmax(area))
+        selected[b + 1] = lo + best
+        prev_x, prev_y = float(bx[best]), float(by[best])
+    return selected
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Select indices keeping the minimum and maximum of each bucket.
+
+    The trace is split into n_out // 2 buckets; the envelope preserves peaks
+    and dips that LTTB may smooth over.
+
+    Args:
+        x: Sample times (any array-like supporting slicing, e.g. np.memmap).
+        y: Sample values.
+        n_out: Approximate number of samples to keep.
+
+    Returns:
+        Sorted, unique indices of the selected samples.
+    """
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n_out >= n:
+        return np.arange(n)
+
+    edges = _bucket_edges(0, n, n_buckets)
+    chunks = []
+    for first in range(0, n_buckets, BUCKET_BLOCK):
+        block = edges[first : min(first + BUCKET_BLOCK, n_buckets) + 1]
+        lo, hi = int(block[0]), int(block[-1])
+        values = np.asarray(y[lo:hi], dtype=np.float64)
+        starts = block[:-1] - lo
+        # Bucket number of every sample in this block
+        bucket = np.repeat(np.arange(len(starts)), np.diff(block))
+        for reduce in (np.minimum, np.maximum):
+            extreme = reduce.reduceat(values, starts)
+            hits = np.flatnonzero(values == extreme[bucket])
+            _, first_hit = np.unique(bucket[hits], return_index=True)
+            chunks.append(hits[first_hit] + lo)
+    return np.unique(np.concatenate(chunks))
+
+
+def decimate(
+    x: np.ndarray, y: np.ndarray, n_out: int, method: str = "lttb"
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Downsample a trace to about n_out samples.
+
+    Args:
+        x: Sample times.
+        y: Sample values.
+        n_out: Target number of samples.
+        method: "lttb" or "minmax".
+
+    Returns:
+        Tuple of (times, values) arrays of the selected samples.
+    """
+    if method == "lttb":
+        index = lttb(x, y, n_out)
+    elif method == "minmax":
+        index = minmax(x, y, n_out)
+    else:
+        raise ValueError(f"Unknown decimation method: {method}")
+    return np.asarray(x[index]), np.asarray(y[index])
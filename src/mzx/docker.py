@@ -1,5 +1,16 @@
-import loguru
+import hashlib
+import os
+import re
 import subprocess
+import sys
+import time
+import uuid
+
+import loguru
+
+CONTAINER_PREFIX = "mzx"
+# The default nonce of container_name: process id and random suffix
+NONCE_RE = re.compile(r"-(\d+)-[0-9a-f]{8}$")
 
 
 def check_running() -> bool:
@@ -20,3 +31,128 @@ def check_running() -> bool:
     except subprocess.CalledProcessError as e:
         loguru.logger.exception(e)
         return False
+
+
+_last_check: tuple[float, bool] | None = None
+
+
+def check_running_cached(ttl: float = 30.0) -> bool:
+    """
+    Like check_running, but reuse a successful result for ttl seconds so that
+    queuing many conversions at once runs `docker info` only once.
+
+    A failed check is never cached, so starting Docker takes effect on the
+    next call.
+    """
+    global _last_check
+    now = time.monotonic()
+    if _last_check is not None and now - _last_check[0] < ttl and _last_check[1]:
+        return True
+    running = check_running()
+    _last_check = (now, running)
+    return running
+
+
+def container_name(path: str, nonce: str | None = None) -> str:
+    """
+    A container name for converting path: the input's name and a hash of its
+    path, so the container can be told apart in `docker ps`, and a nonce,
+    the process id and a random suffix by default, so that concurrent jobs
+    on the same input, e.g. two server workers or the GUI and the CLI, never
+    share a name or remove each other's container.
+    """
+    path = os.path.abspath(path).rstrip("/")
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(path))[:40]
+    digest = hashlib.sha1(path.encode()).hexdigest()[:12]
+    if nonce is None:
+        nonce = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return f"{CONTAINER_PREFIX}-{stem}-{digest}-{nonce}"
+
+
+def remove_container(name: str) -> bool:
+    """
+    Kill and remove a container if it exists.
+
+    Returns:
+        bool: True if a container was removed.
+    """
+    try:
+        result = subprocess.run(
+            ["docker", "rm", "--force", name],
+            check=False,
+            capture_output=True,
+            timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        loguru.logger.warning(f"Could not remove container {name}: {e}")
+        return False
+    return result.returncode == 0
+
+
+def pid_running(pid: int) -> bool:
+    """
+    Whether a process with the given id exists on this host.
+    """
+    if sys.platform == "win32":
+        import ctypes
+
+        # PROCESS_QUERY_LIMITED_INFORMATION; os.kill(pid, 0) would send
+        # CTRL_C_EVENT on Windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            # Access denied means the process exists
+            return ctypes.windll.kernel32.GetLastError() == 5
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_orphans(name: str) -> list[str]:
+    """
+    Remove the containers left by earlier conversions of the same input
+    whose process no longer exists, e.g. after kill -9, which gives the
+    supervisor no chance to remove them.
+
+    Args:
+        name: The container name of the conversion about to start, as
+            returned by container_name with the default nonce.
+
+    Returns:
+        The names of the removed containers.
+    """
+    match = NONCE_RE.search(name)
+    if match is None:
+        return []
+    prefix = name[: match.start() + 1]
+    try:
+        result = subprocess.run(
+            ["docker", "ps", "--all", "--filter", f"name=^{prefix}"]
+            + ["--format", "{{.Names}}"],
+            check=False,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        loguru.logger.warning(f"Could not list containers: {e}")
+        return []
+    removed = []
+    for other in result.stdout.split():
+        nonce = NONCE_RE.search(other)
+        if (
+            nonce is None
+            or nonce.start() + 1 != len(prefix)
+            or not other.startswith(prefix)
+            or pid_running(int(nonce.group(1)))
+        ):
+            continue
+        if remove_container(other):
+            loguru.logger.info(f"Removed orphaned container {other}")
+            removed.append(other)
+    return removed
@@ -0,0 +1,159 @@
+"""
+Streaming spectrum filters for existing mzML files.
+
+These cover the msconvert filters mzx uses (zeroSamples, msLevel,
+scanTime, mzWindow, threshold) so a different filter set can be tried on a
+converted file without another Docker run.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from loguru import logger
+
+from . import compression, mzml
+
+
+def parse_levels(text: str) -> tuple[int, int | None]:
+    """
+    Parse an MS level selection in msconvert syntax: "2", "1-2" or "2-".
+
+    Returns:
+        Tuple of (lowest, highest) level, highest None for no upper bound.
+    """
+    low, sep, high = text.partition("-")
+    try:
+        first = int(low)
+        last = None if sep and not high else int(high or low)
+    except ValueError:
+        raise ValueError(f"Invalid MS level selection: {text}") from None
+    return first, last
+
+
+def nonzero_mask(intensity: np.ndarray, keep_flanking: bool = True) -> np.ndarray:
+    """
+    Mask of the samples kept by zero removal.
+
+    With keep_flanking, zeros next to a non-zero sample are kept so that
+    profile peaks keep their shape (msconvert "zeroSamples removeExtra").
+    """
+    keep = intensity != 0
+    if keep_flanking and len(keep) > 1:
+        nonzero = keep.copy()
+        keep[:-1] |= nonzero[1:]
+        keep[1:] |= nonzero[:-1]
+    return keep
+
+
+def top_n_mask(intensity: np.ndarray, n: int) -> np.ndarray:
+    """
+    Mask of the n most intense samples.
+    """
+    keep = np.zeros(len(intensity), dtype=bool)
+    if n >= len(intensity):
+        keep[:] = True
+    elif n > 0:
+        keep[np.argpartition(intensity, -n)[-n:]] = True
+    return keep
+
+
+@dataclass
+class SpectrumFilter:
+    """
+    A set of spectrum filters applied in one pass.
+
+    Spectrum-level selections (MS level, retention time window, in seconds)
+    are checked before the arrays are decoded; peak filters (zero removal,
+    m/z window, intensity threshold, top-N) are applied to the decoded
+    arrays together.
+    """
+
+    ms_levels: tuple[int, int | None] | None = None
+    rt_window: tuple[float, float] | None = None
+    mz_window: tuple[float, float] | None = None
+    remove_zeros: bool = False
+    min_intensity: float | None = None
+    top_n: int | None = None
+
+    @property
+    def filters_peaks(self) -> bool:
+        return (
+            self.remove_zeros
+            or self.mz_window is not None
+            or self.min_intensity is not None
+            or self.top_n is not None
+        )
+
+    def keep_spectrum(self, spectrum: mzml.Spectrum) -> bool:
+        if self.ms_levels is not None:
+            low, high = self.ms_levels
+            level = spectrum.ms_level or 1
+            if level < low or (high is not None and level > high):
+                return False
+        if self.rt_window is not None and spectrum.rt is not None:
+            start, end = self.rt_window
+            if not start <= spectrum.rt <= end:
+                return False
+        return True
+
+    def filter_peaks(
+        self, mz: np.ndarray, intensity: np.ndarray, centroided: bool = False
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Apply the peak filters to one spectrum's arrays.
+        """
+        keep = np.ones(len(mz), dtype=bool)
+        if self.remove_zeros:
+            keep &= nonzero_mask(intensity, keep_flanking=not centroided)
+        if self.mz_window is not None:
+            low, high = self.mz_window
+            keep &= (mz >= low) & (mz <= high)
+        if self.min_intensity is not None:
+            keep &= intensity >= self.min_intensity
+        if self.top_n is not None:
+            selected = np.flatnonzero(keep)
+            keep[:] = False
+            keep[selected[top_n_mask(intensity[selected], self.top_n)]] = True
+        return mz[keep], intensity[keep]
+
+    def __call__(self, spectrum: mzml.Spectrum) -> mzml.Spectrum | None:
+        if not self.keep_spectrum(spectrum):
+            return None
+        if not self.filters_peaks:
+            return spectrum
+        mzml.decode_spectrum(spectrum)
+        if spectrum.mz is None or spectrum.intensity is None:
+            return spectrum
+        spectrum.mz, spectrum.intensity = self.filter_peaks(
+            spectrum.mz, spectrum.intensity, spectrum.centroided
+        )
+        return spectrum
+
+
+def filter_mzml(
+    mzml_path: str,
+    spectrum_filter: SpectrumFilter,
+    output_path: str | None = None,
+    workers: int = mzml.DEFAULT_WORKERS,
+) -> str:
+    """
+    Write a filtered copy of an mzML file.
+
+    Args:
+        mzml_path: Path to the mzML file.
+        spectrum_filter: The filters to apply.
+        output_path: Output path. Defaults to {mzml_base}_filtered.mzML, or
+            .mzML.gz for compressed input; .gz paths are written compressed.
+        workers: Number of worker threads.
+
+    Returns:
+        Path to the filtered mzML file.
+    """
+    if output_path is None:
+        base, ext = compression.splitext(mzml_path)
+        output_path = f"{base}_filtered{ext}"
+    count = mzml.rewrite_spectra(
+        mzml_path, output_path, spectrum_filter, decode=False, workers=workers
+    )
+    logger.info(f"Filtered mzML: {output_path} ({count} spectra kept)")
+    return output_path
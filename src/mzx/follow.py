@@ -0,0 +1,354 @@
+"""
+Post-processing that keeps up with msconvert while it writes the mzML.
+
+msconvert writes spectra in order and flushes as it goes, so the output can
+be read like a growing log: complete lines are collected into <spectrum>
+blocks as they appear, parsed, and fed to a pipeline of stages (TIC export,
+catalog). When the conversion ends only the last few spectra are left to
+process, instead of a second pass over the whole file.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterator
+
+from loguru import logger
+from lxml import etree
+
+from . import mzml, write_tic_csv
+
+# Seconds between checks for new output
+POLL_INTERVAL = 0.2
+READ_SIZE = 1 << 20
+
+
+class FollowError(Exception):
+    pass
+
+
+# Failures of reading, parsing or feeding a partial output that stop
+# following; the finished file can still be processed the usual way
+FOLLOW_ERRORS = (
+    FollowError,
+    OSError,
+    ValueError,
+    zlib.error,
+    etree.LxmlError,
+    sqlite3.Error,
+)
+
+
+def tail_lines(
+    path: str,
+    finished: Callable[[], bool],
+    poll: float = POLL_INTERVAL,
+    since: float | None = None,
+) -> Iterator[bytes]:
+    """
+    Yield the complete lines of a file as another process appends them.
+
+    Args:
+        path: The file being written.
+        finished: Returns True once the writer is done; the rest of the file
+            is read after that and iteration ends.
+        poll: Seconds to wait for more data.
+        since: Ignore the file until it is modified after this time, so an
+            output left by an earlier run is not mistaken for the new one.
+
+    Raises:
+        FollowError: If the file shrinks while being followed.
+    """
+    while True:
+        done = finished()
+        try:
+            modified = os.path.getmtime(path)
+            if since is None or modified >= since:
+                break
+        except FileNotFoundError:
+            pass
+        if done:
+            return
+        time.sleep(poll)
+
+    with open(path, "rb") as f:
+        partial = b""
+        while True:
+            # Checked before reading, so everything written before the writer
+            # finished is read
+            done = finished()
+            data = f.read(READ_SIZE)
+            if data:
+                lines = (partial + data).splitlines(keepends=True)
+                partial = b"" if lines[-1].endswith(b"\n") else lines.pop()
+                yield from lines
+                continue
+            if os.fstat(f.fileno()).st_size < f.tell():
+                raise FollowError(f"{path} was truncated while being followed")
+            if done:
+                if partial:
+                    yield partial
+                return
+            time.sleep(poll)
+
+
+class Stage:
+    """
+    A step of a Pipeline. feed is called with every spectrum in file order,
+    then finish once the file is complete, or abort if it never will be.
+    """
+
+    name = ""
+    # Whether the stage needs the m/z and intensity arrays
+    decode = False
+
+    def feed(self, spectrum: mzml.Spectrum) -> None:
+        pass
+
+    def finish(self, mzml_path: str) -> list[str]:
+        """
+        Returns:
+            The paths of the files written.
+        """
+        return []
+
+    def abort(self) -> None:
+        pass
+
+
+class TicStage(Stage):
+    """
+    Collects the TIC trace and writes it like extract_tic_from_mzml.
+    """
+
+    name = "tic"
+
+    def __init__(
+        self,
+        output_csv: str | None = None,
+        decimation: str | None = None,
+        decimation_points: int = 2000,
+        full_resolution: bool = True,
+    ):
+        self.output_csv = output_csv
+        self.decimation = decimation
+        self.decimation_points = decimation_points
+        self.full_resolution = full_resolution
+        self.times: list[float] = []
+        self.tics: list[float] = []
+
+    def feed(self, spectrum: mzml.Spectrum) -> None:
+        if spectrum.rt is not None and spectrum.tic is not None:
+            self.times.append(spectrum.rt)
+            self.tics.append(spectrum.tic)
+
+    def finish(self, mzml_path: str) -> list[str]:
+        from . import compression
+
+        output_csv = self.output_csv
+        if output_csv is None:
+            output_csv = f"{compression.splitext(mzml_path)[0]}_TIC.csv"
+        return [
+            write_tic_csv(
+                self.times,
+                self.tics,
+                output_csv,
+                self.decimation,
+                self.decimation_points,
+                self.full_resolution,
+            )
+        ]
+
+
+class CatalogStage(Stage):
+    """
+    Records the spectra in a catalog as they arrive, committed at finish.
+    """
+
+    name = "catalog"
+
+    def __init__(self, catalog_path: str, mzml_path: str):
+        from .catalog import Catalog
+
+        self.catalog = Catalog(catalog_path)
+        self.writer = self.catalog.run_writer(mzml_path)
+
+    def feed(self, spectrum: mzml.Spectrum) -> None:
+        self.writer.add(spectrum)
+
+    def finish(self, mzml_path: str) -> list[str]:
+        try:
+            self.writer.finish(mzml_path)
+            self.catalog.db.commit()
+        finally:
+            self.catalog.close()
+        return []
+
+    def abort(self) -> None:
+        self.catalog.db.rollback()
+        self.catalog.close()
+
+
+class PreviewStage(Stage):
+    """
+    Bins the MS1 peaks into a heatmap and writes it like write_preview.
+    """
+
+    name = "preview"
+    decode = True
+
+    def __init__(self, **options):
+        from .preview import Heatmap
+
+        self.heatmap = Heatmap(**options)
+
+    def feed(self, spectrum: mzml.Spectrum) -> None:
+        self.heatmap.add_spectrum(spectrum)
+
+    def finish(self, mzml_path: str) -> list[str]:
+        from . import compression, preview
+
+        return preview.save(self.heatmap, compression.splitext(mzml_path)[0])
+
+
+class QcStage(Stage):
+    """
+    Collects the QC metrics of the run and writes them like qc.run_qc.
+    """
+
+    name = "qc"
+
+    def __init__(self, raw_dir: str | None = None, table: str | None = None):
+        from .qc import QcCollector
+
+        self.collector = QcCollector()
+        self.raw_dir = raw_dir
+        self.table = table
+
+    def feed(self, spectrum: mzml.Spectrum) -> None:
+        self.collector.feed(spectrum)
+
+    def finish(self, mzml_path: str) -> list[str]:
+        from . import qc
+
+        record = qc.report(self.collector, mzml_path, self.raw_dir)
+        return [qc.save(record, qc.qc_path(mzml_path), self.table)]
+
+
+class Pipeline:
+    """
+    Feeds the spectra of an mzML file to stages while it is being written.
+
+    If following fails, the error is logged and complete is False; the
+    conversion is not affected, and the caller can process the finished
+    file the usual way instead.
+    """
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        self.spectra = 0
+        self.complete = False
+
+    def follow(
+        self,
+        path: str,
+        finished: Callable[[], bool],
+        poll: float = POLL_INTERVAL,
+        since: float | None = None,
+    ) -> None:
+        decode = any(stage.decode for stage in self.stages)
+        try:
+            lines = tail_lines(path, finished, poll, since)
+            for offset, block in mzml.scan_blocks(lines):
+                spectrum = mzml.parse_spectrum(block, offset, decode=decode)
+                for stage in self.stages:
+                    stage.feed(spectrum)
+                self.spectra += 1
+        except FOLLOW_ERRORS as e:
+            logger.warning(f"Stopped following {path}: {e}")
+            self.abort()
+            return
+        except Exception:
+            self.abort()
+            raise
+        if self.spectra:
+            self.complete = True
+        else:
+            self.abort()
+
+    def finish(self, mzml_path: str) -> list[str]:
+        """
+        Finish every stage once the conversion succeeded.
+
+        Args:
+            mzml_path: Final location of the mzML file.
+
+        Returns:
+            The paths of the files written by the stages.
+        """
+        outputs = []
+        for stage in self.stages:
+            outputs += stage.finish(mzml_path)
+        self.stages = []
+        return outputs
+
+    def abort(self) -> None:
+        for stage in self.stages:
+            stage.abort()
+        self.stages = []
+        self.complete = False
+
+
+def run_following(
+    convert: Callable[[], str],
+    path: str,
+    pipeline: Pipeline,
+    poll: float = POLL_INTERVAL,
+) -> str:
+    """
+    Run a conversion while its output is followed in a background thread.
+
+    The conversion runs on the calling thread, so that Ctrl-C and SIGTERM
+    reach the supervisor, which removes the container before the interrupt
+    is passed on.
+
+    Args:
+        convert: Runs the conversion and returns the output path.
+        path: The output path the conversion is expected to write.
+        pipeline: The pipeline fed with the spectra of the output.
+        poll: Seconds between checks for new output.
+
+    Returns:
+        The output path returned by convert.
+    """
+    finished = threading.Event()
+    follower = threading.Thread(
+        target=pipeline.follow,
+        args=(path, finished.is_set, poll),
+        kwargs={"since": time.time() - 1},
+        name="mzx-follow",
+        daemon=True,
+    )
+
+    def stop_following() -> None:
+        finished.set()
+        follower.join()
+
+    follower.start()
+    try:
+        output = convert()
+    except BaseException:
+        # Also a KeyboardInterrupt or SystemExit; stages must not be left
+        # half written
+        stop_following()
+        pipeline.abort()
+        raise
+    stop_following()
+    if os.path.abspath(output) != os.path.abspath(path):
+        logger.warning(f"Followed {path}, but the conversion wrote {output}")
+        pipeline.abort()
+    else:
+        logger.info(f"Followed {pipeline.spectra} spectra of {path}")
+    return output
@@ -1,41 +1,277 @@
+import functools
 import os
 import sys
+import tempfile
+import time
+from dataclasses import dataclass
 
 from importlib import resources as impresources
-from PySide6.QtCore import QByteArray, QSettings, QThread, Signal
-from PySide6.QtGui import QAction, QIcon, QDropEvent, QDragLeaveEvent
+from loguru import logger
+
+try:
+    import PySide6  # noqa: F401
+except ImportError as e:
+    raise ImportError(
+        'The mzx GUI needs PySide6, install it with: pip install "mzx[gui]"'
+    ) from e
+from PySide6.QtCore import QByteArray, QObject, QSettings, QThread, QTimer, Signal
+from PySide6.QtGui import QAction, QDragLeaveEvent, QDropEvent, QIcon
 from PySide6.QtWidgets import (
+    QAbstractItemView,
     QApplication,
     QCheckBox,
+    QComboBox,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
     QMainWindow,
     QMenu,
     QMessageBox,
-    QSizePolicy,
+    QProgressBar,
+    QPushButton,
+    QSpinBox,
     QSystemTrayIcon,
+    QTableWidget,
+    QTableWidgetItem,
     QTextEdit,
     QVBoxLayout,
     QWidget,
 )
-from . import __version__, convert_raw_file, docker, types, vendor
+
+from . import (
+    RawFileConversionError,
+    __version__,
+    convert_raw_file,
+    docker,
+    logbuffer,
+    progress,
+    staging,
+    supervisor,
+    types,
+    vendor,
+    verify,
+)
 
 DATA_DIR = os.path.join(str(impresources.files("mzx")), "..", "data")
 
+LOG_FLUSH_INTERVAL_MS = 250
+LOG_MAX_LINES = 5000
+SCRATCH_DIR = os.path.join(tempfile.gettempdir(), "mzx-scratch")
+ALL_JOBS = "All jobs"
+
+QUEUED = "Queued"
+RUNNING = "Running"
+CANCELLING = "Cancelling"
+DONE = "Done"
+FAILED = "Failed"
+CANCELLED = "Cancelled"
+
 
 class ConverterThread(QThread):
     finished = Signal()  # Explicitly declare signal to satisfy mypy
+    progress = Signal(float)
+    failed = Signal(str)
 
     def __init__(
         self,
         params: types.TConfig,
-        parent: QWidget | None = None,
+        parent: QObject | None = None,
+        area: staging.StagingArea | None = None,
     ):
         super().__init__(parent)
         self.params = params
+        # Converts a local copy of the input if given
+        self.area = area
+        self.outfile: str | None = None
+        self.cancelled = False
+        # Stops the container, not only the docker client, on cancel; the
+        # queue has its own retry
+        self.runner = supervisor.Supervisor(retries=0)
 
     def run(self):
-        _outfile = convert_raw_file(self.params)
+        runner = functools.partial(self.runner, on_line=self._on_line)
+        job = os.path.basename(self.params["infile"].rstrip("/"))
+        infile = self.params["infile"]
+        with logger.contextualize(job=job):
+            try:
+                with staging.staged(self.area, infile) as local:
+                    params = self.params.copy()
+                    params["infile"] = local
+                    self.outfile = convert_raw_file(params, runner=runner)
+                    if local != infile:
+                        self.outfile = staging.publish(
+                            self.outfile, staging.output_dir_for(infile)
+                        )
+                if self.params["type"] == "mzml" and not self.cancelled:
+                    verify.check_output(self.outfile)
+            except (
+                RawFileConversionError,
+                supervisor.CommandError,
+                verify.VerificationError,
+                OSError,
+            ) as e:
+                if self.cancelled:
+                    logger.info("Conversion cancelled")
+                else:
+                    logger.error(str(e))
+                    self.failed.emit(str(e))
+            except Exception:
+                # A bug rather than a failed conversion: fail the job and
+                # leave the traceback to the thread's excepthook
+                logger.exception("Conversion failed unexpectedly")
+                self.failed.emit("Unexpected error, see the log")
+                raise
         # Emit finished signal automatically when the thread ends
 
+    def _on_line(self, line: str) -> None:
+        fraction = progress.parse_progress(line)
+        if fraction is not None:
+            self.progress.emit(fraction)
+
+    def cancel(self) -> None:
+        """Stop the conversion and remove its container."""
+        self.cancelled = True
+        self.runner.cancel()
+
+
+@dataclass
+class ConversionJob:
+    path: str
+    params: types.TConfig
+    status: str = QUEUED
+    progress: float = 0.0
+    started: float | None = None
+    error: str | None = None
+    thread: ConverterThread | None = None
+
+
+class ConversionQueue(QObject):
+    """
+    Queue of conversions run by at most max_workers concurrent threads.
+    """
+
+    job_updated = Signal(int)
+    stats_updated = Signal(str)
+
+    def __init__(self, max_workers: int = 2, parent: QObject | None = None):
+        super().__init__(parent)
+        self.max_workers = max_workers
+        self.jobs: list[ConversionJob] = []
+        self.meter = progress.ThroughputMeter()
+        # Copy inputs to local scratch, the next one while a job converts
+        self.stage_inputs = False
+        self.area: staging.StagingArea | None = None
+
+    def add(self, path: str, params: types.TConfig) -> int:
+        self.jobs.append(ConversionJob(path, params))
+        index = len(self.jobs) - 1
+        self.job_updated.emit(index)
+        self._dispatch()
+        return index
+
+    def set_max_workers(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._dispatch()
+
+    def running(self) -> int:
+        return sum(1 for job in self.jobs if job.status in (RUNNING, CANCELLING))
+
+    def cancel(self, index: int) -> None:
+        job = self.jobs[index]
+        if job.status == QUEUED:
+            job.status = CANCELLED
+            if self.area is not None:
+                self.area.release(job.params["infile"], remove=True)
+        elif job.status == RUNNING and job.thread is not None:
+            job.status = CANCELLING
+            job.thread.cancel()
+        self._changed(index)
+
+    def retry(self, index: int) -> None:
+        job = self.jobs[index]
+        if job.status in (FAILED, CANCELLED):
+            job.status = QUEUED
+            job.progress = 0.0
+            job.error = None
+            self._changed(index)
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        for index, job in enumerate(self.jobs):
+            if self.running() >= self.max_workers:
+                break
+            if job.status == QUEUED:
+                self._start(index)
+        if self.stage_inputs:
+            # Copy the next input while the running jobs convert
+            upcoming = next((job for job in self.jobs if job.status == QUEUED), None)
+            if upcoming is not None:
+                self._area().prefetch(upcoming.params["infile"])
+
+    def close(self) -> None:
+        """Remove the staged inputs; call once no conversion is running."""
+        if self.area is not None:
+            self.area.close()
+            self.area = None
+
+    def _area(self) -> staging.StagingArea:
+        if self.area is None:
+            self.area = staging.StagingArea(SCRATCH_DIR)
+        return self.area
+
+    def _start(self, index: int) -> None:
+        job = self.jobs[index]
+        area = self._area() if self.stage_inputs else None
+        thread = ConverterThread(job.params, self, area=area)
+        thread.progress.connect(functools.partial(self._on_progress, index))
+        thread.failed.connect(functools.partial(self._on_failed, index))
+        thread.finished.connect(functools.partial(self._on_finished, index))
+        job.thread = thread
+        job.status = RUNNING
+        job.started = time.monotonic()
+        self._changed(index)
+        thread.start()
+
+    def _on_progress(self, index: int, fraction: float) -> None:
+        self.jobs[index].progress = fraction
+        self._changed(index)
+
+    def _on_failed(self, index: int, message: str) -> None:
+        self.jobs[index].error = message
+
+    def _on_finished(self, index: int) -> None:
+        job = self.jobs[index]
+        if job.thread is not None and job.thread.cancelled:
+            job.status = CANCELLED
+        elif job.error is not None:
+            job.status = FAILED
+        else:
+            job.status = DONE
+            job.progress = 1.0
+            if job.started is not None:
+                self.meter.record(time.monotonic() - job.started)
+        job.thread = None
+        self._changed(index)
+        self._dispatch()
+
+    def _changed(self, index: int) -> None:
+        self.job_updated.emit(index)
+        self.stats_updated.emit(self.stats())
+
+    def stats(self) -> str:
+        done = sum(1 for job in self.jobs if job.status == DONE)
+        remaining = sum(
+            1.0 if job.status == QUEUED else 1.0 - job.progress
+            for job in self.jobs
+            if job.status in (QUEUED, RUNNING)
+        )
+        eta = self.meter.eta(remaining, self.max_workers)
+        return (
+            f"{done}/{len(self.jobs)} done | "
+            f"{self.meter.throughput():.1f} files/min | "
+            f"ETA {progress.format_duration(eta)}"
+        )
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -69,25 +305,120 @@ class MainWindow(QMainWindow):
         self.removezeros_checkbox.setChecked(remove_zeros)
         layout.addWidget(self.removezeros_checkbox)
 
-        # Create a blank panel at the bottom
-        blank_panel = QWidget(self)
-        blank_panel.setSizePolicy(
-            QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding
+        # Local scratch staging, for inputs on network shares
+        self.scratch_checkbox = QCheckBox("Stage inputs to local scratch", self)
+        self.scratch_checkbox.setToolTip(
+            f"Copy each input to {SCRATCH_DIR} before converting it, copying "
+            "the next queued input while the current one converts."
         )
-        blank_panel.setMinimumHeight(self.height() // 2)
-        layout.addWidget(blank_panel)
-
-        # Log output
+        stage_inputs = bool(settings.value("scratch", False, bool))
+        self.scratch_checkbox.setChecked(stage_inputs)
+        layout.addWidget(self.scratch_checkbox)
+
+        # Concurrent conversions
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Concurrent conversions", self))
+        self.workers_spinbox = QSpinBox(self)
+        self.workers_spinbox.setRange(1, max(os.cpu_count() or 1, 1))
+        workers = settings.value("workers", 2, int)
+        self.workers_spinbox.setValue(workers if isinstance(workers, int) else 2)
+        workers_layout.addWidget(self.workers_spinbox)
+        workers_layout.addStretch()
+        layout.addLayout(workers_layout)
+
+        # Conversion queue
+        self.queue = ConversionQueue(self.workers_spinbox.value(), self)
+        self.queue.stage_inputs = stage_inputs
+        self.scratch_checkbox.toggled.connect(self.on_scratch_toggled)
+        self.workers_spinbox.valueChanged.connect(self.queue.set_max_workers)
+        self.queue.job_updated.connect(self.on_job_updated)
+        self.queue.stats_updated.connect(self.on_stats_updated)
+
+        self.queue_table = QTableWidget(0, 3, self)
+        self.queue_table.setHorizontalHeaderLabels(["File", "Status", "Progress"])
+        self.queue_table.horizontalHeader().setSectionResizeMode(
+            0, QHeaderView.ResizeMode.Stretch
+        )
+        self.queue_table.setSelectionBehavior(
+            QAbstractItemView.SelectionBehavior.SelectRows
+        )
+        self.queue_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.queue_table.setMinimumHeight(self.height() // 2)
+        layout.addWidget(self.queue_table)
+
+        buttons_layout = QHBoxLayout()
+        cancel_button = QPushButton("Cancel", self)
+        cancel_button.clicked.connect(self.cancel_selected)
+        buttons_layout.addWidget(cancel_button)
+        retry_button = QPushButton("Retry", self)
+        retry_button.clicked.connect(self.retry_selected)
+        buttons_layout.addWidget(retry_button)
+        buttons_layout.addStretch()
+        self.stats_label = QLabel(self.queue.stats(), self)
+        buttons_layout.addWidget(self.stats_label)
+        layout.addLayout(buttons_layout)
+
+        # Log filters
+        filter_layout = QHBoxLayout()
+        self.log_level_combo = QComboBox(self)
+        self.log_level_combo.addItems(logbuffer.LEVELS)
+        self.log_level_combo.setCurrentText("INFO")
+        self.log_level_combo.currentTextChanged.connect(self.on_log_filter_changed)
+        filter_layout.addWidget(self.log_level_combo)
+        self.log_job_combo = QComboBox(self)
+        self.log_job_combo.addItem(ALL_JOBS)
+        self.log_job_combo.currentTextChanged.connect(self.on_log_filter_changed)
+        filter_layout.addWidget(self.log_job_combo)
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
+        # Log output, fed in batches from worker threads
         self.log_text_edit = QTextEdit(self)
         self.log_text_edit.setReadOnly(True)
+        self.log_text_edit.document().setMaximumBlockCount(LOG_MAX_LINES)
         layout.addWidget(self.log_text_edit)
+        self.log_buffer = logbuffer.LogBuffer(max_lines=LOG_MAX_LINES)
+        self.log_buffer.install()
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start()
         self._layout = layout
 
+    def flush_log(self) -> None:
+        """Slot that appends buffered log records to the log view."""
+        entries = self.log_buffer.drain()
+        if entries:
+            self.log_text_edit.append("\n".join(e.format() for e in entries))
+        known = {
+            self.log_job_combo.itemText(i) for i in range(self.log_job_combo.count())
+        }
+        for job in self.log_buffer.jobs():
+            if job not in known:
+                self.log_job_combo.addItem(job)
+
+    def on_log_filter_changed(self, _text: str) -> None:
+        job = self.log_job_combo.currentText()
+        entries = self.log_buffer.set_filter(
+            level=self.log_level_combo.currentText(),
+            job=None if job == ALL_JOBS else job,
+        )
+        self.log_text_edit.setPlainText("\n".join(e.format() for e in entries))
+
+    def on_scratch_toggled(self, checked: bool) -> None:
+        self.queue.stage_inputs = checked
+
     def closeEvent(self, event):
+        self.log_timer.stop()
+        self.log_buffer.uninstall()
         settings = QSettings("mzx", "app")
         settings.setValue("window_geometry", self.saveGeometry())
         settings.setValue("peakpicking", self.peakpicking_checkbox.isChecked())
         settings.setValue("removezeros", self.removezeros_checkbox.isChecked())
+        settings.setValue("workers", self.workers_spinbox.value())
+        settings.setValue("scratch", self.scratch_checkbox.isChecked())
+        if not self.queue.running():
+            self.queue.close()
         super().closeEvent(event)
 
     def dragEnterEvent(self, event: QDropEvent) -> None:
@@ -111,15 +442,13 @@ class MainWindow(QMainWindow):
             self.convert(path)
 
     def convert(self, path: str) -> None:
-        if not docker.check_running():
+        # Cached, so dropping many files runs `docker info` once
+        if not docker.check_running_cached():
             self.show_popup("Docker is not running. Please start Docker and try again.")
-            self.log_text_edit.append("Docker is not running. Conversion cancelled.")
+            logger.warning("Docker is not running. Conversion cancelled.")
             return
 
-        self.log_text_edit.append(f"Launching thread to convert {path}...")
-
-        # Create thread and connect its finishe
-        #
+        logger.info(f"Queued {path} for conversion.")
 
         vendor_name = vendor.vendor_name_from_file(path)
         params: types.TConfig = {
@@ -133,7 +462,8 @@ class MainWindow(QMainWindow):
             "type": "mzml",
             "overwrite": False,
             "debug": False,
-            "verbose": False,
+            # Makes msconvert report progress
+            "verbose": True,
             "lockmass": None,
             "lockmass_disabled": None,
             "lockmass_function_exclude": None,
@@ -142,13 +472,41 @@ class MainWindow(QMainWindow):
             "pos_lockmass": None,
         }
 
-        self.convert_thread = ConverterThread(params)
-        self.convert_thread.finished.connect(self.on_conversion_complete)
-        self.convert_thread.start()
-
-    def on_conversion_complete(self):
-        """Slot that runs when the conversion thread finishes."""
-        self.log_text_edit.append("Conversion task completed.")
+        self.queue.add(path, params)
+
+    def selected_jobs(self) -> list[int]:
+        return sorted({index.row() for index in self.queue_table.selectedIndexes()})
+
+    def cancel_selected(self) -> None:
+        for index in self.selected_jobs():
+            self.queue.cancel(index)
+
+    def retry_selected(self) -> None:
+        for index in self.selected_jobs():
+            self.queue.retry(index)
+
+    def on_job_updated(self, index: int) -> None:
+        """Slot that refreshes one row of the queue table."""
+        job = self.queue.jobs[index]
+        if index >= self.queue_table.rowCount():
+            self.queue_table.setRowCount(index + 1)
+            self.queue_table.setItem(
+                index, 0, QTableWidgetItem(os.path.basename(job.path.rstrip("/")))
+            )
+            self.queue_table.setItem(index, 1, QTableWidgetItem())
+            self.queue_table.setCellWidget(index, 2, QProgressBar(self.queue_table))
+        status = job.status if job.error is None else f"{job.status}: {job.error}"
+        item = self.queue_table.item(index, 1)
+        if item is not None:
+            item.setText(status)
+        bar = self.queue_table.cellWidget(index, 2)
+        if isinstance(bar, QProgressBar):
+            bar.setValue(int(job.progress * 100))
+        if job.status in (DONE, FAILED, CANCELLED):
+            logger.info(f"{job.path}: {status}")
+
+    def on_stats_updated(self, text: str) -> None:
+        self.stats_label.setText(text)
 
     def show_popup(self, message: str) -> QMessageBox:
         dialog = QMessageBox()
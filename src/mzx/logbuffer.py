@@ -0,0 +1,128 @@
+"""
+Thread-safe buffering of loguru records for display in a UI.
+
+Conversions log every line of msconvert output. Appending each one to a
+widget as it arrives would swamp the UI thread, so LogBuffer collects records
+from any thread and the UI drains them in batches on a timer.
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from loguru import Message
+
+LEVELS = ["DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"]
+
+
+@dataclass(frozen=True)
+class LogEntry:
+    time: datetime
+    level: str
+    level_no: int
+    job: str | None
+    message: str
+
+    def format(self) -> str:
+        job = f" [{self.job}]" if self.job else ""
+        return f"{self.time:%H:%M:%S} {self.level:<8}{job} {self.message}"
+
+
+class LogBuffer:
+    """
+    A loguru sink holding at most max_lines records.
+
+    Records tagged with a job (``logger.contextualize(job=...)``) can be
+    filtered by job as well as by minimum level.
+    """
+
+    def __init__(self, max_lines: int = 5000, level: str = "INFO"):
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._pending: deque[LogEntry] = deque()
+        self._retained: deque[LogEntry] = deque(maxlen=max_lines)
+        self.dropped = 0
+        self.level_no = logger.level(level).no
+        self.job: str | None = None
+        self._sink_id: int | None = None
+
+    def install(self) -> None:
+        """
+        Register the buffer as a loguru sink.
+        """
+        if self._sink_id is None:
+            self._sink_id = logger.add(self.write, level="DEBUG", format="{message}")
+
+    def uninstall(self) -> None:
+        """
+        Remove the buffer from loguru's sinks.
+        """
+        if self._sink_id is not None:
+            logger.remove(self._sink_id)
+            self._sink_id = None
+
+    def write(self, message: "Message") -> None:
+        """
+        loguru sink entry point; may be called from any thread.
+        """
+        record = message.record
+        entry = LogEntry(
+            time=record["time"],
+            level=record["level"].name,
+            level_no=record["level"].no,
+            job=record["extra"].get("job"),
+            message=record["message"],
+        )
+        with self._lock:
+            if len(self._pending) >= self.max_lines:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(entry)
+
+    def _accepts(self, entry: LogEntry) -> bool:
+        if entry.level_no < self.level_no:
+            return False
+        return self.job is None or entry.job == self.job
+
+    def drain(self) -> list[LogEntry]:
+        """
+        Return records written since the last drain that pass the filters.
+        """
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            self._retained.extend(pending)
+        return [entry for entry in pending if self._accepts(entry)]
+
+    def set_filter(
+        self, level: str | None = None, job: str | None = None
+    ) -> list[LogEntry]:
+        """
+        Change the filters and return the retained records that pass them, so
+        the view can be rebuilt.
+
+        Args:
+            level: Minimum level name, e.g. "WARNING". None keeps the current
+                level.
+            job: Only show records for this job, or None for all jobs.
+        """
+        if level is not None:
+            self.level_no = logger.level(level).no
+        self.job = job
+        self.drain()
+        with self._lock:
+            retained = list(self._retained)
+        return [entry for entry in retained if self._accepts(entry)]
+
+    def jobs(self) -> list[str]:
+        """
+        Return the jobs seen in the retained records, in order of appearance.
+        """
+        with self._lock:
+            retained = list(self._retained) + list(self._pending)
+        return list(dict.fromkeys(e.job for e in retained if e.job is not None))
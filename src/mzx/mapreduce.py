@@ -0,0 +1,274 @@
+"""
+Parallel map-reduce over the spectra of an mzML file.
+
+The spectrum offsets of the index split the file into ranges of spectra.
+Each range is read, parsed and decoded by a worker process, which calls the
+map function on every spectrum, so nothing but the offsets is sent to the
+workers. Large NumPy arrays in the results come back through shared memory
+instead of being pickled through a pipe. Results are returned, and reduced,
+in file order.
+
+The map function runs in other processes, so it has to be picklable: a
+function defined at module level, or a functools.partial of one.
+"""
+
+import functools
+import mmap
+import os
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, BinaryIO
+
+import numpy as np
+
+from . import compression, mzml
+
+# Spectra per work item
+CHUNK_SIZE = 256
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Smaller arrays are pickled with the rest of the results
+SHARE_MIN_BYTES = 1 << 16
+# Windows frees a shared memory block when its creator closes it, before
+# the parent could attach to it
+SHARE_ARRAYS = os.name != "nt"
+
+
+def spectrum_offsets(path: str) -> list[int]:
+    """
+    The byte offsets of the spectra of an mzML file, in file order.
+
+    They are taken from the index of an indexedmzML file without reading
+    the spectra; otherwise, e.g. for gzip input, the file is scanned.
+    """
+    if not compression.is_gzip(path):
+        offsets = _indexed_offsets(path)
+        if offsets is not None:
+            return offsets
+    return [offset for offset, _ in mzml.iter_spectrum_blocks(path)]
+
+
+def _indexed_offsets(path: str) -> list[int] | None:
+    from .verify import INDEX_LIST_OFFSET_RE, OFFSET_RE, TAIL_LIMIT
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        match = INDEX_LIST_OFFSET_RE.search(mm, max(0, size - TAIL_LIMIT))
+        if match is None:
+            return None
+        offsets = []
+        kind = ""
+        for entry in OFFSET_RE.finditer(mm, int(match.group(1))):
+            if entry.group(1) is not None:
+                kind = entry.group(1).decode()
+            elif kind == "spectrum":
+                offsets.append(int(entry.group(3)))
+        # A stale index is not trusted
+        for offset in offsets[:1] + offsets[-1:]:
+            if not mm[offset : offset + 10].startswith(b"<spectrum"):
+                return None
+    return offsets
+
+
+@dataclass(frozen=True)
+class _SharedArray:
+    offset: int
+    dtype: str
+    shape: tuple[int, ...]
+
+
+def _walk(value: Any, fn: Callable[[np.ndarray], Any]) -> Any:
+    if isinstance(value, np.ndarray):
+        return fn(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_walk(v, fn) for v in value)
+    if isinstance(value, dict):
+        return {k: _walk(v, fn) for k, v in value.items()}
+    return value
+
+
+def _share(results: list) -> tuple[str | None, list]:
+    """
+    Move the large arrays of results into one shared memory block.
+    """
+    large: list[np.ndarray] = []
+
+    def collect(array: np.ndarray) -> np.ndarray:
+        if array.nbytes >= SHARE_MIN_BYTES and not array.dtype.hasobject:
+            large.append(array)
+        return array
+
+    _walk(results, collect)
+    if not large:
+        return None, results
+
+    from multiprocessing import resource_tracker, shared_memory
+
+    sizes = [-(-a.nbytes // 64) * 64 for a in large]
+    block = shared_memory.SharedMemory(create=True, size=sum(sizes))
+    # The parent unlinks the block once it has read it
+    resource_tracker.unregister(block._name, "shared_memory")  # type: ignore[attr-defined]
+    placed: dict[int, _SharedArray] = {}
+    position = 0
+    for array, size in zip(large, sizes):
+        target = np.ndarray(array.shape, array.dtype, block.buf, position)
+        target[...] = array
+        placed[id(array)] = _SharedArray(position, array.dtype.str, array.shape)
+        position += size
+    del target
+    results = _walk(results, lambda a: placed.get(id(a), a))
+    block.close()
+    return block.name, results
+
+
+def _unshare(name: str | None, results: list) -> list:
+    """
+    Copy the arrays of a shared memory block back into results and free it.
+    """
+    if name is None:
+        return results
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+
+        def restore(value: Any) -> Any:
+            if isinstance(value, _SharedArray):
+                return np.ndarray(
+                    value.shape, np.dtype(value.dtype), block.buf, value.offset
+                ).copy()
+            if isinstance(value, (list, tuple)):
+                return type(value)(restore(v) for v in value)
+            if isinstance(value, dict):
+                return {k: restore(v) for k, v in value.items()}
+            return value
+
+        return restore(results)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _lines_until(f: BinaryIO, start: int, end: int | None) -> Iterator[bytes]:
+    position = start
+    for line in f:
+        if end is not None and position >= end:
+            return
+        yield line
+        position += len(line)
+
+
+def _map_range(
+    path: str,
+    fn: Callable[[mzml.Spectrum], Any],
+    decode: bool,
+    share: bool,
+    bounds: tuple[int, int | None],
+) -> tuple[str | None, list]:
+    start, end = bounds
+    results = []
+    with compression.open_input(path) as f:
+        f.seek(start)
+        for relative, block in mzml.scan_blocks(_lines_until(f, start, end)):
+            offset = start + relative
+            if end is not None and offset >= end:
+                break
+            result = fn(mzml.parse_spectrum(block, offset, decode))
+            if result is not None:
+                results.append(result)
+    return _share(results) if share else (None, results)
+
+
+def _ranges(offsets: list[int], size: int) -> Iterator[tuple[int, int | None]]:
+    for i in range(0, len(offsets), size):
+        end = offsets[i + size] if i + size < len(offsets) else None
+        yield offsets[i], end
+
+
+def map_spectra(
+    path: str,
+    fn: Callable[[mzml.Spectrum], Any],
+    workers: int = DEFAULT_WORKERS,
+    decode: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Any]:
+    """
+    Apply a function to every spectrum of an mzML file on a process pool.
+
+    Args:
+        path: Path to the mzML file.
+        fn: Picklable function of a Spectrum; results that are None are
+            dropped.
+        workers: Number of worker processes; 1 runs in this process.
+        decode: Whether to decode the m/z and intensity arrays.
+        chunk_size: Number of spectra per work item.
+
+    Yields:
+        The results of fn, in file order.
+    """
+    ranges = _ranges(spectrum_offsets(path), chunk_size)
+    if workers <= 1:
+        for bounds in ranges:
+            yield from _map_range(path, fn, decode, False, bounds)[1]
+        return
+    work = functools.partial(_map_range, path, fn, decode, SHARE_ARRAYS)
+    pending: deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for bounds in ranges:
+                pending.append(executor.submit(work, bounds))
+                if len(pending) >= 2 * workers:
+                    yield from _unshare(*pending.popleft().result())
+            while pending:
+                yield from _unshare(*pending.popleft().result())
+        finally:
+            # Free the blocks of results that were not consumed
+            for future in pending:
+                if not future.cancel() and future.exception() is None:
+                    _unshare(future.result()[0], [])
+
+
+def map_reduce(
+    path: str,
+    map_fn: Callable[[mzml.Spectrum], Any],
+    reduce_fn: Callable[[Any, Any], Any],
+    initial: Any = None,
+    workers: int = DEFAULT_WORKERS,
+    decode: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> Any:
+    """
+    Map every spectrum of an mzML file on a process pool and fold the
+    results in file order.
+
+    For example, the base peak chromatogram::
+
+        def base_peak(spectrum):
+            if spectrum.ms_level == 1 and len(spectrum.intensity):
+                return spectrum.rt, spectrum.intensity.max()
+
+        trace = map_reduce(path, base_peak, lambda acc, x: acc + [x], [])
+
+    Args:
+        path: Path to the mzML file.
+        map_fn: Picklable function of a Spectrum; results that are None are
+            dropped.
+        reduce_fn: Combines the accumulated value with the next result. It
+            runs in this process and need not be picklable.
+        initial: Initial accumulated value; if None, the first result.
+        workers: Number of worker processes; 1 runs in this process.
+        decode: Whether to decode the m/z and intensity arrays.
+        chunk_size: Number of spectra per work item.
+
+    Returns:
+        The accumulated value, or initial if no spectrum gave a result.
+    """
+    results = map_spectra(path, map_fn, workers, decode, chunk_size)
+    if initial is None:
+        initial = next(results, None)
+        if initial is None:
+            return None
+    return functools.reduce(reduce_fn, results, initial)
@@ -0,0 +1,92 @@
+"""
+Native mzML to MGF export.
+
+Writing MGF from an mzML that already exists avoids a second Docker/Wine
+run of msconvert over the vendor files.
+"""
+
+import io
+import os
+
+import numpy as np
+from loguru import logger
+
+from . import compression, mzml
+
+# Spectra formatted per write() call
+WRITE_BATCH = 256
+
+
+def format_peaks(mz: np.ndarray, intensity: np.ndarray) -> str:
+    """
+    Format a peak list as "mz intensity" lines with a single string
+    formatting call per spectrum.
+    """
+    n = min(len(mz), len(intensity))
+    if n == 0:
+        return ""
+    pairs = np.empty(2 * n, dtype=np.float64)
+    pairs[0::2] = mz[:n]
+    pairs[1::2] = intensity[:n]
+    return ("%.6f %.6g\n" * n) % tuple(pairs.tolist())
+
+
+def format_spectrum(spectrum: mzml.Spectrum, run: str) -> str:
+    """
+    Format one MS/MS spectrum as an MGF "BEGIN IONS" block.
+    """
+    lines = ["BEGIN IONS", f"TITLE={run}.{spectrum.index} NativeID:{spectrum.id}"]
+    if spectrum.rt is not None:
+        lines.append(f"RTINSECONDS={spectrum.rt:.6f}")
+    lines.append(f"PEPMASS={spectrum.precursor_mz:.6f}")
+    if spectrum.charge:
+        lines.append(f"CHARGE={spectrum.charge}{'-' if spectrum.negative else '+'}")
+    header = "\n".join(lines) + "\n"
+    peaks = ""
+    if spectrum.mz is not None and spectrum.intensity is not None:
+        peaks = format_peaks(spectrum.mz, spectrum.intensity)
+    return header + peaks + "END IONS\n\n"
+
+
+def _is_msms(spectrum: mzml.Spectrum) -> bool:
+    return (spectrum.ms_level or 1) >= 2 and spectrum.precursor_mz is not None
+
+
+def mzml_to_mgf(
+    mzml_path: str, mgf_path: str | None = None, workers: int = mzml.DEFAULT_WORKERS
+) -> str:
+    """
+    Write the MS/MS spectra of an mzML file to MGF.
+
+    Spectra with MS level 2 or higher and a selected precursor m/z are
+    exported with their retention time and charge.
+
+    Args:
+        mzml_path: Path to the mzML file.
+        mgf_path: Output path. Defaults to {mzml_base}.mgf; a path ending
+            in .gz is written gzip-compressed.
+        workers: Number of decoding threads.
+
+    Returns:
+        Path to the MGF file.
+    """
+    base = compression.splitext(mzml_path)[0]
+    if mgf_path is None:
+        mgf_path = f"{base}.mgf"
+    run = os.path.basename(base)
+
+    count = 0
+    batch = []
+    with io.TextIOWrapper(compression.open_output(mgf_path, workers)) as out:
+        # Arrays are only decoded for the spectra that are exported
+        spectra = mzml.iter_spectra(mzml_path, workers=workers, select=_is_msms)
+        for spectrum in spectra:
+            batch.append(format_spectrum(spectrum, run))
+            count += 1
+            if len(batch) >= WRITE_BATCH:
+                out.write("".join(batch))
+                batch = []
+        out.write("".join(batch))
+
+    logger.info(f"Exported MGF: {mgf_path} ({count} spectra)")
+    return mgf_path
@@ -0,0 +1,775 @@
+"""
+Streaming access to spectra in mzML files.
+
+mzML written by msconvert puts every element on its own line, so spectra are
+located by scanning lines rather than by parsing the whole document. Each
+<spectrum> element is read as one block of bytes, together with its byte
+offset, and parsed on its own. This keeps memory bounded by the largest
+spectrum and gives every consumer the offsets needed for random access.
+
+rewrite_spectra is the writing counterpart: it streams an mzML file through
+a per-spectrum transform and writes a new file with the text outside the
+spectra copied verbatim and a fresh index. It can also add chromatograms,
+e.g. the analog channels of a Waters run, to the chromatogram list.
+"""
+
+import base64
+import functools
+import hashlib
+import itertools
+import os
+import re
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO
+from xml.sax.saxutils import escape, unescape
+
+import numpy as np
+from lxml import etree
+
+from . import compression
+
+MZML_NS = "http://psi.hupo.org/ms/mzml"
+
+# PSI-MS controlled vocabulary accessions
+MS_LEVEL = "MS:1000511"
+SCAN_START_TIME = "MS:1000016"
+TOTAL_ION_CURRENT = "MS:1000285"
+SELECTED_ION_MZ = "MS:1000744"
+CHARGE_STATE = "MS:1000041"
+PEAK_INTENSITY = "MS:1000042"
+NEGATIVE_SCAN = "MS:1000129"
+CENTROID_SPECTRUM = "MS:1000127"
+PROFILE_SPECTRUM = "MS:1000128"
+BASE_PEAK_MZ = "MS:1000504"
+BASE_PEAK_INTENSITY = "MS:1000505"
+HIGHEST_MZ = "MS:1000527"
+LOWEST_MZ = "MS:1000528"
+MZ_ARRAY = "MS:1000514"
+INTENSITY_ARRAY = "MS:1000515"
+TIME_ARRAY = "MS:1000595"
+FLOW_RATE_ARRAY = "MS:1000820"
+PRESSURE_ARRAY = "MS:1000821"
+CHROMATOGRAM_TYPE = "MS:1000626"
+ABSORPTION_CHROMATOGRAM = "MS:1000812"
+PRESSURE_CHROMATOGRAM = "MS:1003019"
+FLOW_RATE_CHROMATOGRAM = "MS:1003020"
+FLOAT32 = "MS:1000521"
+FLOAT64 = "MS:1000523"
+ZLIB_COMPRESSION = "MS:1000574"
+NO_COMPRESSION = "MS:1000576"
+
+DTYPES: dict[str, np.dtype] = {FLOAT32: np.dtype("<f4"), FLOAT64: np.dtype("<f8")}
+CV_NAMES = {
+    CENTROID_SPECTRUM: "centroid spectrum",
+    PROFILE_SPECTRUM: "profile spectrum",
+    TIME_ARRAY: "time array",
+    INTENSITY_ARRAY: "intensity array",
+    FLOW_RATE_ARRAY: "flow rate array",
+    PRESSURE_ARRAY: "pressure array",
+    CHROMATOGRAM_TYPE: "chromatogram type",
+    ABSORPTION_CHROMATOGRAM: "absorption chromatogram",
+    PRESSURE_CHROMATOGRAM: "pressure chromatogram",
+    FLOW_RATE_CHROMATOGRAM: "flow rate chromatogram",
+}
+VALUE_ARRAYS = (MZ_ARRAY, INTENSITY_ARRAY, TIME_ARRAY, FLOW_RATE_ARRAY, PRESSURE_ARRAY)
+
+# Spectra handed to a worker thread at once
+CHUNK_SIZE = 64
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+@dataclass
+class Spectrum:
+    """
+    One spectrum read from an mzML file.
+
+    rt is in seconds. mz and intensity are None unless the spectrum was read
+    with decode=True.
+    """
+
+    index: int
+    id: str
+    offset: int
+    ms_level: int | None
+    rt: float | None
+    tic: float | None
+    precursor_mz: float | None
+    charge: int | None
+    negative: bool
+    centroided: bool
+    mz: np.ndarray | None
+    intensity: np.ndarray | None
+    element: etree._Element
+
+
+@dataclass
+class Chromatogram:
+    """
+    A chromatogram to add to an mzML file.
+
+    time is in seconds. kind is the accession of the chromatogram type and
+    array that of the value array; unit, if given, is written as a userParam
+    since instrument units rarely have an ontology term.
+    """
+
+    id: str
+    time: np.ndarray
+    values: np.ndarray
+    kind: str = CHROMATOGRAM_TYPE
+    array: str = INTENSITY_ARRAY
+    unit: str = ""
+
+
+def _is_spectrum_start(stripped: bytes) -> bool:
+    return stripped.startswith((b"<spectrum ", b"<spectrum>"))
+
+
+def iter_spectrum_blocks(path: str) -> Iterator[tuple[int, bytes]]:
+    """
+    Yield the raw bytes of each <spectrum> element with its byte offset.
+
+    Args:
+        path: Path to the mzML file.
+
+    Yields:
+        Tuples of (offset of "<spectrum", element bytes).
+    """
+    with compression.open_input(path) as f:
+        yield from scan_blocks(f)
+
+
+def scan_blocks(lines: Iterable[bytes]) -> Iterator[tuple[int, bytes]]:
+    """
+    Collect the <spectrum> elements of a sequence of mzML lines, as
+    iter_spectrum_blocks does for a file.
+    """
+    offset = 0
+    block: list[bytes] = []
+    start = 0
+    for line in lines:
+        if block:
+            block.append(line)
+            if b"</spectrum>" in line:
+                yield start, b"".join(block)
+                block = []
+        else:
+            stripped = line.lstrip()
+            if _is_spectrum_start(stripped):
+                start = offset + len(line) - len(stripped)
+                content = stripped.rstrip()
+                if content.endswith(b"/>") or b"</spectrum>" in content:
+                    yield start, stripped
+                else:
+                    block = [stripped]
+        offset += len(line)
+
+
+def read_spectrum_block(f: BinaryIO, offset: int) -> bytes:
+    """
+    Read the <spectrum> element starting at a byte offset, e.g. one taken
+    from Spectrum.offset or the indexedmzML index.
+    """
+    f.seek(offset)
+    lines = []
+    for line in f:
+        lines.append(line)
+        content = line.rstrip()
+        if b"</spectrum>" in line or (len(lines) == 1 and content.endswith(b"/>")):
+            break
+    block = b"".join(lines)
+    if not _is_spectrum_start(block):
+        raise ValueError(f"No spectrum at offset {offset}")
+    return block
+
+
+def read_spectrum(path: str, offset: int, decode: bool = True) -> Spectrum:
+    """
+    Read the spectrum starting at a byte offset of an mzML file.
+    """
+    with compression.open_input(path) as f:
+        return parse_spectrum(read_spectrum_block(f, offset), offset, decode)
+
+
+def cv_params(element: etree._Element) -> dict[str, etree._Element]:
+    """
+    Map accession to cvParam for all cvParams below element, the first
+    occurrence winning.
+    """
+    params: dict[str, etree._Element] = {}
+    for cv in element.iter("cvParam", f"{{{MZML_NS}}}cvParam"):
+        params.setdefault(cv.get("accession", ""), cv)
+    return params
+
+
+def decode_array(
+    text: str | bytes | None, dtype: np.dtype, compressed: bool
+) -> np.ndarray:
+    """
+    Decode a base64 <binary> payload into a NumPy array.
+
+    The result is a read-only view over the decoded buffer; no intermediate
+    Python lists are created.
+    """
+    if not text:
+        return np.empty(0, dtype=dtype)
+    raw = base64.b64decode(text)
+    if compressed:
+        raw = zlib.decompress(raw)
+    return np.frombuffer(raw, dtype=dtype)
+
+
+def binary_arrays(element: etree._Element) -> dict[str, np.ndarray]:
+    """
+    Decode the binary data arrays of a spectrum or chromatogram element.
+
+    Returns:
+        Mapping of array accession (e.g. MZ_ARRAY) to array.
+    """
+    arrays = {}
+    for bda in element.iter("binaryDataArray", f"{{{MZML_NS}}}binaryDataArray"):
+        params = cv_params(bda)
+        dtype = DTYPES[FLOAT64] if FLOAT64 in params else DTYPES[FLOAT32]
+        compressed = ZLIB_COMPRESSION in params
+        binary = next(bda.iter("binary", f"{{{MZML_NS}}}binary"), None)
+        text = binary.text if binary is not None else None
+        kind = next((a for a in VALUE_ARRAYS if a in params), None)
+        if kind is not None:
+            arrays[kind] = decode_array(text, dtype, compressed)
+    return arrays
+
+
+def _float(cv: etree._Element | None) -> float | None:
+    if cv is None:
+        return None
+    value = cv.get("value")
+    return float(value) if value not in (None, "") else None
+
+
+def parse_spectrum(block: bytes, offset: int = 0, decode: bool = True) -> Spectrum:
+    """
+    Parse a <spectrum> element read by iter_spectrum_blocks.
+    """
+    element = etree.fromstring(block)
+    params = cv_params(element)
+
+    rt = _float(params.get(SCAN_START_TIME))
+    if rt is not None and params[SCAN_START_TIME].get("unitName", "minute") == "minute":
+        rt *= 60.0
+    ms_level = _float(params.get(MS_LEVEL))
+    charge = _float(params.get(CHARGE_STATE))
+
+    mz = intensity = None
+    if decode:
+        arrays = binary_arrays(element)
+        mz = arrays.get(MZ_ARRAY)
+        intensity = arrays.get(INTENSITY_ARRAY)
+
+    return Spectrum(
+        index=int(element.get("index", -1)),
+        id=element.get("id", ""),
+        offset=offset,
+        ms_level=int(ms_level) if ms_level is not None else None,
+        rt=rt,
+        tic=_float(params.get(TOTAL_ION_CURRENT)),
+        precursor_mz=_float(params.get(SELECTED_ION_MZ)),
+        charge=int(charge) if charge is not None else None,
+        negative=NEGATIVE_SCAN in params,
+        centroided=CENTROID_SPECTRUM in params,
+        mz=mz,
+        intensity=intensity,
+        element=element,
+    )
+
+
+def decode_spectrum(spectrum: Spectrum) -> Spectrum:
+    """
+    Decode the arrays of a spectrum parsed with decode=False.
+    """
+    arrays = binary_arrays(spectrum.element)
+    spectrum.mz = arrays.get(MZ_ARRAY)
+    spectrum.intensity = arrays.get(INTENSITY_ARRAY)
+    return spectrum
+
+
+def _parse_chunk(
+    decode: bool,
+    select: Callable[[Spectrum], bool] | None,
+    chunk: list[tuple[int, bytes]],
+) -> list[Spectrum]:
+    spectra = []
+    for offset, block in chunk:
+        spectrum = parse_spectrum(block, offset, decode=False)
+        if select is not None and not select(spectrum):
+            continue
+        spectra.append(decode_spectrum(spectrum) if decode else spectrum)
+    return spectra
+
+
+def iter_spectra(
+    path: str,
+    decode: bool = True,
+    workers: int = 1,
+    select: Callable[[Spectrum], bool] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Spectrum]:
+    """
+    Iterate over the spectra of an mzML file in file order.
+
+    With several workers, spectra are parsed and decoded in chunks on a
+    thread pool while the file is read; zlib inflation and XML parsing
+    release the GIL, so decoding scales over cores. The number of chunks in
+    flight is bounded.
+
+    Args:
+        path: Path to the mzML file.
+        decode: Whether to decode the m/z and intensity arrays.
+        workers: Number of decoding threads.
+        select: Only yield spectra for which this returns True. It is
+            called before decoding, so skipped spectra are never decoded.
+        chunk_size: Number of spectra per work item.
+    """
+    parse = functools.partial(_parse_chunk, decode, select)
+    chunks = _chunks(iter_spectrum_blocks(path), chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from parse(chunk)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for spectra in ordered_map(executor, parse, chunks, 2 * workers):
+            yield from spectra
+
+
+def encode_array(values: np.ndarray, dtype: np.dtype, compressed: bool) -> str:
+    """
+    Encode an array as a base64 <binary> payload, the inverse of
+    decode_array.
+    """
+    raw = np.ascontiguousarray(values, dtype=dtype).tobytes()
+    if compressed:
+        raw = zlib.compress(raw)
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _children(element: etree._Element, tag: str) -> Iterator[etree._Element]:
+    return element.iter(tag, f"{{{MZML_NS}}}{tag}")
+
+
+def set_binary_arrays(
+    element: etree._Element, mz: np.ndarray, intensity: np.ndarray
+) -> None:
+    """
+    Replace the m/z and intensity arrays of a spectrum element, keeping the
+    precision and compression of each array.
+    """
+    arrays = {MZ_ARRAY: mz, INTENSITY_ARRAY: intensity}
+    for bda in _children(element, "binaryDataArray"):
+        params = cv_params(bda)
+        kind = next((a for a in arrays if a in params), None)
+        binary = next(_children(bda, "binary"), None)
+        if kind is None or binary is None:
+            continue
+        dtype = DTYPES[FLOAT64] if FLOAT64 in params else DTYPES[FLOAT32]
+        binary.text = encode_array(arrays[kind], dtype, ZLIB_COMPRESSION in params)
+        bda.set("encodedLength", str(len(binary.text)))
+        if bda.get("arrayLength") is not None:
+            bda.set("arrayLength", str(len(arrays[kind])))
+    element.set("defaultArrayLength", str(len(mz)))
+
+
+def _set_value(
+    params: dict[str, etree._Element], accession: str, value: object
+) -> None:
+    if accession in params:
+        params[accession].set("value", str(value))
+
+
+def update_spectrum_element(spectrum: Spectrum, index: int) -> etree._Element:
+    """
+    Write the fields of a (possibly modified) spectrum back to its element.
+
+    Sets the index, the spectrum representation and, if the arrays are
+    decoded, the arrays and the summary values derived from them (TIC, base
+    peak, m/z range) that the element already carries.
+    """
+    element = spectrum.element
+    element.set("index", str(index))
+    params = cv_params(element)
+
+    old, new = (
+        (PROFILE_SPECTRUM, CENTROID_SPECTRUM)
+        if spectrum.centroided
+        else (CENTROID_SPECTRUM, PROFILE_SPECTRUM)
+    )
+    if old in params:
+        params[old].set("accession", new)
+        params[old].set("name", CV_NAMES[new])
+
+    if spectrum.mz is None or spectrum.intensity is None:
+        return element
+    mz, intensity = spectrum.mz, spectrum.intensity
+    set_binary_arrays(element, mz, intensity)
+    tic = float(np.sum(intensity, dtype=np.float64))
+    spectrum.tic = tic
+    _set_value(params, TOTAL_ION_CURRENT, f"{tic:.10g}")
+    if len(mz):
+        top = int(np.argmax(intensity))
+        _set_value(params, BASE_PEAK_MZ, f"{mz[top]:.10g}")
+        _set_value(params, BASE_PEAK_INTENSITY, f"{intensity[top]:.10g}")
+        _set_value(params, LOWEST_MZ, f"{mz.min():.10g}")
+        _set_value(params, HIGHEST_MZ, f"{mz.max():.10g}")
+    return element
+
+
+_ID_RE = re.compile(rb'\sid="([^"]*)"')
+_COUNT_RE = re.compile(rb'count="(\d+)"')
+_DATA_PROCESSING_RE = re.compile(rb'defaultDataProcessingRef="([^"]*)"')
+
+
+def _element_id(line: bytes) -> str:
+    match = _ID_RE.search(line)
+    return unescape(match.group(1).decode(), {"&quot;": '"'}) if match else ""
+
+
+def _id_attr(value: str) -> str:
+    return escape(value, {'"': "&quot;"})
+
+
+def _array_lines(
+    values: np.ndarray, dtype: np.dtype, accession: str, unit: str, pad: str
+) -> list[str]:
+    text = encode_array(values, dtype, True)
+    precision = FLOAT64 if dtype == DTYPES[FLOAT64] else FLOAT32
+    precision_name = "64-bit float" if precision == FLOAT64 else "32-bit float"
+    return [
+        f'{pad}<binaryDataArray encodedLength="{len(text)}">',
+        (
+            f'{pad}  <cvParam cvRef="MS" accession="{precision}" '
+            f'name="{precision_name}" value=""/>'
+        ),
+        (
+            f'{pad}  <cvParam cvRef="MS" accession="{ZLIB_COMPRESSION}" '
+            'name="zlib compression" value=""/>'
+        ),
+        (
+            f'{pad}  <cvParam cvRef="MS" accession="{accession}" '
+            f'name="{CV_NAMES[accession]}" value=""{unit}/>'
+        ),
+        f"{pad}  <binary>{text}</binary>",
+        f"{pad}</binaryDataArray>",
+    ]
+
+
+def chromatogram_xml(chromatogram: Chromatogram, index: int, indent: bytes) -> bytes:
+    """
+    Serialize a chromatogram element laid out like msconvert output, with
+    64-bit times and 32-bit zlib-compressed values.
+    """
+    pad = indent.decode()
+    lines = [
+        (
+            f'{pad}<chromatogram index="{index}" id="{_id_attr(chromatogram.id)}" '
+            f'defaultArrayLength="{len(chromatogram.time)}">'
+        ),
+        (
+            f'{pad}  <cvParam cvRef="MS" accession="{chromatogram.kind}" '
+            f'name="{CV_NAMES[chromatogram.kind]}" value=""/>'
+        ),
+    ]
+    if chromatogram.unit:
+        lines.append(
+            f'{pad}  <userParam name="unit" value="{_id_attr(chromatogram.unit)}"/>'
+        )
+    lines.append(f'{pad}  <binaryDataArrayList count="2">')
+    lines += _array_lines(
+        chromatogram.time,
+        DTYPES[FLOAT64],
+        TIME_ARRAY,
+        ' unitCvRef="UO" unitAccession="UO:0000010" unitName="second"',
+        pad + "    ",
+    )
+    lines += _array_lines(
+        chromatogram.values, DTYPES[FLOAT32], chromatogram.array, "", pad + "    "
+    )
+    lines += [f"{pad}  </binaryDataArrayList>", f"{pad}</chromatogram>"]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _is_chromatogram_start(stripped: bytes) -> bool:
+    return stripped.startswith((b"<chromatogram ", b"<chromatogram>"))
+
+
+def _chunks(
+    blocks: Iterable[tuple[int, bytes]], size: int
+) -> Iterator[list[tuple[int, bytes]]]:
+    it = iter(blocks)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def ordered_map(
+    executor: Executor, fn: Callable, items: Iterable, window: int
+) -> Iterator:
+    """
+    Like executor.map, but with at most window items in flight, so memory
+    stays bounded however large the input is.
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _process_chunk(
+    transform: Callable[[Spectrum], Spectrum | None],
+    decode: bool,
+    chunk: list[tuple[int, bytes]],
+) -> list[Spectrum]:
+    spectra = _parse_chunk(decode, None, chunk)
+    return [s for s in map(transform, spectra) if s is not None]
+
+
+class _Rewriter:
+    """
+    Copies an mzML file line by line while spectra are replaced and
+    chromatograms added, tracking the output offsets needed for the new
+    index.
+    """
+
+    def __init__(
+        self, src: BinaryIO, out: BinaryIO, chromatograms: Iterable[Chromatogram] = ()
+    ):
+        self.src = src
+        self.out = out
+        self.chromatograms = list(chromatograms)
+        self.data_processing = b"pwiz_Reader_conversion"
+        self.written = 0
+        self.indexed = False
+        self.indent = b""
+        self.pending = b""
+        self.count_pos = -1
+        self.count_width = 0
+        self.offsets: dict[str, list[tuple[str, int]]] = {
+            "spectrum": [],
+            "chromatogram": [],
+        }
+
+    def write(self, data: bytes) -> None:
+        self.out.write(data)
+        self.written += len(data)
+
+    def spectrum_blocks(self) -> Iterator[tuple[int, bytes]]:
+        """
+        Copy the input up to the first spectrum, then yield the spectrum
+        blocks instead of writing them. Stops at the end of the spectrum
+        list; the rest is copied by copy_rest once all spectra are written.
+        """
+        offset = 0
+        block: list[bytes] = []
+        start = 0
+        for line in self.src:
+            stripped = line.lstrip()
+            if block:
+                block.append(line)
+                if b"</spectrum>" in line:
+                    yield start, b"".join(block)
+                    block = []
+            elif _is_spectrum_start(stripped):
+                start = offset + len(line) - len(stripped)
+                self.indent = line[: len(line) - len(stripped)]
+                content = stripped.rstrip()
+                if content.endswith(b"/>") or b"</spectrum>" in content:
+                    yield start, stripped
+                else:
+                    block = [stripped]
+            elif stripped.startswith((b"</spectrumList", b"<indexList")):
+                self.pending = line
+                return
+            else:
+                self.copy_line(line, stripped)
+            offset += len(line)
+
+    def copy_rest(self) -> None:
+        """
+        Copy the input after the spectrum list, up to its index.
+        """
+        lines = itertools.chain([self.pending] if self.pending else [], self.src)
+        for line in lines:
+            stripped = line.lstrip()
+            if stripped.startswith(b"<indexList"):
+                self.indexed = True
+                return
+            self.copy_line(line, stripped)
+
+    def copy_line(self, line: bytes, stripped: bytes) -> None:
+        indent = len(line) - len(stripped)
+        if stripped.startswith(b"<spectrumList"):
+            match = _COUNT_RE.search(line)
+            if match:
+                self.count_pos = self.written + match.start(1)
+                self.count_width = len(match.group(1))
+            match = _DATA_PROCESSING_RE.search(line)
+            if match:
+                self.data_processing = match.group(1)
+        elif stripped.startswith(b"<chromatogramList") and self.chromatograms:
+            match = _COUNT_RE.search(line)
+            if match:
+                count = int(match.group(1)) + len(self.chromatograms)
+                line = _COUNT_RE.sub(f'count="{count}"'.encode(), line, count=1)
+        elif stripped.startswith(b"</chromatogramList") and self.chromatograms:
+            self.write_chromatograms(line[:indent] + b"  ")
+        elif stripped.startswith(b"</run") and self.chromatograms:
+            # The input has no chromatogram list
+            pad = line[:indent] + b"  "
+            self.write(
+                pad
+                + b'<chromatogramList count="%d" defaultDataProcessingRef="%s">\n'
+                % (len(self.chromatograms), self.data_processing)
+            )
+            self.write_chromatograms(pad + b"  ")
+            self.write(pad + b"</chromatogramList>\n")
+        elif _is_chromatogram_start(stripped):
+            self.offsets["chromatogram"].append(
+                (_element_id(stripped), self.written + indent)
+            )
+        elif stripped.startswith(b"</indexedmzML"):
+            return
+        self.write(line)
+
+    def write_chromatograms(self, indent: bytes) -> None:
+        """
+        Write the added chromatograms after those copied from the input.
+        """
+        for chromatogram in self.chromatograms:
+            index = len(self.offsets["chromatogram"])
+            self.offsets["chromatogram"].append(
+                (chromatogram.id, self.written + len(indent))
+            )
+            self.write(chromatogram_xml(chromatogram, index, indent))
+        self.chromatograms = []
+
+    def write_spectrum(self, spectrum: Spectrum, index: int) -> None:
+        element = update_spectrum_element(spectrum, index)
+        self.offsets["spectrum"].append((spectrum.id, self.written + len(self.indent)))
+        self.write(self.indent + etree.tostring(element) + b"\n")
+
+    def patch_count(self, count: int) -> None:
+        """
+        Overwrite the spectrumList count in place. The count can only
+        shrink, so the new attribute is padded with spaces after the closing
+        quote, which keeps every offset already written valid.
+        """
+        if self.count_pos < 0:
+            return
+        digits = str(count).encode()
+        if len(digits) > self.count_width:
+            raise ValueError("Spectrum count grew during rewrite")
+        self.out.seek(self.count_pos)
+        self.out.write(digits + b'"' + b" " * (self.count_width - len(digits)))
+        self.out.seek(0, os.SEEK_END)
+
+    def write_index(self) -> None:
+        """
+        Append indexList, indexListOffset and the SHA-1 fileChecksum, which
+        covers the file up to and including the <fileChecksum> tag.
+        """
+        index_offset = self.written + 2
+        lines = ['  <indexList count="2">']
+        for name, offsets in self.offsets.items():
+            lines.append(f'    <index name="{name}">')
+            lines += [
+                f'      <offset idRef="{_id_attr(ref)}">{pos}</offset>'
+                for ref, pos in offsets
+            ]
+            lines.append("    </index>")
+        lines += [
+            "  </indexList>",
+            f"  <indexListOffset>{index_offset}</indexListOffset>",
+            "  <fileChecksum>",
+        ]
+        self.write("\n".join(lines).encode())
+        self.out.flush()
+
+        sha1 = hashlib.sha1()
+        self.out.seek(0)
+        while data := self.out.read(1 << 20):
+            sha1.update(data)
+        self.write(f"{sha1.hexdigest()}</fileChecksum>\n</indexedmzML>\n".encode())
+
+
+def rewrite_spectra(
+    in_path: str,
+    out_path: str,
+    transform: Callable[[Spectrum], Spectrum | None],
+    decode: bool = True,
+    workers: int = DEFAULT_WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    chromatograms: Iterable[Chromatogram] = (),
+) -> int:
+    """
+    Stream an mzML file through a per-spectrum transform.
+
+    The transform gets each parsed spectrum and returns it, modified or not,
+    or None to drop it. Spectra are processed in chunks on a thread pool and
+    written in their original order. Everything outside the spectra is
+    copied verbatim; spectrum indices and the spectrumList count are
+    renumbered, and for indexedmzML input the index, indexListOffset and
+    SHA-1 fileChecksum are regenerated.
+
+    Args:
+        in_path: Path to the input mzML file.
+        out_path: Path to the output mzML file.
+        transform: Function applied to every spectrum.
+        decode: Whether to decode the arrays before calling transform.
+        workers: Number of worker threads.
+        chunk_size: Number of spectra per work item.
+        chromatograms: Chromatograms to append to the chromatogram list,
+            which is created if the input has none. Their ids must not clash
+            with those of the input.
+
+    Returns:
+        Number of spectra written.
+    """
+    if os.path.abspath(in_path) == os.path.abspath(out_path):
+        raise ValueError("Input and output mzML must be different files")
+    if out_path.lower().endswith(".gz"):
+        # The count and checksum are patched in after the spectra, so the
+        # plain file is written first and then compressed in parallel
+        plain_path = f"{out_path[:-3]}.{os.getpid()}.tmp"
+        try:
+            count = rewrite_spectra(
+                in_path,
+                plain_path,
+                transform,
+                decode,
+                workers,
+                chunk_size,
+                chromatograms,
+            )
+            compression.compress_file(plain_path, out_path, workers=workers)
+        finally:
+            if os.path.exists(plain_path):
+                os.remove(plain_path)
+        return count
+
+    count = 0
+    process = functools.partial(_process_chunk, transform, decode)
+    with compression.open_input(in_path) as src, open(out_path, "w+b") as out:
+        rewriter = _Rewriter(src, out, chromatograms)
+        chunks = _chunks(rewriter.spectrum_blocks(), chunk_size)
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for spectra in ordered_map(executor, process, chunks, 2 * workers):
+                for spectrum in spectra:
+                    rewriter.write_spectrum(spectrum, count)
+                    count += 1
+        rewriter.copy_rest()
+        rewriter.patch_count(count)
+        if rewriter.indexed:
+            rewriter.write_index()
+    return count
@@ -0,0 +1,246 @@
+"""
+Retention time by m/z heatmaps of mzML runs.
+
+A Heatmap bins MS1 peaks into a fixed grid while the spectra stream past.
+Peaks are buffered and added with one bincount per batch, and the grid
+never grows: it starts with a fine retention time step, and whenever a
+spectrum falls past its end, neighbouring rows are merged and the step
+doubles. Memory therefore depends on the grid size, not the run. The result
+is saved as a compressed .npz array and as a PNG thumbnail, encoded here
+with zlib so no imaging library is needed.
+"""
+
+import struct
+import zlib
+from collections.abc import Sequence
+
+import numpy as np
+from loguru import logger
+
+from . import compression, mzml
+
+RT_BINS = 512
+MZ_BINS = 512
+MZ_RANGE = (100.0, 2000.0)
+# Seconds per row until the run outgrows the grid
+RT_STEP = 1.0
+# Peaks buffered before they are added to the grid
+BATCH_PEAKS = 1 << 20
+
+# Color stops from no signal to the highest intensity
+COLORS = np.array(
+    [
+        (0, 0, 4),
+        (87, 16, 110),
+        (188, 55, 84),
+        (249, 142, 9),
+        (252, 255, 164),
+    ],
+    dtype=float,
+)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class Heatmap:
+    """
+    A retention time by m/z grid of summed MS1 intensity.
+
+    Args:
+        rt_bins: Number of retention time rows; must be even.
+        mz_bins: Number of m/z columns.
+        mz_range: The m/z range of the columns; peaks outside are ignored.
+        rt_step: Initial seconds per row.
+    """
+
+    def __init__(
+        self,
+        rt_bins: int = RT_BINS,
+        mz_bins: int = MZ_BINS,
+        mz_range: Sequence[float] = MZ_RANGE,
+        rt_step: float = RT_STEP,
+    ):
+        if rt_bins < 2 or rt_bins % 2:
+            raise ValueError(f"rt_bins must be even, not {rt_bins}")
+        self.rt_bins = rt_bins
+        self.mz_bins = mz_bins
+        self.mz_range = (float(mz_range[0]), float(mz_range[1]))
+        self.rt_step = rt_step
+        self.rt_start: float | None = None
+        self.rt_end: float | None = None
+        self.spectra = 0
+        self.grid = np.zeros((rt_bins, mz_bins), dtype=np.float64)
+        self._times: list[float] = []
+        self._mz: list[np.ndarray] = []
+        self._intensity: list[np.ndarray] = []
+        self._pending = 0
+
+    def add(self, rt: float, mz: np.ndarray, intensity: np.ndarray) -> None:
+        """
+        Add the peaks of one spectrum at retention time rt (seconds).
+        """
+        if self.rt_start is None:
+            self.rt_start = rt
+        self.rt_end = rt if self.rt_end is None else max(self.rt_end, rt)
+        self._times.append(rt)
+        self._mz.append(mz)
+        self._intensity.append(intensity)
+        self._pending += len(mz)
+        self.spectra += 1
+        if self._pending >= BATCH_PEAKS:
+            self._flush()
+
+    def add_spectrum(self, spectrum: mzml.Spectrum) -> None:
+        """
+        Add a decoded spectrum if it is an MS1 spectrum with a time.
+        """
+        if (
+            spectrum.ms_level in (1, None)
+            and spectrum.rt is not None
+            and spectrum.mz is not None
+            and spectrum.intensity is not None
+        ):
+            self.add(spectrum.rt, spectrum.mz, spectrum.intensity)
+
+    def _coarsen(self) -> None:
+        half = self.rt_bins // 2
+        merged = self.grid.reshape(half, 2, self.mz_bins).sum(axis=1)
+        self.grid[:half] = merged
+        self.grid[half:] = 0
+        self.rt_step *= 2
+
+    def _flush(self) -> None:
+        if not self._times:
+            return
+        assert self.rt_start is not None and self.rt_end is not None
+        while self.rt_end - self.rt_start >= self.rt_step * self.rt_bins:
+            self._coarsen()
+        counts = [len(mz) for mz in self._mz]
+        times = np.repeat(np.asarray(self._times), counts)
+        mz = np.concatenate(self._mz)
+        intensity = np.concatenate(self._intensity)
+        self._times, self._mz, self._intensity, self._pending = [], [], [], 0
+
+        rows = np.clip(
+            ((times - self.rt_start) / self.rt_step).astype(np.int64), 0, None
+        )
+        low, high = self.mz_range
+        columns = np.floor((mz - low) * (self.mz_bins / (high - low))).astype(np.int64)
+        keep = (columns >= 0) & (columns < self.mz_bins)
+        cells = rows[keep] * self.mz_bins + columns[keep]
+        self.grid += np.bincount(
+            cells, weights=intensity[keep], minlength=self.grid.size
+        ).reshape(self.grid.shape)
+
+    def result(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The grid, without the rows after the last spectrum.
+
+        Returns:
+            Tuple of (intensity, rt_edges, mz_edges): a float32 array of
+            rows by m/z columns, the row edges in seconds and the column
+            edges.
+        """
+        self._flush()
+        mz_edges = np.linspace(*self.mz_range, self.mz_bins + 1)
+        if self.rt_start is None or self.rt_end is None:
+            return np.zeros((0, self.mz_bins), np.float32), np.zeros(1), mz_edges
+        used = min(self.rt_bins, int((self.rt_end - self.rt_start) / self.rt_step) + 1)
+        rt_edges = self.rt_start + self.rt_step * np.arange(used + 1)
+        return self.grid[:used].astype(np.float32), rt_edges, mz_edges
+
+
+def render(intensity: np.ndarray) -> np.ndarray:
+    """
+    Color a heatmap for display: retention time left to right, m/z from
+    bottom to top, on a logarithmic intensity scale.
+
+    Returns:
+        An RGB image as a uint8 array of shape (height, width, 3).
+    """
+    scaled = np.log1p(np.maximum(intensity, 0).T[::-1])
+    top = np.percentile(scaled[scaled > 0], 99.5) if (scaled > 0).any() else 1.0
+    levels = np.clip(scaled / top, 0, 1) * (len(COLORS) - 1)
+    stops = np.arange(len(COLORS))
+    channels = [np.interp(levels, stops, COLORS[:, c]) for c in range(3)]
+    return np.stack(channels, axis=-1).round().astype(np.uint8)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def write_png(path: str, image: np.ndarray) -> None:
+    """
+    Write an RGB uint8 image of shape (height, width, 3) as a PNG file.
+    """
+    height, width, _ = image.shape
+    # Every scanline starts with filter type 0 (none)
+    rows = np.zeros((height, 1 + 3 * width), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, 3 * width)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        f.write(_png_chunk(b"IHDR", header))
+        f.write(_png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 9)))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def save(heatmap: Heatmap, output_base: str) -> list[str]:
+    """
+    Write a heatmap to {output_base}_preview.npz and {output_base}_preview.png.
+
+    Returns:
+        The paths of the files written.
+    """
+    intensity, rt_edges, mz_edges = heatmap.result()
+    npz_path = f"{output_base}_preview.npz"
+    np.savez_compressed(
+        npz_path, intensity=intensity, rt_edges=rt_edges, mz_edges=mz_edges
+    )
+    outputs = [npz_path]
+    if len(intensity):
+        png_path = f"{output_base}_preview.png"
+        write_png(png_path, render(intensity))
+        outputs.append(png_path)
+    logger.info(
+        f"Wrote a {len(intensity)} x {heatmap.mz_bins} preview of "
+        f"{heatmap.spectra} MS1 spectra to {output_base}_preview.*"
+    )
+    return outputs
+
+
+def write_preview(
+    mzml_path: str,
+    output_base: str | None = None,
+    rt_bins: int = RT_BINS,
+    mz_bins: int = MZ_BINS,
+    mz_range: Sequence[float] = MZ_RANGE,
+    workers: int = mzml.DEFAULT_WORKERS,
+) -> list[str]:
+    """
+    Write the retention time by m/z heatmap of an mzML file.
+
+    Args:
+        mzml_path: Path to the mzML file.
+        output_base: Output path without suffix, the mzML path without its
+            extension by default.
+        rt_bins: Number of retention time rows.
+        mz_bins: Number of m/z columns.
+        mz_range: The m/z range of the columns.
+        workers: Number of decoding threads.
+
+    Returns:
+        The paths of the .npz array and, unless there were no MS1 spectra,
+        the PNG image.
+    """
+    heatmap = Heatmap(rt_bins, mz_bins, mz_range)
+    # Only MS1 spectra are decoded
+    for spectrum in mzml.iter_spectra(
+        mzml_path, workers=workers, select=lambda s: s.ms_level in (1, None)
+    ):
+        heatmap.add_spectrum(spectrum)
+    if output_base is None:
+        output_base = compression.splitext(mzml_path)[0]
+    return save(heatmap, output_base)
@@ -0,0 +1,92 @@
+"""
+Conversion progress tracking shared by the GUI queue and batch tools.
+"""
+
+import re
+import time
+
+# msconvert -v prints e.g. "writing spectra: 1200/4500" (updated with "\r")
+PROGRESS_RE = re.compile(
+    r"(?P<stage>[A-Za-z][A-Za-z ]*?):\s*(?P<done>\d+)/(?P<total>\d+)"
+)
+
+
+def parse_progress(line: str) -> float | None:
+    """
+    Parse a line of msconvert output into a completion fraction.
+
+    Only the spectrum writing stage is reported, since it accounts for almost
+    all of the conversion time.
+
+    Args:
+        line: A line of msconvert output.
+
+    Returns:
+        Fraction between 0 and 1, or None if the line carries no progress.
+    """
+    match = None
+    for match in PROGRESS_RE.finditer(line):
+        pass
+    if match is None or "spectr" not in match.group("stage").lower():
+        return None
+    total = int(match.group("total"))
+    if total == 0:
+        return None
+    return min(int(match.group("done")) / total, 1.0)
+
+
+class ThroughputMeter:
+    """
+    Track completed conversions to report throughput and an ETA for the rest
+    of a queue.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.started = clock()
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    def record(self, duration: float) -> None:
+        """
+        Record one finished conversion that took duration seconds.
+        """
+        self.completed += 1
+        self.busy_seconds += duration
+
+    def throughput(self) -> float:
+        """
+        Return completed conversions per minute since the meter started.
+        """
+        elapsed = self._clock() - self.started
+        if elapsed <= 0 or self.completed == 0:
+            return 0.0
+        return self.completed * 60.0 / elapsed
+
+    def eta(self, remaining: float, workers: int) -> float | None:
+        """
+        Estimate seconds until remaining conversions finish on workers
+        parallel workers.
+
+        Args:
+            remaining: Outstanding work in units of whole conversions; running
+                jobs can contribute their unfinished fraction.
+            workers: Number of concurrent workers.
+
+        Returns:
+            Estimated seconds, or None before any conversion has finished.
+        """
+        if self.completed == 0:
+            return None
+        mean = self.busy_seconds / self.completed
+        return remaining * mean / max(workers, 1)
+
+
+def format_duration(seconds: float | None) -> str:
+    """
+    Format a duration in seconds as H:MM:SS, or "--" if unknown.
+    """
+    if seconds is None:
+        return "--"
+    seconds = round(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
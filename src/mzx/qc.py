@@ -0,0 +1,242 @@
+"""
+Per-run quality control metrics.
+
+A QcCollector takes the spectra of a run one at a time, so it can share the
+pass that already reads the mzML (see follow.QcStage) instead of reading it
+again. Only spectrum metadata is used, never the peak arrays. For Waters
+runs, the lockmass function from _extern.inf and statistics of the analog
+channels, read through their memory maps, are added. Each run gets a JSON
+record, and a row in a tab-separated table that a whole batch appends to.
+"""
+
+import json
+import os
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+import numpy as np
+from loguru import logger
+
+from . import compression, mzml
+
+# Columns of the batch table, in order
+TABLE_COLUMNS = [
+    "run",
+    "spectra",
+    "ms1",
+    "ms2",
+    "rt_start",
+    "rt_end",
+    "rt_span",
+    "scan_rate",
+    "ms1_cycle_time",
+    "tic_median",
+    "tic_cv",
+    "lockmass",
+    "pressure_min",
+    "pressure_max",
+    "pressure_mean",
+    "pressure_sd",
+    "mzml",
+]
+
+
+class QcCollector:
+    """
+    Streaming spectrum metrics of one run. Times are in seconds.
+    """
+
+    def __init__(self) -> None:
+        self.spectra = 0
+        self.levels: dict[int, int] = {}
+        self.rt_start: float | None = None
+        self.rt_end: float | None = None
+        self.ms1_times = array("d")
+        self.ms1_tics = array("d")
+
+    def feed(self, spectrum: mzml.Spectrum) -> None:
+        self.spectra += 1
+        level = spectrum.ms_level or 0
+        self.levels[level] = self.levels.get(level, 0) + 1
+        rt = spectrum.rt
+        if rt is not None:
+            self.rt_start = rt if self.rt_start is None else min(self.rt_start, rt)
+            self.rt_end = rt if self.rt_end is None else max(self.rt_end, rt)
+            if level == 1:
+                self.ms1_times.append(rt)
+                # A missing TIC is unknown, not zero
+                if spectrum.tic is not None:
+                    self.ms1_tics.append(spectrum.tic)
+
+    def metrics(self) -> dict:
+        span = None
+        scan_rate = None
+        if self.rt_start is not None and self.rt_end is not None:
+            span = self.rt_end - self.rt_start
+            scan_rate = (self.spectra - 1) / span if span > 0 else None
+        times = np.frombuffer(self.ms1_times, dtype=np.float64)
+        tics = np.frombuffer(self.ms1_tics, dtype=np.float64)
+        cycle = float(np.median(np.diff(times))) if len(times) > 1 else None
+        mean = float(tics.mean()) if len(tics) else None
+        return {
+            "spectra": self.spectra,
+            "ms_levels": {str(k): v for k, v in sorted(self.levels.items())},
+            "ms1": self.levels.get(1, 0),
+            "ms2": self.levels.get(2, 0),
+            "rt_start": self.rt_start,
+            "rt_end": self.rt_end,
+            "rt_span": span,
+            "scan_rate": scan_rate,
+            "ms1_cycle_time": cycle,
+            "tic_median": float(np.median(tics)) if len(tics) else None,
+            "tic_cv": float(tics.std() / mean) if mean else None,
+        }
+
+
+def channel_stats(values: np.ndarray) -> dict:
+    return {
+        "samples": len(values),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean(dtype=np.float64)),
+        "sd": float(values.std(dtype=np.float64)),
+    }
+
+
+def waters_metrics(raw_dir: str) -> dict:
+    """
+    Lockmass and analog channel metrics of a Waters .raw directory.
+
+    Returns:
+        "lockmass" (the reference function, e.g. "_FUNC003", or None),
+        "lockmass_present" (whether its data file exists) and "analog",
+        statistics with unit and kind of each non-empty analog channel.
+    """
+    from . import analog
+    from .waters import raw_directory
+
+    raw = raw_directory(raw_dir)
+    lockmass = raw.lockmass_function
+    channels = {}
+    store = analog.channel_store(raw_dir)
+    for channel in store.channels:
+        samples = store.samples(channel.number)
+        if samples is None:
+            continue
+        kind, _ = analog.channel_kind(channel.unit)
+        channels[channel.name] = {
+            "unit": channel.unit,
+            "pressure": kind == mzml.PRESSURE_CHROMATOGRAM,
+            **channel_stats(samples["intensity"]),
+        }
+    return {
+        "lockmass": lockmass[0] if lockmass else None,
+        "lockmass_present": lockmass is not None and lockmass[1] in raw.function_files,
+        "analog": channels,
+    }
+
+
+def report(collector: QcCollector, mzml_path: str, raw_dir: str | None = None) -> dict:
+    """
+    The QC record of a run from its collected spectrum metrics.
+    """
+    record = {
+        "run": os.path.basename(compression.splitext(mzml_path)[0]),
+        "mzml": os.path.abspath(mzml_path),
+        "raw": os.path.abspath(raw_dir) if raw_dir else None,
+        "created": time.time(),
+        **collector.metrics(),
+    }
+    if raw_dir is not None:
+        try:
+            record.update(waters_metrics(raw_dir))
+        except OSError as e:
+            logger.warning(f"No Waters QC metrics for {raw_dir}: {e}")
+    return record
+
+
+def table_row(record: dict) -> dict:
+    """
+    The batch table columns of a record; the pressure columns come from the
+    first pressure channel.
+    """
+    row = {column: record.get(column) for column in TABLE_COLUMNS}
+    pressures = [c for c in record.get("analog", {}).values() if c["pressure"]]
+    if pressures:
+        for stat in ("min", "max", "mean", "sd"):
+            row[f"pressure_{stat}"] = pressures[0][stat]
+    return row
+
+
+def append_table(path: str, record: dict) -> None:
+    """
+    Append the row of a record to a batch table, writing the header first
+    if the table is new. The table is locked while the header is checked
+    and the row written, so the tasks of a batch can share one table.
+    """
+    row = table_row(record)
+    line = "\t".join("" if row[c] is None else str(row[c]) for c in TABLE_COLUMNS)
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            if f.seek(0, os.SEEK_END) == 0:
+                f.write("\t".join(TABLE_COLUMNS) + "\n")
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save(record: dict, output_json: str, table: str | None = None) -> str:
+    """
+    Write a QC record to JSON and optionally append it to a batch table.
+
+    Returns:
+        The path of the JSON file.
+    """
+    with open(output_json, "w") as f:
+        json.dump(record, f, indent=2)
+    if table is not None:
+        append_table(table, record)
+    logger.info(
+        f"QC of {record['run']}: {record['spectra']} spectra, "
+        f"{record['ms1']} MS1, {record['ms2']} MS2 -> {output_json}"
+    )
+    return output_json
+
+
+def qc_path(mzml_path: str) -> str:
+    return f"{compression.splitext(mzml_path)[0]}_qc.json"
+
+
+def run_qc(
+    mzml_path: str,
+    raw_dir: str | None = None,
+    table: str | None = None,
+    workers: int = mzml.DEFAULT_WORKERS,
+) -> str:
+    """
+    Compute the QC record of an mzML file in one pass over its spectra and
+    write it to {mzml_base}_qc.json.
+
+    Args:
+        mzml_path: Path to the mzML file.
+        raw_dir: The Waters .raw directory it was converted from, if any.
+        table: Batch table to append the record to.
+        workers: Number of parsing threads.
+
+    Returns:
+        The path of the JSON file.
+    """
+    collector = QcCollector()
+    for spectrum in mzml.iter_spectra(mzml_path, decode=False, workers=workers):
+        collector.feed(spectrum)
+    return save(report(collector, mzml_path, raw_dir), qc_path(mzml_path), table)
@@ -0,0 +1,768 @@
+"""
+Local HTTP conversion service.
+
+``mzx serve`` runs one long-lived process per host that accepts conversion
+and chromatogram jobs over a small JSON API, keeps them in a SQLite queue
+that survives restarts, and runs them on a fixed pool of workers, so the
+number of concurrent msconvert containers is decided in one place instead of
+by every caller.
+
+API:
+
+- ``POST /jobs`` with ``{"kind": "convert" | "chromatograms", "params": {...}}``
+  queues a job and returns it.
+- ``GET /jobs`` lists jobs, optionally ``?state=queued``.
+- ``GET /jobs/<id>`` returns the state, progress, error and artifacts.
+- ``DELETE /jobs/<id>`` cancels a queued or running job.
+- ``GET /jobs/<id>/log?offset=N`` returns the job log from byte N; the next
+  offset is in the ``X-Log-Offset`` header. With ``follow=1`` the response
+  streams until the job has finished.
+- ``GET /jobs/<id>/artifacts/<name>`` downloads an output file.
+- ``GET /health`` reports the worker count and queue length.
+"""
+
+import functools
+import json
+import os
+import re
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import cast, get_args
+from urllib.parse import parse_qs, urlsplit
+
+from loguru import logger
+
+from . import (
+    RawFileConversionError,
+    compression,
+    convert_raw_file,
+    export_chromatograms,
+    extract_tic_from_mzml,
+    get_chromatogram_info,
+    progress,
+    staging,
+    supervisor,
+    types,
+    vendor,
+    verify,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    progress REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    artifacts TEXT NOT NULL DEFAULT '[]',
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+JOB_KINDS = ("convert", "chromatograms")
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+DEFAULT_PORT = 8765
+# Seconds an idle worker waits before checking the queue again
+POLL_INTERVAL = 1.0
+# Seconds between reads of a followed log
+FOLLOW_INTERVAL = 0.5
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {message}"
+
+# Conversion options of a job, as in the mzx command line defaults
+DEFAULT_PARAMS: dict = {
+    "type": "mzml",
+    "index": False,
+    "sortbyscan": False,
+    "peak_picking": "msms",
+    "remove_zeros": True,
+    "vendor": None,
+    "outfile": None,
+    "overwrite": False,
+    "debug": False,
+    "verbose": True,
+    "lockmass_disabled": False,
+    "lockmass": False,
+    "neg_lockmass": 554.2615,
+    "pos_lockmass": 556.2771,
+    "lockmass_tolerance": 0.1,
+    "lockmass_function_exclude": None,
+    "verify": True,
+}
+
+NUMBER = (int, float)
+NONE = type(None)
+# Accepted JSON types of each job parameter besides infile; bool is excluded
+# where only numbers are accepted
+PARAM_TYPES: dict[str, tuple[type, ...]] = {
+    "type": (str,),
+    "index": (bool,),
+    "sortbyscan": (bool,),
+    "peak_picking": (str,),
+    "remove_zeros": (bool,),
+    "vendor": (str, NONE),
+    "outfile": (str, NONE),
+    "overwrite": (bool,),
+    "debug": (bool,),
+    "verbose": (bool,),
+    "lockmass_disabled": (bool,),
+    "lockmass": (bool,),
+    "neg_lockmass": (*NUMBER, NONE),
+    "pos_lockmass": (*NUMBER, NONE),
+    "lockmass_tolerance": (*NUMBER, NONE),
+    "lockmass_function_exclude": (int, NONE),
+    "verify": (bool,),
+    "decimation": (str, NONE),
+    "points": (int,),
+}
+PARAM_CHOICES: dict[str, tuple[str, ...]] = {
+    "type": get_args(types.TOutputType),
+    "peak_picking": get_args(types.TPeakPicking),
+    "vendor": tuple(name for t in get_args(types.TVendor) for name in get_args(t)),
+    "decimation": ("lttb", "minmax"),
+}
+
+JOB_PATH_RE = re.compile(r"^/jobs/(\d+)(?:/(log|artifacts)(?:/([^/]+))?)?$")
+
+
+class JobError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    params: dict
+    state: str
+    created: float
+    progress: float | None = None
+    started: float | None = None
+    finished: float | None = None
+    artifacts: list[str] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["artifacts"] = [os.path.basename(a) for a in self.artifacts]
+        return data
+
+
+class JobQueue:
+    """
+    Jobs stored in a SQLite database, oldest first.
+
+    The connection is shared by the HTTP and worker threads behind a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self.db.close()
+
+    def _job(self, row: sqlite3.Row) -> Job:
+        data = dict(row)
+        data["params"] = json.loads(data["params"])
+        data["artifacts"] = json.loads(data["artifacts"])
+        return Job(**data)
+
+    def submit(self, kind: str, params: dict) -> Job:
+        with self._lock, self.db:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (kind, params, state, created) "
+                "VALUES (?, ?, 'queued', ?)",
+                (kind, json.dumps(params), time.time()),
+            )
+        job = self.get(cast(int, cursor.lastrowid))
+        assert job is not None
+        return job
+
+    def get(self, job_id: int) -> Job | None:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._job(row) if row is not None else None
+
+    def jobs(self, state: str | None = None, limit: int = 100) -> list[Job]:
+        sql = "SELECT * FROM jobs"
+        args: list = []
+        if state is not None:
+            sql += " WHERE state = ?"
+            args.append(state)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self.db.execute(sql, args).fetchall()
+        return [self._job(row) for row in rows]
+
+    def queued(self, limit: int = 1) -> list[Job]:
+        """
+        Return the queued jobs in the order they will be claimed.
+        """
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def state(self, job_id: int) -> str | None:
+        job = self.get(job_id)
+        return job.state if job is not None else None
+
+    def count(self, state: str) -> int:
+        with self._lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)
+            ).fetchone()[0]
+
+    def claim(self) -> Job | None:
+        """
+        Mark the oldest queued job as running and return it.
+
+        The job is selected and updated in one write transaction, so two
+        services sharing the database never claim the same job. (UPDATE ...
+        RETURNING would need SQLite 3.35, newer than some Python builds.)
+        """
+        with self._lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT id FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET state = 'running', started = ?, progress = 0 "
+                "WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (row["id"],)
+            ).fetchone()
+        return self._job(row)
+
+    def recover(self) -> int:
+        """
+        Queue again the jobs that were running when the service stopped.
+        """
+        with self._lock, self.db:
+            cursor = self.db.execute(
+                "UPDATE jobs SET state = 'queued', started = NULL, progress = NULL "
+                "WHERE state = 'running'"
+            )
+        return cursor.rowcount
+
+    def set_progress(self, job_id: int, fraction: float) -> None:
+        with self._lock, self.db:
+            self.db.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ? AND state = 'running'",
+                (fraction, job_id),
+            )
+
+    def finish(
+        self, job_id: int, artifacts: list[str], error: str | None = None
+    ) -> None:
+        """
+        Record the outcome of a running job; a job cancelled meanwhile stays
+        cancelled.
+        """
+        with self._lock, self.db:
+            self.db.execute(
+                "UPDATE jobs SET state = ?, finished = ?, artifacts = ?, error = ?, "
+                "progress = CASE WHEN ? IS NULL THEN 1 ELSE progress END "
+                "WHERE id = ? AND state = 'running'",
+                (
+                    "failed" if error else "done",
+                    time.time(),
+                    json.dumps(artifacts),
+                    error,
+                    error,
+                    job_id,
+                ),
+            )
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued or running job. Returns False if it had finished.
+        """
+        with self._lock, self.db:
+            cursor = self.db.execute(
+                "UPDATE jobs SET state = 'cancelled', finished = ? "
+                "WHERE id = ? AND state IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+        return cursor.rowcount > 0
+
+
+def fake_runner(
+    cmd: str, on_start: Callable | None = None, on_line: Callable | None = None
+) -> str:
+    """
+    Stand-in for run_cmd that writes an empty output file instead of
+    running msconvert, for testing the service without Docker.
+    """
+    args = shlex.split(cmd)
+    directory = args[args.index("-v") + 1].rsplit(":", 1)[0]
+    outfile = args[args.index("--outfile") + 1].removeprefix("/data/")
+    name = os.path.splitext(outfile)[0]
+    output = ""
+    for i in range(1, 3):
+        line = f"writing spectra: {i}/2\n"
+        logger.info(line.strip())
+        if on_line is not None:
+            on_line(line)
+        output += line
+    with open(os.path.join(directory, outfile), "w") as f:
+        if outfile.endswith(".mzML"):
+            f.write(
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<mzML xmlns="http://psi.hupo.org/ms/mzml" version="1.1.0">\n'
+                f'  <run id="{name}">\n'
+                '    <spectrumList count="0">\n'
+                "    </spectrumList>\n"
+                "  </run>\n"
+                "</mzML>\n"
+            )
+    return output
+
+
+def conversion_params(options: dict) -> types.TConfig:
+    """
+    Complete the conversion options of a job with the defaults and the
+    vendor of the input.
+    """
+    params = {**DEFAULT_PARAMS, **options}
+    params.pop("verify")
+    if params["vendor"] is None:
+        params["vendor"] = vendor.vendor_name_from_file(params["infile"])
+    return cast(types.TConfig, params)
+
+
+def validate(kind: str, params: dict) -> None:
+    """
+    Check a job before it is queued.
+
+    Raises:
+        JobError: If the kind or parameters are invalid.
+    """
+    if kind not in JOB_KINDS:
+        raise JobError(f"Unknown job kind: {kind}")
+    infile = params.get("infile")
+    if not isinstance(infile, str):
+        raise JobError("params.infile is required")
+    if not os.path.exists(infile):
+        raise JobError(f"Input does not exist: {infile}")
+    unknown = set(params) - set(PARAM_TYPES) - {"infile"}
+    if unknown:
+        raise JobError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    for name, value in params.items():
+        if name == "infile":
+            continue
+        allowed = PARAM_TYPES[name]
+        if not isinstance(value, allowed) or (
+            isinstance(value, bool) and bool not in allowed
+        ):
+            raise JobError(f"Invalid params.{name}: {value!r}")
+        choices = PARAM_CHOICES.get(name, ())
+        if choices and value is not None and value not in choices:
+            raise JobError(
+                f"Invalid params.{name}: {value!r}, expected one of "
+                f"{', '.join(choices)}"
+            )
+    minimum = 3 if params.get("decimation") == "lttb" else 1
+    if params.get("points", 2000) < minimum:
+        raise JobError(f"params.points must be at least {minimum}")
+
+
+class ConversionService:
+    """
+    The job queue and worker pool behind ``mzx serve``.
+
+    Args:
+        root: Directory holding the job database and job logs.
+        workers: Number of jobs run at once, i.e. the maximum number of
+            concurrent msconvert containers.
+        runner: Runs msconvert commands, a supervisor.Supervisor with limits
+            scaled to each input by default; see fake_runner.
+        scratch: Local directory to stage conversion inputs in; the input of
+            the next queued job is copied there while a job converts.
+        scratch_budget: Maximum size of the scratch directory in bytes.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        workers: int = 2,
+        runner: Callable | None = None,
+        scratch: str | None = None,
+        scratch_budget: int | None = None,
+    ):
+        self.root = root
+        self.workers = workers
+        self.runner = runner
+        self.area = (
+            staging.StagingArea(scratch, budget_bytes=scratch_budget)
+            if scratch is not None
+            else None
+        )
+        os.makedirs(os.path.join(root, "logs"), exist_ok=True)
+        self.queue = JobQueue(os.path.join(root, "jobs.db"))
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"Requeued {recovered} interrupted job(s)")
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._procs: dict[int, subprocess.Popen] = {}
+
+    def start(self) -> None:
+        for n in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"mzx-worker-{n}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop taking jobs and wait for running jobs to finish.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.queue.close()
+        if self.area is not None:
+            self.area.close()
+
+    def submit(self, kind: str, params: dict) -> Job:
+        validate(kind, params)
+        job = self.queue.submit(kind, params)
+        logger.info(f"Queued {kind} job {job.id}: {params['infile']}")
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        cancelled = self.queue.cancel(job_id)
+        proc = self._procs.get(job_id)
+        if cancelled and proc is not None and proc.poll() is None:
+            # The docker client forwards the signal to the container
+            proc.terminate()
+        return cancelled
+
+    def log_path(self, job_id: int) -> str:
+        return os.path.join(self.root, "logs", f"{job_id}.log")
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        sink = logger.add(
+            self.log_path(job.id),
+            format=LOG_FORMAT,
+            filter=lambda record: record["extra"].get("job") == job.id,
+        )
+        started = time.monotonic()
+        try:
+            with logger.contextualize(job=job.id):
+                try:
+                    artifacts = self._execute(job)
+                except (
+                    JobError,
+                    RawFileConversionError,
+                    supervisor.CommandError,
+                    verify.VerificationError,
+                    subprocess.CalledProcessError,
+                    OSError,
+                ) as e:
+                    logger.error(f"Job {job.id} failed: {e}")
+                    self.queue.finish(job.id, [], error=str(e) or type(e).__name__)
+                # Anything else is a bug; log its traceback and keep the
+                # worker running for the next job
+                except Exception as e:  # noqa: BLE001
+                    logger.exception(f"Job {job.id} failed unexpectedly: {e}")
+                    self.queue.finish(job.id, [], error=str(e) or type(e).__name__)
+                else:
+                    elapsed = time.monotonic() - started
+                    logger.info(f"Job {job.id} finished in {elapsed:.1f} s")
+                    self.queue.finish(job.id, artifacts)
+        finally:
+            self._procs.pop(job.id, None)
+            logger.remove(sink)
+
+    def _execute(self, job: Job) -> list[str]:
+        options = job.params
+        if job.kind == "chromatograms":
+            return chromatogram_job(options)
+
+        last = [0.0]
+
+        def on_start(proc: subprocess.Popen) -> None:
+            self._procs[job.id] = proc
+            if self.queue.state(job.id) == "cancelled":
+                proc.terminate()
+
+        def on_line(line: str) -> None:
+            fraction = progress.parse_progress(line)
+            if fraction is not None and fraction - last[0] >= 0.01:
+                last[0] = fraction
+                self.queue.set_progress(job.id, fraction)
+
+        params = conversion_params(options)
+        base = self.runner or supervisor.Supervisor(
+            supervisor.Limits.for_input(params["infile"])
+        )
+        runner = functools.partial(base, on_start=on_start, on_line=on_line)
+        upcoming = [
+            j.params["infile"] for j in self.queue.queued() if j.kind == "convert"
+        ]
+        with staging.staged(self.area, options["infile"], upcoming) as local:
+            params["infile"] = local
+            outfile = convert_raw_file(params, runner=runner)
+            if local != options["infile"]:
+                outfile = staging.publish(
+                    outfile, staging.output_dir_for(options["infile"])
+                )
+        if self.queue.state(job.id) == "cancelled":
+            raise JobError("Cancelled")
+        if params["type"] == "mzml" and options.get("verify", True):
+            verify.check_output(outfile)
+        return [outfile]
+
+
+def chromatogram_job(options: dict) -> list[str]:
+    """
+    Export the analog channels of a Waters run, or the TIC of an mzML file,
+    to CSV.
+    """
+    infile = options["infile"]
+    decimation = options.get("decimation")
+    points = options.get("points", 2000)
+    if compression.splitext(infile)[1].lower() in (".mzml", ".mzml.gz"):
+        return [
+            extract_tic_from_mzml(
+                infile, decimation=decimation, decimation_points=points
+            )
+        ]
+    if vendor.vendor_name_from_file(infile) != "waters":
+        raise JobError("Chromatograms need a Waters .raw directory or an mzML file")
+    chrom_info = get_chromatogram_info(infile)
+    if not chrom_info:
+        raise JobError("No chromatogram metadata found in Waters file")
+    return export_chromatograms(
+        infile, chrom_info, decimation=decimation, decimation_points=points
+    )
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: ConversionService
+
+    def log_message(self, format: str, *args: object) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, data: object, status: HTTPStatus = HTTPStatus.OK) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: HTTPStatus, message: str) -> None:
+        self._send_json({"error": message}, status)
+
+    def _job(self, job_id: str) -> Job | None:
+        job = self.service.queue.get(int(job_id))
+        if job is None:
+            self._error(HTTPStatus.NOT_FOUND, f"No job {job_id}")
+        return job
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == "/health":
+            self._send_json(
+                {
+                    "workers": self.service.workers,
+                    "queued": self.service.queue.count("queued"),
+                    "running": self.service.queue.count("running"),
+                }
+            )
+            return
+        if url.path == "/jobs":
+            jobs = self.service.queue.jobs(query.get("state"))
+            self._send_json([job.to_dict() for job in jobs])
+            return
+        match = JOB_PATH_RE.match(url.path)
+        if match is None:
+            self._error(HTTPStatus.NOT_FOUND, f"No route {url.path}")
+            return
+        job = self._job(match.group(1))
+        if job is None:
+            return
+        if match.group(2) is None:
+            self._send_json(job.to_dict())
+        elif match.group(2) == "log":
+            offset = int(query.get("offset", 0))
+            if query.get("follow") in ("1", "true"):
+                self._follow_log(job, offset)
+            else:
+                self._send_log(job, offset)
+        elif match.group(3) is None:
+            self._send_json(job.to_dict()["artifacts"])
+        else:
+            self._send_artifact(job, match.group(3))
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/jobs":
+            self._error(HTTPStatus.NOT_FOUND, f"No route {self.path}")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.service.submit(
+                request.get("kind", "convert"), request.get("params", {})
+            )
+        except (ValueError, AttributeError, JobError) as e:
+            self._error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        self._send_json(job.to_dict(), HTTPStatus.CREATED)
+
+    def do_DELETE(self) -> None:
+        match = JOB_PATH_RE.match(urlsplit(self.path).path)
+        if match is None or match.group(2) is not None:
+            self._error(HTTPStatus.NOT_FOUND, f"No route {self.path}")
+            return
+        job = self._job(match.group(1))
+        if job is None:
+            return
+        if not self.service.cancel(job.id):
+            self._error(HTTPStatus.CONFLICT, f"Job {job.id} has finished")
+            return
+        self._send_json({"id": job.id, "state": "cancelled"})
+
+    def _read_log(self, job_id: int, offset: int) -> bytes:
+        try:
+            with open(self.service.log_path(job_id), "rb") as f:
+                f.seek(offset)
+                return f.read()
+        except FileNotFoundError:
+            return b""
+
+    def _send_log(self, job: Job, offset: int) -> None:
+        data = self._read_log(job.id, offset)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Log-Offset", str(offset + len(data)))
+        self.send_header("X-Job-State", job.state)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _follow_log(self, job: Job, offset: int) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        while True:
+            finished = job.is_finished
+            data = self._read_log(job.id, offset)
+            if data:
+                offset += len(data)
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            if finished:
+                break
+            time.sleep(FOLLOW_INTERVAL)
+            job = self.service.queue.get(job.id) or job
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_artifact(self, job: Job, name: str) -> None:
+        paths = [a for a in job.artifacts if os.path.basename(a) == name]
+        if not paths or not os.path.isfile(paths[0]):
+            self._error(HTTPStatus.NOT_FOUND, f"No artifact {name}")
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(paths[0])))
+        self.end_headers()
+        with open(paths[0], "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+
+def make_server(
+    service: ConversionService, host: str = "127.0.0.1", port: int = DEFAULT_PORT
+) -> ThreadingHTTPServer:
+    """
+    Create the HTTP server of a service; port 0 picks a free port.
+    """
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    root: str,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    workers: int = 2,
+    runner: Callable | None = None,
+    scratch: str | None = None,
+    scratch_budget: int | None = None,
+) -> None:
+    """
+    Run the conversion service until interrupted.
+    """
+    service = ConversionService(
+        root,
+        workers=workers,
+        runner=runner,
+        scratch=scratch,
+        scratch_budget=scratch_budget,
+    )
+    server = make_server(service, host, port)
+    service.start()
+    logger.info(
+        f"Serving on http://{host}:{server.server_address[1]} with "
+        f"{workers} worker(s), jobs in {root}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
@@ -0,0 +1,371 @@
+"""
+Local scratch staging for inputs that live on network storage.
+
+Vendor readers running under Wine issue many small random reads, which are
+very slow over SMB/NFS. A StagingArea copies each input to local scratch
+(in parallel and checksummed for directory-based formats such as Waters
+``.raw`` and Bruker ``.d``), the conversion runs against the local copy and
+the outputs are moved back next to the original input with an atomic rename.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class StagingError(Exception):
+    pass
+
+
+def file_checksum(path: str) -> str:
+    """
+    Return the BLAKE2b hex digest of a file.
+    """
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_file(src: str, dst: str) -> int:
+    """
+    Copy a single file, checksumming the source as it is read and verifying
+    the written copy against it.
+
+    Args:
+        src: Source file path.
+        dst: Destination file path.
+
+    Returns:
+        Number of bytes copied.
+
+    Raises:
+        StagingError: If the copy does not match the source.
+    """
+    h = hashlib.blake2b()
+    size = 0
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while chunk := fin.read(CHUNK_SIZE):
+            h.update(chunk)
+            fout.write(chunk)
+            size += len(chunk)
+    shutil.copystat(src, dst)
+    if file_checksum(dst) != h.hexdigest():
+        raise StagingError(f"Checksum mismatch while staging {src}")
+    return size
+
+
+def copy_tree(src: str, dst: str, workers: int = 8) -> int:
+    """
+    Copy a file or directory tree, copying individual files on a thread pool.
+
+    Args:
+        src: Source file or directory.
+        dst: Destination path (must not exist).
+        workers: Number of concurrent file copies.
+
+    Returns:
+        Total number of bytes copied.
+    """
+    if not os.path.isdir(src):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        return copy_file(src, dst)
+
+    jobs = []
+    for root, _dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            jobs.append((os.path.join(root, name), os.path.join(target, name)))
+
+    # Largest files first so one big function file does not finish last
+    jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(lambda job: copy_file(*job), jobs))
+
+
+def disk_usage(path: str) -> int:
+    """
+    Return the total size in bytes of a file or directory tree.
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def publish(src: str, dest_dir: str) -> str:
+    """
+    Move a file from scratch into dest_dir so that it appears atomically.
+
+    The file is first copied next to its final name under a temporary name
+    and then renamed over it, so readers of dest_dir never see a partial file.
+
+    Args:
+        src: File in the staging area.
+        dest_dir: Destination directory.
+
+    Returns:
+        Final path of the published file.
+    """
+    final = os.path.join(dest_dir, os.path.basename(src))
+    partial = os.path.join(dest_dir, f".{os.path.basename(src)}.{uuid.uuid4().hex}")
+    try:
+        shutil.copyfile(src, partial)
+        os.replace(partial, final)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    os.remove(src)
+    logger.info(f"Published {final}")
+    return final
+
+
+class StagingArea:
+    """
+    A scratch directory holding local copies of conversion inputs.
+
+    Each staged input gets its own job directory, so the conversion container
+    only sees that input and writes its output next to it. Inputs can be
+    prefetched in the background while another job converts, and staged
+    inputs that are no longer in use are evicted (least recently used first)
+    to keep the scratch directory within budget_bytes.
+    """
+
+    def __init__(
+        self,
+        scratch_dir: str,
+        budget_bytes: int | None = None,
+        workers: int = 8,
+    ):
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        self.budget_bytes = budget_bytes
+        self.workers = workers
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._prefetcher = ThreadPoolExecutor(max_workers=1)
+
+    def __enter__(self) -> "Self":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def _key(self, infile: str) -> str:
+        path = os.path.abspath(infile)
+        return hashlib.sha1(path.encode()).hexdigest()[:16]
+
+    def _job_dir(self, infile: str) -> str:
+        return os.path.join(self.scratch_dir, self._key(infile))
+
+    def _copy(self, infile: str) -> str:
+        src = os.path.abspath(infile)
+        job_dir = self._job_dir(infile)
+        dst = os.path.join(job_dir, os.path.basename(src))
+        size = disk_usage(src)
+        if self.budget_bytes is not None and size > self.budget_bytes:
+            raise StagingError(
+                f"{infile} ({size} bytes) does not fit the scratch budget "
+                f"({self.budget_bytes} bytes)"
+            )
+        self.cleanup(reserve=size)
+
+        if os.path.exists(job_dir):
+            shutil.rmtree(job_dir)
+        start = time.monotonic()
+        copied = copy_tree(src, dst, workers=self.workers)
+        elapsed = time.monotonic() - start
+        logger.info(
+            f"Staged {infile} to {dst} ({copied / 1e6:.1f} MB in {elapsed:.1f} s)"
+        )
+        return dst
+
+    def _entry(self, infile: str) -> dict:
+        key = self._key(infile)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = {
+                    "future": None,
+                    "in_use": False,
+                    "last_used": time.monotonic(),
+                }
+            return self._entries[key]
+
+    def prefetch(self, infile: str) -> Future:
+        """
+        Start copying infile to scratch in the background.
+        """
+        entry = self._entry(infile)
+        with self._lock:
+            entry["in_use"] = True
+            if entry["future"] is None:
+                logger.info(f"Prefetching {infile}")
+                entry["future"] = self._prefetcher.submit(self._copy, infile)
+            return entry["future"]
+
+    def stage(self, infile: str) -> str:
+        """
+        Return the local copy of infile, copying it first if it was not
+        prefetched.
+
+        Raises:
+            StagingError: If the input cannot be staged within the budget or
+                a copied file fails verification.
+        """
+        entry = self._entry(infile)
+        with self._lock:
+            future = entry["future"]
+            entry["in_use"] = True
+            entry["last_used"] = time.monotonic()
+        try:
+            if future is not None:
+                return future.result()
+            staged = self._copy(infile)
+        except Exception:
+            self.release(infile)
+            raise
+        with self._lock:
+            f: Future = Future()
+            f.set_result(staged)
+            entry["future"] = f
+        return staged
+
+    def publish(self, staged_output: str, dest_dir: str) -> str:
+        """
+        Move a conversion output from scratch to dest_dir atomically.
+        """
+        return publish(staged_output, dest_dir)
+
+    def release(self, infile: str, remove: bool = False) -> None:
+        """
+        Mark a staged input as no longer in use, optionally deleting it.
+        """
+        key = self._key(infile)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["in_use"] = False
+                entry["last_used"] = time.monotonic()
+            if remove:
+                self._entries.pop(key, None)
+        if remove:
+            shutil.rmtree(self._job_dir(infile), ignore_errors=True)
+
+    def cleanup(self, reserve: int = 0) -> None:
+        """
+        Evict idle staged inputs until reserve more bytes fit in the budget.
+        """
+        if self.budget_bytes is None:
+            return
+        with self._lock:
+            idle = sorted(
+                (
+                    (entry["last_used"], key)
+                    for key, entry in self._entries.items()
+                    if not entry["in_use"]
+                    and entry["future"] is not None
+                    and entry["future"].done()
+                ),
+            )
+        used = disk_usage(self.scratch_dir)
+        for _last_used, key in idle:
+            if used + reserve <= self.budget_bytes:
+                break
+            job_dir = os.path.join(self.scratch_dir, key)
+            freed = disk_usage(job_dir)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            with self._lock:
+                self._entries.pop(key, None)
+            used -= freed
+            logger.info(f"Evicted {job_dir} from scratch ({freed / 1e6:.1f} MB)")
+        if used + reserve > self.budget_bytes:
+            logger.warning(
+                f"Scratch directory {self.scratch_dir} exceeds its budget "
+                f"({used + reserve} > {self.budget_bytes} bytes)"
+            )
+
+    def close(self) -> None:
+        """
+        Stop prefetching and remove everything this area staged.
+        """
+        self._prefetcher.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+        for key in keys:
+            shutil.rmtree(os.path.join(self.scratch_dir, key), ignore_errors=True)
+
+
+@contextmanager
+def staged(
+    area: StagingArea | None, infile: str, upcoming: Iterable[str] = ()
+) -> Iterator[str]:
+    """
+    Stage infile for one conversion and prefetch the inputs converted after
+    it, so their copies overlap with this conversion.
+
+    Args:
+        area: The staging area, or None to convert in place.
+        infile: The input of this conversion.
+        upcoming: The inputs of the next conversions.
+
+    Yields:
+        The local copy of infile, or infile itself without an area or if
+        staging failed. The copy is removed when the block ends.
+    """
+    if area is None:
+        yield infile
+        return
+    for path in upcoming:
+        area.prefetch(path)
+    try:
+        local = area.stage(infile)
+    except (OSError, StagingError) as e:
+        logger.warning(f"Staging failed, converting in place: {e}")
+        local = infile
+    try:
+        yield local
+    finally:
+        area.release(infile, remove=True)
+
+
+def staged_inputs(
+    area: StagingArea | None, infiles: Iterable[str]
+) -> Iterator[tuple[str, str]]:
+    """
+    Yield (infile, staged_path) pairs, prefetching the next input while the
+    caller converts the current one. Each input is removed from scratch once
+    the caller moves on to the next.
+    """
+    paths = list(infiles)
+    for i, infile in enumerate(paths):
+        with staged(area, infile, paths[i + 1 : i + 2]) as local:
+            yield infile, local
+
+
+def output_dir_for(infile: str) -> str:
+    """
+    Return the directory msconvert would write to when converting infile in
+    place.
+    """
+    return str(Path(os.path.abspath(infile)).parent)
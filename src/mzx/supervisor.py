@@ -0,0 +1,365 @@
+"""
+Supervised execution of conversion commands.
+
+run_cmd waits for msconvert for as long as it takes, which is forever when
+Wine hangs on a corrupt file. supervise runs a command with a wall-clock
+limit and a watchdog on its output, both scaled with the size of the input,
+and on a limit, a cancel, an interrupt or SIGTERM it removes the command's
+Docker container as well as stopping the docker client, which on its own
+leaves the container running. Every job names its container with a nonce
+(see docker.container_name), so only the container it started is removed,
+never that of another job converting the same input. Containers whose
+process was killed outright are removed by the next job on the same input
+(see docker.remove_orphans).
+"""
+
+import functools
+import queue
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO
+
+from loguru import logger
+
+from . import docker
+from .staging import disk_usage
+
+# Base limits in seconds, plus an allowance per GB of input
+TIMEOUT = 900.0
+TIMEOUT_PER_GB = 3600.0
+IDLE_TIMEOUT = 600.0
+IDLE_TIMEOUT_PER_GB = 600.0
+# Seconds between the first retry and the run before it, doubled per retry
+BACKOFF = 30.0
+# Seconds a stopped process gets to exit before it is killed
+GRACE = 10.0
+# Docker daemon errors and processes killed e.g. by the OOM killer
+RETRYABLE_EXIT_CODES = {125, 137}
+
+EXITED = "exited"
+TIMED_OUT = "timeout"
+IDLE = "idle"
+CANCELLED = "cancelled"
+
+
+@dataclass(frozen=True)
+class Limits:
+    """
+    Watchdog limits of a command in seconds; None disables a limit.
+
+    timeout limits the total run time, idle_timeout the time without a line
+    of output.
+    """
+
+    timeout: float | None = None
+    idle_timeout: float | None = None
+
+    @classmethod
+    def for_input(
+        cls,
+        path: str,
+        timeout: float | None = TIMEOUT,
+        idle_timeout: float | None = IDLE_TIMEOUT,
+    ) -> "Limits":
+        """
+        Limits for converting path: the given base limits plus an allowance
+        per GB of input. A base limit of None or 0 disables the limit.
+        """
+        gigabytes = disk_usage(path) / 1e9
+        return cls(
+            timeout + TIMEOUT_PER_GB * gigabytes if timeout else None,
+            idle_timeout + IDLE_TIMEOUT_PER_GB * gigabytes if idle_timeout else None,
+        )
+
+
+@dataclass
+class RunResult:
+    """
+    The outcome of a supervised command. reason is EXITED if the command
+    ended by itself, else the limit that stopped it.
+    """
+
+    cmd: str
+    returncode: int | None
+    output: str
+    elapsed: float
+    reason: str = EXITED
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.reason == EXITED and self.returncode == 0
+
+    @property
+    def retryable(self) -> bool:
+        if self.reason == CANCELLED:
+            return False
+        return self.reason != EXITED or self.returncode in RETRYABLE_EXIT_CODES
+
+    def describe(self) -> str:
+        if self.reason == TIMED_OUT:
+            what = f"timed out after {self.elapsed:.0f} s"
+        elif self.reason == IDLE:
+            what = f"stopped after {self.elapsed:.0f} s without output"
+        elif self.reason == CANCELLED:
+            what = f"cancelled after {self.elapsed:.0f} s"
+        else:
+            what = f"exited with status {self.returncode}"
+        attempts = f" ({self.attempts} attempts)" if self.attempts > 1 else ""
+        return f"Command {what}{attempts}"
+
+
+class CommandError(Exception):
+    def __init__(self, result: RunResult):
+        super().__init__(result.describe())
+        self.result = result
+
+
+def container_of(args: list[str]) -> str | None:
+    """
+    The --name of a docker run command line, if any.
+    """
+    if len(args) < 2 or args[:2] != ["docker", "run"]:
+        return None
+    for i, arg in enumerate(args[:-1]):
+        if arg == "--name":
+            return args[i + 1]
+        if arg.startswith("--name="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+@contextmanager
+def terminate_as_exit() -> Iterator[None]:
+    """
+    Turn SIGTERM (e.g. from a batch scheduler) into SystemExit while the
+    block runs, so cleanup code gets to run. Only the main thread can handle
+    signals; elsewhere this does nothing.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handler(signum: int, frame: object) -> None:
+        sys.exit(128 + signum)
+
+    previous = signal.signal(signal.SIGTERM, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+def _pump(stream: IO[str], lines: queue.Queue) -> None:
+    for line in iter(stream.readline, ""):
+        lines.put(line)
+    lines.put(None)
+
+
+def _stop(proc: subprocess.Popen, container: str | None) -> None:
+    if container is not None and docker.remove_container(container):
+        logger.info(f"Removed container {container}")
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(GRACE)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def supervise(
+    cmd: str,
+    limits: Limits | None = None,
+    on_start: Callable[[subprocess.Popen], None] | None = None,
+    on_line: Callable[[str], None] | None = None,
+    container: str | None = None,
+    cancelled: threading.Event | None = None,
+) -> RunResult:
+    """
+    Run a command under the given limits.
+
+    Args:
+        cmd: Command line to run.
+        limits: When to stop the command, no limits by default.
+        on_start: Optional callable receiving the Popen object once the
+            process has started.
+        on_line: Optional callable receiving each line of output.
+        container: Name of the Docker container the command runs, taken
+            from the --name of a docker run command by default. It is
+            removed when the command is stopped or fails.
+        cancelled: Optional event that stops the command when set.
+
+    Returns:
+        The exit status, output and run time of the command.
+    """
+    args = shlex.split(cmd, posix=True)
+    container = container or container_of(args)
+    if limits is None:
+        limits = Limits()
+
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    lines: queue.Queue[str | None] = queue.Queue()
+    assert proc.stdout is not None
+    reader = threading.Thread(target=_pump, args=(proc.stdout, lines), daemon=True)
+    reader.start()
+    if on_start is not None:
+        on_start(proc)
+
+    output = []
+    reason = EXITED
+    last_output = started
+    try:
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                reason = CANCELLED
+                break
+            now = time.monotonic()
+            wait = 1.0
+            if limits.timeout is not None:
+                wait = min(wait, started + limits.timeout - now)
+                if wait <= 0:
+                    reason = TIMED_OUT
+                    break
+            if limits.idle_timeout is not None:
+                wait = min(wait, last_output + limits.idle_timeout - now)
+                if wait <= 0:
+                    reason = IDLE
+                    break
+            try:
+                line = lines.get(timeout=wait)
+            except queue.Empty:
+                continue
+            if line is None:
+                break
+            last_output = time.monotonic()
+            logger.info(line.rstrip())
+            if on_line is not None:
+                on_line(line)
+            output.append(line)
+        if reason != EXITED:
+            _stop(proc, container)
+        returncode = proc.wait()
+    except BaseException:
+        logger.warning("Interrupted, stopping the conversion")
+        _stop(proc, container)
+        raise
+    finally:
+        reader.join(1.0)
+        proc.stdout.close()
+    if returncode != 0 and reason == EXITED and container is not None:
+        # Stopping the docker client, e.g. to cancel, leaves the container
+        _stop(proc, container)
+
+    result = RunResult(
+        cmd, returncode, "".join(output), time.monotonic() - started, reason
+    )
+    if reason == CANCELLED:
+        logger.warning(result.describe())
+    elif not result.ok:
+        logger.error(result.describe())
+    return result
+
+
+class Supervisor:
+    """
+    A runner for convert_raw_file, in place of run_cmd, that supervises
+    each command with supervise and retries it with exponential backoff
+    after a limit was hit or a transient failure.
+
+    Args:
+        limits: Limits of each attempt, no limits by default.
+        retries: Number of retries after the first attempt.
+        backoff: Seconds before the first retry, doubled for each further
+            retry.
+    """
+
+    def __init__(
+        self,
+        limits: Limits | None = None,
+        retries: int = 1,
+        backoff: float = BACKOFF,
+    ):
+        self.limits = limits if limits is not None else Limits()
+        self.retries = retries
+        self.backoff = backoff
+        self.results: list[RunResult] = []
+        self._cancelled = threading.Event()
+
+    @property
+    def needs_output(self) -> bool:
+        """
+        Whether the idle watchdog is on, so the command has to report
+        progress to not be taken for hung.
+        """
+        return self.limits.idle_timeout is not None
+
+    def cancel(self) -> None:
+        """
+        Stop the running command, removing its container, and any retry.
+        """
+        self._cancelled.set()
+
+    def run(
+        self,
+        cmd: str,
+        on_start: Callable[[subprocess.Popen], None] | None = None,
+        on_line: Callable[[str], None] | None = None,
+    ) -> RunResult:
+        container = container_of(shlex.split(cmd, posix=True))
+        if container is not None:
+            docker.remove_orphans(container)
+        attempt = 1
+        while True:
+            with terminate_as_exit():
+                result = supervise(
+                    cmd, self.limits, on_start, on_line, cancelled=self._cancelled
+                )
+            result.attempts = attempt
+            if result.ok or not result.retryable or attempt > self.retries:
+                self.results.append(result)
+                return result
+            delay = self.backoff * 2 ** (attempt - 1)
+            logger.warning(f"{result.describe()}, retrying in {delay:.0f} s")
+            if self._cancelled.wait(delay):
+                result.reason = CANCELLED
+                self.results.append(result)
+                return result
+            attempt += 1
+
+    def __call__(
+        self,
+        cmd: str,
+        on_start: Callable[[subprocess.Popen], None] | None = None,
+        on_line: Callable[[str], None] | None = None,
+    ) -> str:
+        """
+        Run cmd like run_cmd.
+
+        Raises:
+            CommandError: If the command failed; the result is attached.
+        """
+        result = self.run(cmd, on_start, on_line)
+        if not result.ok:
+            raise CommandError(result)
+        return result.output
+
+
+def needs_output(runner: Callable | None) -> bool:
+    """
+    Whether a runner given to convert_raw_file, or a functools.partial of
+    one, is a Supervisor with an idle watchdog.
+    """
+    while isinstance(runner, functools.partial):
+        runner = runner.func
+    return isinstance(runner, Supervisor) and runner.needs_output
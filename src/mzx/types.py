@@ -9,16 +9,22 @@ TUnspecified = Literal["unspecified"]
 
 TVendor = Union[TAgilent, TBruker, TThermo, TWaters, TUnspecified]
 
+# Output formats
+TOutputType = Literal["mzml", "mgf", "mzxml"]
+
+# MS levels msconvert centroids
+TPeakPicking = Literal["off", "all", "msms", "ms1"]
+
 
 class TConfig(TypedDict):
     infile: str
     index: bool
     sortbyscan: bool
-    peak_picking: Literal["off", "all", "msms", "ms1"]
+    peak_picking: TPeakPicking
     remove_zeros: bool
     vendor: TVendor
     outfile: str | None
-    type: Literal["mzml"]
+    type: TOutputType
     overwrite: bool
     debug: bool
     verbose: bool
@@ -1,7 +1,7 @@
 import os
 from loguru import logger
 
-from . import types
+from . import types, waters
 
 
 def vendor_name_from_file(filename: str) -> types.TVendor:
@@ -17,13 +17,8 @@ def vendor_name_from_file(filename: str) -> types.TVendor:
         logger.info("Input is a directory.")
         if ".d" in filename:
             return "bruker"
-        elif ".raw" in filename:
+        elif ".raw" in filename or waters.raw_directory(filename).has_function_files:
             return "waters"
-        else:
-            files = os.listdir(filename)
-            for f in files:
-                if "_FUNC" in f:
-                    return "waters"
     else:
         logger.info("Input is a file.")
         if filename.endswith(".raw"):
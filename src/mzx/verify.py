@@ -0,0 +1,266 @@
+"""
+Integrity checks for converted mzML files.
+
+The file is memory-mapped, so checking index offsets only touches the pages
+they point at, and the SHA-1 checksum is computed over the mapping without
+copying it into Python objects. Gzip-compressed files cannot be mapped and
+are checked in a single pass over their decompressed lines instead.
+"""
+
+import hashlib
+import mmap
+import os
+import re
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+from loguru import logger
+
+from . import compression
+
+INDEX_LIST_OFFSET_RE = re.compile(rb"<indexListOffset>\s*(\d+)\s*</indexListOffset>")
+OFFSET_RE = re.compile(
+    rb'<index name="(\w+)">|<offset idRef="([^"]*)"[^>]*>(\d+)</offset>'
+)
+CHECKSUM_RE = re.compile(rb"<fileChecksum>\s*([0-9a-fA-F]+)\s*</fileChecksum>")
+SPECTRUM_LIST_RE = re.compile(rb"<spectrumList\s[^>]*count=\"(\d+)\"")
+SPECTRUM_START_RE = re.compile(rb"<spectrum[\s>]")
+INDEX_LIST_TAGS = (b"<indexList ", b"<indexList>")
+ELEMENT_TAGS = (b"<spectrum ", b"<spectrum>", b"<chromatogram ", b"<chromatogram>")
+
+# Bytes hashed per update when computing the file checksum
+HASH_BLOCK = 8 << 20
+# The header holding <spectrumList> is searched within this many bytes
+HEADER_LIMIT = 1 << 20
+# The indexListOffset element follows the index within this many bytes
+TAIL_LIMIT = 4096
+
+
+class VerificationError(Exception):
+    pass
+
+
+@dataclass
+class VerifyResult:
+    """
+    Outcome of verify_mzml. ok is True when no errors were found.
+    """
+
+    path: str
+    indexed: bool = False
+    spectra: int | None = None
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _sha1(view: memoryview, end: int) -> str:
+    sha1 = hashlib.sha1()
+    for start in range(0, end, HASH_BLOCK):
+        sha1.update(view[start : min(start + HASH_BLOCK, end)])
+    return sha1.hexdigest()
+
+
+def _check_offsets(
+    index: bytes | mmap.mmap,
+    start: int,
+    start_tag: Callable[[int], bytes],
+    result: VerifyResult,
+) -> int:
+    """
+    Check every <offset> of the index; returns the number of spectra listed.
+
+    start_tag returns the start tag of the element at an offset.
+    """
+    errors = result.errors
+    kind = ""
+    spectra = 0
+    for match in OFFSET_RE.finditer(index, start):
+        if match.group(1) is not None:
+            kind = match.group(1).decode()
+            continue
+        ref, offset = match.group(2), int(match.group(3))
+        if kind == "spectrum":
+            spectra += 1
+        tag = start_tag(offset)
+        if not tag.startswith(f"<{kind} ".encode()) or b' id="' + ref + b'"' not in tag:
+            errors.append(f"{kind} offset {offset} does not point at {ref.decode()}")
+            if len(errors) >= 10:
+                errors.append("Too many index errors, giving up")
+                break
+    return spectra
+
+
+def _check_checksum(stored: re.Match | None, actual: str, result: VerifyResult) -> None:
+    if stored is not None and actual != stored.group(1).decode().lower():
+        result.errors.append(
+            f"SHA-1 mismatch: stored {stored.group(1).decode()}, computed {actual}"
+        )
+
+
+def _verify_mapped(
+    mm: mmap.mmap, size: int, result: VerifyResult, checksum: bool
+) -> int | None:
+    """
+    Check a plain mzML file through a memory map; returns the spectrumList
+    count.
+    """
+    errors = result.errors
+    header = SPECTRUM_LIST_RE.search(mm, 0, min(size, HEADER_LIMIT))
+    expected = int(header.group(1)) if header else None
+    result.indexed = mm.find(b"<indexedmzML", 0, min(size, HEADER_LIMIT)) >= 0
+    tail = mm[max(0, size - TAIL_LIMIT) :].rstrip()
+
+    if not result.indexed:
+        if not tail.endswith(b"</mzML>"):
+            errors.append("File is truncated: no closing </mzML>")
+        result.spectra = sum(1 for _ in SPECTRUM_START_RE.finditer(mm))
+        return expected
+    if not tail.endswith(b"</indexedmzML>"):
+        errors.append("File is truncated: no closing </indexedmzML>")
+        return expected
+    match = INDEX_LIST_OFFSET_RE.search(tail)
+    if match is None:
+        errors.append("No indexListOffset")
+        return expected
+    index_offset = int(match.group(1))
+    if mm[index_offset : index_offset + 11] not in INDEX_LIST_TAGS:
+        errors.append(f"indexListOffset {index_offset} is wrong")
+        # Still check the offsets of the index that is there
+        index_offset = max(mm.rfind(b"<indexList "), 0)
+
+    def start_tag(offset: int) -> bytes:
+        end = mm.find(b">", offset, offset + HEADER_LIMIT)
+        return mm[offset:end] if end > 0 else b""
+
+    result.spectra = _check_offsets(mm, index_offset, start_tag, result)
+
+    stored = CHECKSUM_RE.search(tail)
+    if checksum and stored is not None:
+        end = mm.rfind(b"<fileChecksum>") + len(b"<fileChecksum>")
+        with memoryview(mm) as view:
+            _check_checksum(stored, _sha1(view, end), result)
+    return expected
+
+
+def _verify_stream(f: BinaryIO, result: VerifyResult, checksum: bool) -> int | None:
+    """
+    Check a compressed mzML file in one pass over its decompressed lines,
+    hashing them and remembering where each spectrum and chromatogram
+    starts; returns the spectrumList count.
+    """
+    errors = result.errors
+    sha1 = hashlib.sha1()
+    hashing = checksum
+    expected = None
+    starts: dict[int, bytes] = {}
+    spectra = 0
+    index_start = -1
+    index_lines: list[bytes] = []
+    tail = b""
+    offset = 0
+    for line in f:
+        if hashing:
+            end = line.find(b"<fileChecksum>")
+            hashing = end < 0
+            sha1.update(line if hashing else line[: end + len(b"<fileChecksum>")])
+        stripped = line.lstrip()
+        pos = offset + len(line) - len(stripped)
+        if offset < HEADER_LIMIT:
+            result.indexed = result.indexed or b"<indexedmzML" in line
+            header = SPECTRUM_LIST_RE.search(line) if expected is None else None
+            if header is not None:
+                expected = int(header.group(1))
+        if index_start < 0 and stripped.startswith(ELEMENT_TAGS):
+            spectra += stripped.startswith(b"<spectrum")
+            starts[pos] = stripped[: stripped.find(b">")]
+        elif index_start >= 0 or stripped.startswith(INDEX_LIST_TAGS):
+            index_start = pos if index_start < 0 else index_start
+            index_lines.append(line)
+        tail = (tail + line)[-TAIL_LIMIT:]
+        offset += len(line)
+
+    tail = tail.rstrip()
+    if not result.indexed:
+        if not tail.endswith(b"</mzML>"):
+            errors.append("File is truncated: no closing </mzML>")
+        result.spectra = spectra
+        return expected
+    if not tail.endswith(b"</indexedmzML>"):
+        errors.append("File is truncated: no closing </indexedmzML>")
+        return expected
+    match = INDEX_LIST_OFFSET_RE.search(tail)
+    if match is None:
+        errors.append("No indexListOffset")
+        return expected
+    if int(match.group(1)) != index_start:
+        errors.append(f"indexListOffset {match.group(1).decode()} is wrong")
+    result.spectra = _check_offsets(
+        b"".join(index_lines), 0, lambda o: starts.get(o, b""), result
+    )
+    if checksum:
+        _check_checksum(CHECKSUM_RE.search(tail), sha1.hexdigest(), result)
+    return expected
+
+
+def verify_mzml(path: str, checksum: bool = True) -> VerifyResult:
+    """
+    Check that an mzML file is complete and its index is valid.
+
+    For indexedmzML files this checks that indexListOffset points at the
+    index, that every index offset points at the element it names, that the
+    number of indexed spectra matches the spectrumList count and, with
+    checksum, that the SHA-1 fileChecksum matches. For plain mzML files it
+    checks that the document is complete and the spectrum count matches.
+    Gzip-compressed files are checked in one streaming pass, with offsets
+    and checksum taken over the decompressed document.
+
+    Args:
+        path: Path to the mzML file.
+        checksum: Whether to verify the SHA-1 checksum.
+
+    Returns:
+        The verification result.
+    """
+    result = VerifyResult(path)
+    size = os.path.getsize(path)
+    if size == 0:
+        result.errors.append("File is empty")
+        return result
+
+    if compression.is_gzip(path):
+        try:
+            with compression.open_input(path) as f:
+                expected = _verify_stream(f, result, checksum)
+        except (OSError, EOFError, zlib.error) as e:
+            result.errors.append(f"Cannot decompress: {e}")
+            return result
+    else:
+        with (
+            open(path, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        ):
+            expected = _verify_mapped(mm, size, result, checksum)
+
+    if None not in (expected, result.spectra) and result.spectra != expected:
+        result.errors.append(
+            f"spectrumList count is {expected} but {result.spectra} spectra were found"
+        )
+    return result
+
+
+def check_output(path: str, checksum: bool = True) -> VerifyResult:
+    """
+    Verify a converted file and raise VerificationError if it is broken.
+    """
+    result = verify_mzml(path, checksum=checksum)
+    if not result.ok:
+        for error in result.errors:
+            logger.error(f"{path}: {error}")
+        raise VerificationError(f"Verification failed for {path}")
+    logger.info(f"Verified {path} ({result.spectra} spectra)")
+    return result
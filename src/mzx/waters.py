@@ -0,0 +1,303 @@
+"""
+Metadata of Waters .raw directories.
+
+A WatersRawDirectory lists the directory once and parses _extern.inf,
+_HEADER.TXT and _CHROMS.INF only when a property that needs them is first
+read, so checking many runs (lockmass function, function count, polarity,
+acquisition time) touches a handful of small files per run and does not need
+Docker.
+"""
+
+import functools
+import os
+import re
+from datetime import datetime
+from functools import cached_property
+
+from . import format_function_number, parse_chroinf
+
+FUNC_PATTERN = re.compile(r"_func(\d+)\.dat$", re.IGNORECASE)
+CHRODAT_PATTERN = re.compile(r"_chro(\d+)\.dat$", re.IGNORECASE)
+FUNCTION_SECTION_RE = re.compile(
+    r"^Function Parameters - Function (\d+)", re.IGNORECASE
+)
+POLARITY_RE = re.compile(r"^(?:Polarity|Ion Mode)\s+(\S.*)$", re.IGNORECASE)
+HEADER_RE = re.compile(r"^\$\$\s*([^:]+):\s*(.*?)\s*$")
+HEADER_DATE_FORMATS = ("%d-%b-%Y %H:%M:%S", "%d-%b-%Y %H:%M", "%d/%m/%Y %H:%M:%S")
+
+# Directories opened through raw_directory() that are kept in memory
+CACHE_SIZE = 256
+
+
+def _polarity(value: str) -> str | None:
+    value = value.strip().lower()
+    if "+" in value or "pos" in value:
+        return "positive"
+    if "-" in value or "neg" in value:
+        return "negative"
+    return None
+
+
+class WatersRawDirectory:
+    """
+    A Waters .raw directory.
+
+    Every property is computed on first access and cached, so the directory
+    is listed once and each metadata file is read at most once.
+
+    Args:
+        path: Path to the .raw directory.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = os.fspath(path)
+
+    def __repr__(self) -> str:
+        return f"WatersRawDirectory({self.path!r})"
+
+    @property
+    def name(self) -> str:
+        return os.path.splitext(os.path.basename(os.path.normpath(self.path)))[0]
+
+    @cached_property
+    def files(self) -> list[str]:
+        """
+        Names of the files in the directory, sorted.
+        """
+        return sorted(os.listdir(self.path))
+
+    def _find(self, name: str) -> str | None:
+        for f in self.files:
+            if f.lower() == name:
+                return os.path.join(self.path, f)
+        return None
+
+    @cached_property
+    def extern_path(self) -> str | None:
+        for f in self.files:
+            if f.lower().endswith("_extern.inf"):
+                return os.path.join(self.path, f)
+        return None
+
+    @cached_property
+    def header_path(self) -> str | None:
+        return self._find("_header.txt")
+
+    @cached_property
+    def functions_path(self) -> str | None:
+        return self._find("_functns.inf")
+
+    @cached_property
+    def chroms_path(self) -> str | None:
+        return self._find("_chroms.inf")
+
+    @property
+    def has_function_files(self) -> bool:
+        """
+        Whether any file name contains _FUNC, the marker of a Waters run.
+        """
+        return any("_FUNC" in f for f in self.files)
+
+    @cached_property
+    def function_files(self) -> dict[int, str]:
+        """
+        Paths of the _FUNC###.DAT files by function number.
+        """
+        functions = {}
+        for f in self.files:
+            match = FUNC_PATTERN.match(f)
+            if match:
+                functions[int(match.group(1))] = os.path.join(self.path, f)
+        return dict(sorted(functions.items()))
+
+    @property
+    def function_count(self) -> int:
+        return len(self.function_files)
+
+    @cached_property
+    def analog_files(self) -> dict[int, str]:
+        """
+        Paths of the _CHRO###.DAT analog channel files by channel number.
+        """
+        channels = {}
+        for f in self.files:
+            match = CHRODAT_PATTERN.match(f)
+            if match:
+                channels[int(match.group(1))] = os.path.join(self.path, f)
+        return dict(sorted(channels.items()))
+
+    @cached_property
+    def extern_lines(self) -> list[str]:
+        """
+        Lines of _extern.inf, empty if the file is missing.
+        """
+        if self.extern_path is None:
+            return []
+        with open(self.extern_path, encoding="latin-1") as f:
+            return f.read().splitlines()
+
+    @cached_property
+    def extern_sections(self) -> dict[int, list[str]]:
+        """
+        The "Function Parameters - Function N" sections of _extern.inf by
+        function number.
+        """
+        sections: dict[int, list[str]] = {}
+        current: list[str] | None = None
+        for line in self.extern_lines:
+            match = FUNCTION_SECTION_RE.match(line.strip())
+            if match:
+                current = sections.setdefault(int(match.group(1)), [])
+            if current is not None:
+                current.append(line)
+        return sections
+
+    @cached_property
+    def lockmass_function(self) -> tuple[str, int] | None:
+        """
+        The lockmass reference function as ("_FUNC###", number), from the
+        first REFERENCE line of _extern.inf, or None if there is none.
+        """
+        for line in self.extern_lines:
+            if "REFERENCE" in line:
+                function = format_function_number(line)
+                if function is not None:
+                    return function
+        return None
+
+    @cached_property
+    def polarities(self) -> dict[int, str]:
+        """
+        Polarity ("positive" or "negative") of each function that states it
+        in _extern.inf.
+        """
+        polarities = {}
+        for number, lines in self.extern_sections.items():
+            for line in lines:
+                match = POLARITY_RE.match(line.strip())
+                polarity = _polarity(match.group(1)) if match else None
+                if polarity is not None:
+                    polarities[number] = polarity
+                    break
+        return polarities
+
+    @property
+    def polarity(self) -> str | None:
+        """
+        "positive", "negative", "mixed", or None if _extern.inf does not say.
+        """
+        values = set(self.polarities.values())
+        if not values:
+            return None
+        return values.pop() if len(values) == 1 else "mixed"
+
+    @cached_property
+    def header(self) -> dict[str, str]:
+        """
+        The "$$ Key: Value" fields of _HEADER.TXT.
+        """
+        if self.header_path is None:
+            return {}
+        fields = {}
+        with open(self.header_path, encoding="latin-1") as f:
+            for line in f:
+                match = HEADER_RE.match(line)
+                if match:
+                    fields[match.group(1).strip()] = match.group(2)
+        return fields
+
+    @cached_property
+    def acquired(self) -> datetime | None:
+        """
+        Acquisition date and time from _HEADER.TXT.
+        """
+        date = self.header.get("Acquired Date", "")
+        time = self.header.get("Acquired Time", "")
+        for fmt in HEADER_DATE_FORMATS:
+            try:
+                return datetime.strptime(f"{date} {time}".strip(), fmt)
+            except ValueError:
+                continue
+        return None
+
+    @cached_property
+    def chromatogram_info(self) -> list:
+        """
+        Analog channel metadata from _CHROMS.INF, see parse_chroinf.
+        """
+        if self.chroms_path is None:
+            return []
+        return parse_chroinf(self.chroms_path)
+
+    def problems(self) -> list[str]:
+        """
+        Reasons the directory cannot be converted, empty if it looks fine.
+        """
+        problems = []
+        if self.extern_path is None:
+            problems.append("no _extern.inf file")
+        if not self.function_files:
+            problems.append("no _FUNC*.DAT files")
+        lockmass = self.lockmass_function
+        if lockmass is not None and lockmass[1] not in self.function_files:
+            problems.append(f"lockmass function {lockmass[0]} is missing")
+        return problems
+
+    def summary(self) -> dict:
+        """
+        The pre-flight metadata of the run as a JSON-serializable dict.
+        """
+        lockmass = self.lockmass_function
+        return {
+            "path": self.path,
+            "name": self.name,
+            "functions": self.function_count,
+            "lockmass_function": lockmass[1] if lockmass else None,
+            "polarity": self.polarity,
+            "acquired": self.acquired.isoformat() if self.acquired else None,
+            "instrument": self.header.get("Instrument"),
+            "analog_channels": len(self.analog_files),
+            "problems": self.problems(),
+        }
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _cached(path: str, mtime_ns: int) -> WatersRawDirectory:
+    return WatersRawDirectory(path)
+
+
+def raw_directory(path: str | os.PathLike) -> WatersRawDirectory:
+    """
+    Return the shared WatersRawDirectory of a path.
+
+    Vendor detection, conversion and chromatogram export of the same run then
+    reuse one listing and one parse. Adding or removing files changes the
+    directory's modification time, which gives a fresh instance.
+    """
+    path = os.path.abspath(path)
+    return _cached(path, os.stat(path).st_mtime_ns)
+
+
+def preflight(paths: list[str], workers: int = 8) -> list[dict]:
+    """
+    Summarize many Waters runs in parallel.
+
+    Args:
+        paths: Paths to .raw directories.
+        workers: Number of threads; the work is file system bound.
+
+    Returns:
+        One summary() per path, in order. A path that cannot be read gives
+        a summary with only "path", "name" and "problems".
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def summarize(path: str) -> dict:
+        raw = WatersRawDirectory(path)
+        try:
+            return raw.summary()
+        except OSError as e:
+            return {"path": path, "name": raw.name, "problems": [str(e)]}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(summarize, paths))
@@ -0,0 +1,246 @@
+"""Builders for msconvert-style mzML test files with binary arrays and index."""
+
+import base64
+import hashlib
+import zlib
+
+import numpy as np
+
+
+def _encode(values, precision: int, compress: bool) -> str:
+    dtype = "<f8" if precision == 64 else "<f4"
+    raw = np.asarray(values, dtype=dtype).tobytes()
+    if compress:
+        raw = zlib.compress(raw)
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _array_xml(values, accession, name, precision, compress, indent) -> list:
+    precision_cv = (
+        '<cvParam cvRef="MS" accession="MS:1000523" name="64-bit float" value=""/>'
+        if precision == 64
+        else '<cvParam cvRef="MS" accession="MS:1000521" name="32-bit float" value=""/>'
+    )
+    compression_cv = (
+        '<cvParam cvRef="MS" accession="MS:1000574" name="zlib compression" value=""/>'
+        if compress
+        else '<cvParam cvRef="MS" accession="MS:1000576" name="no compression" value=""/>'
+    )
+    text = _encode(values, precision, compress)
+    pad = " " * indent
+    return [
+        f'{pad}<binaryDataArray encodedLength="{len(text)}">',
+        f"{pad}  {precision_cv}",
+        f"{pad}  {compression_cv}",
+        f'{pad}  <cvParam cvRef="MS" accession="{accession}" name="{name}" value=""/>',
+        f"{pad}  <binary>{text}</binary>",
+        f"{pad}</binaryDataArray>",
+    ]
+
+
+def spectrum_lines(i: int, s: dict, precision: int, compress: bool) -> list:
+    mz = s.get("mz", [])
+    intensity = s.get("intensity", [])
+    sid = s.get("id", f"scan={i + 1}")
+    tic = s.get("tic", float(np.sum(intensity)) if len(intensity) else 0.0)
+    lines = [
+        f'        <spectrum index="{i}" id="{sid}" defaultArrayLength="{len(mz)}">',
+        (
+            f'          <cvParam cvRef="MS" accession="MS:1000511" name="ms level" '
+            f'value="{s.get("ms_level", 1)}"/>'
+        ),
+    ]
+    if s.get("centroided"):
+        lines.append(
+            '          <cvParam cvRef="MS" accession="MS:1000127" '
+            'name="centroid spectrum" value=""/>'
+        )
+    else:
+        lines.append(
+            '          <cvParam cvRef="MS" accession="MS:1000128" '
+            'name="profile spectrum" value=""/>'
+        )
+    if s.get("negative"):
+        lines.append(
+            '          <cvParam cvRef="MS" accession="MS:1000129" '
+            'name="negative scan" value=""/>'
+        )
+    lines += [
+        (
+            f'          <cvParam cvRef="MS" accession="MS:1000285" '
+            f'name="total ion current" value="{tic}"/>'
+        ),
+        '          <scanList count="1">',
+        "            <scan>",
+        (
+            f'              <cvParam cvRef="MS" accession="MS:1000016" '
+            f'name="scan start time" value="{s.get("rt", 0.0)}" unitCvRef="UO" '
+            f'unitAccession="UO:0000031" unitName="minute"/>'
+        ),
+        "            </scan>",
+        "          </scanList>",
+    ]
+    if s.get("precursor_mz") is not None:
+        lines += [
+            '          <precursorList count="1">',
+            "            <precursor>",
+            '              <selectedIonList count="1">',
+            "                <selectedIon>",
+            (
+                f'                  <cvParam cvRef="MS" accession="MS:1000744" '
+                f'name="selected ion m/z" value="{s["precursor_mz"]}"/>'
+            ),
+        ]
+        if s.get("charge"):
+            lines.append(
+                f'                  <cvParam cvRef="MS" accession="MS:1000041" '
+                f'name="charge state" value="{s["charge"]}"/>'
+            )
+        lines += [
+            "                </selectedIon>",
+            "              </selectedIonList>",
+            "            </precursor>",
+            "          </precursorList>",
+        ]
+    lines.append('          <binaryDataArrayList count="2">')
+    lines += _array_xml(mz, "MS:1000514", "m/z array", precision, compress, 12)
+    lines += _array_xml(
+        intensity, "MS:1000515", "intensity array", precision, compress, 12
+    )
+    lines += ["          </binaryDataArrayList>", "        </spectrum>"]
+    return lines
+
+
+def build_mzml(
+    spectra,
+    indexed: bool = True,
+    precision: int = 64,
+    compress: bool = True,
+    chromatogram: bool = True,
+) -> bytes:
+    """Build an mzML document laid out like msconvert output.
+
+    Each spectrum is a dict with optional keys: id, ms_level, rt (minutes),
+    mz, intensity, tic, precursor_mz, charge, centroided, negative.
+    """
+    head = ['<?xml version="1.0" encoding="utf-8"?>']
+    if indexed:
+        head.append('<indexedmzML xmlns="http://psi.hupo.org/ms/mzml">')
+    head += [
+        '  <mzML xmlns="http://psi.hupo.org/ms/mzml" id="test" version="1.1.0">',
+        '    <run id="test">',
+        (
+            f'      <spectrumList count="{len(spectra)}" '
+            'defaultDataProcessingRef="pwiz_Reader_conversion">'
+        ),
+    ]
+    parts: list[tuple[str | None, str]] = [(None, line) for line in head]
+    for i, s in enumerate(spectra):
+        lines = spectrum_lines(i, s, precision, compress)
+        sid = s.get("id", f"scan={i + 1}")
+        parts.append((f"spectrum:{sid}", lines[0]))
+        parts += [(None, line) for line in lines[1:]]
+    parts.append((None, "      </spectrumList>"))
+    if chromatogram:
+        times = [s.get("rt", 0.0) for s in spectra]
+        tics = [float(np.sum(s.get("intensity", []))) for s in spectra]
+        parts.append(
+            (
+                None,
+                (
+                    '      <chromatogramList count="1" '
+                    'defaultDataProcessingRef="pwiz_Reader_conversion">'
+                ),
+            )
+        )
+        parts.append(
+            (
+                "chromatogram:TIC",
+                (
+                    f'        <chromatogram index="0" id="TIC" '
+                    f'defaultArrayLength="{len(times)}">'
+                ),
+            )
+        )
+        parts.append((None, '          <binaryDataArrayList count="2">'))
+        body = _array_xml(times, "MS:1000595", "time array", precision, compress, 12)
+        body += _array_xml(
+            tics, "MS:1000515", "intensity array", precision, compress, 12
+        )
+        parts += [(None, line) for line in body]
+        parts.append((None, "          </binaryDataArrayList>"))
+        parts.append((None, "        </chromatogram>"))
+        parts.append((None, "      </chromatogramList>"))
+    parts += [(None, "    </run>"), (None, "  </mzML>")]
+
+    chunks = []
+    size = 0
+    offsets: dict[str, list] = {"spectrum": [], "chromatogram": []}
+    for key, line in parts:
+        if key is not None:
+            kind, ref = key.split(":", 1)
+            offsets[kind].append((ref, size + len(line) - len(line.lstrip())))
+        chunks.append((line + "\n").encode())
+        size += len(chunks[-1])
+    out = b"".join(chunks)
+    if not indexed:
+        return out
+
+    index_offset = len(out) + 2
+    tail = ['  <indexList count="2">']
+    for kind in ("spectrum", "chromatogram"):
+        tail.append(f'    <index name="{kind}">')
+        tail += [
+            f'      <offset idRef="{ref}">{off}</offset>' for ref, off in offsets[kind]
+        ]
+        tail.append("    </index>")
+    tail += [
+        "  </indexList>",
+        f"  <indexListOffset>{index_offset}</indexListOffset>",
+        "  <fileChecksum>",
+    ]
+    out += ("\n".join(tail)).encode()
+    digest = hashlib.sha1(out).hexdigest()
+    out += f"{digest}</fileChecksum>\n</indexedmzML>\n".encode()
+    return out
+
+
+def write_mzml(path, spectra, **kwargs) -> str:
+    data = build_mzml(spectra, **kwargs)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def sample_spectra(n: int = 6, seed: int = 0) -> list:
+    """Alternating MS1/MS2 spectra with random peaks."""
+    rng = np.random.default_rng(seed)
+    spectra = []
+    for i in range(n):
+        mz = np.sort(rng.uniform(100, 2000, size=20 + i))
+        intensity = rng.uniform(0, 1e4, size=len(mz))
+        s = {"rt": 0.5 * i, "mz": mz, "intensity": intensity, "ms_level": 1}
+        if i % 2:
+            s.update(ms_level=2, precursor_mz=400.0 + i, charge=2, centroided=True)
+        spectra.append(s)
+    return spectra
+
+
+def assert_valid_index(path) -> None:
+    """Check offsets, indexListOffset and fileChecksum of an indexedmzML."""
+    import re
+
+    with open(path, "rb") as f:
+        data = f.read()
+    index_offset = int(re.search(rb"<indexListOffset>(\d+)<", data).group(1))
+    assert data[index_offset:].startswith(b"<indexList")
+    for kind, ref, offset in re.findall(
+        rb'<index name="(\w+)">|<offset idRef="([^"]*)">(\d+)<', data
+    ):
+        if offset:
+            element = data[int(offset) :]
+            assert element.startswith((b"<spectrum ", b"<chromatogram "))
+            assert b'id="' + ref + b'"' in element[: element.index(b">")]
+    end = data.index(b"<fileChecksum>") + len(b"<fileChecksum>")
+    checksum = re.search(rb"<fileChecksum>(\w+)<", data).group(1).decode()
+    assert hashlib.sha1(data[:end]).hexdigest() == checksum
@@ -0,0 +1,167 @@
+"""Tests for sharded manifest batches and ledger merging."""
+
+import json
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from mzx import batch
+from mzx.cli import main
+from mzx.staging import StagingArea
+
+
+def _manifest(tmp_path: Path, sizes: list[int]) -> Path:
+    lines = []
+    for i, size in enumerate(sizes):
+        (tmp_path / f"run{i}.raw").write_bytes(b"x" * size)
+        lines.append(f"run{i}.raw")
+    manifest = tmp_path / "runs.txt"
+    manifest.write_text("# archive\n" + "\n".join(lines) + "\n\n")
+    return manifest
+
+
+def test_parse_shard(monkeypatch) -> None:
+    assert batch.parse_shard("3/10") == (3, 10)
+    for value in ("10/10", "1", "a/b"):
+        with pytest.raises(batch.BatchError):
+            batch.parse_shard(value)
+    monkeypatch.setenv("SLURM_ARRAY_TASK_ID", "5")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_MIN", "1")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_COUNT", "8")
+    assert batch.parse_shard("slurm") == (4, 8)
+
+
+def test_read_manifest(tmp_path: Path) -> None:
+    manifest = _manifest(tmp_path, [10, 20])
+    with open(manifest, "a") as f:
+        f.write("run0.raw\n")
+        f.write(f"{tmp_path / 'elsewhere.raw'}\t12345\n")
+    entries = batch.read_manifest(str(manifest))
+    assert entries == [
+        batch.ManifestEntry(str(tmp_path / "run0.raw"), 10),
+        batch.ManifestEntry(str(tmp_path / "run1.raw"), 20),
+        batch.ManifestEntry(str(tmp_path / "elsewhere.raw"), 12345),
+    ]
+
+
+def test_shards_partition_and_balance(tmp_path: Path) -> None:
+    sizes = [100, 90, 80, 50, 40, 30, 20, 10, 5, 5]
+    entries = batch.read_manifest(str(_manifest(tmp_path, sizes)))
+    shards = [batch.shard_entries(entries, i, 3) for i in range(3)]
+    paths = [e.path for shard in shards for e in shard]
+    assert sorted(paths) == sorted(e.path for e in entries)
+    loads = [sum(e.size for e in shard) for shard in shards]
+    assert max(loads) - min(loads) <= 10
+    # Every task computes the same assignment, whatever the manifest order
+    shuffled = list(reversed(entries))
+    assert [batch.shard_entries(shuffled, i, 3) for i in range(3)] == [
+        list(reversed(shard)) for shard in shards
+    ]
+
+
+def test_run_shard_resumes_and_merge(tmp_path: Path) -> None:
+    manifest = str(_manifest(tmp_path, [10, 20, 30, 40]))
+    failing = {str(tmp_path / "run1.raw")}
+
+    def convert(infile: str) -> list[str]:
+        if infile in failing:
+            raise RuntimeError("boom")
+        return [infile.replace(".raw", ".mzML")]
+
+    first = batch.run_shard(manifest, 0, 2, convert)
+    assert len(first) == 2
+    merged = batch.merge_ledgers(manifest)
+    assert len(merged.missing) == 2
+    assert not merged.complete
+
+    batch.run_shard(manifest, 1, 2, convert)
+    merged = batch.merge_ledgers(manifest)
+    assert merged.missing == []
+    assert [r["input"] for r in merged.failed] == [str(tmp_path / "run1.raw")]
+
+    # Running the failed shard again only retries the failed input
+    shard = next(r["shard"] for r in merged.failed)
+    failing.clear()
+    retried = batch.run_shard(manifest, shard, 2, convert)
+    assert [r["input"] for r in retried] == [str(tmp_path / "run1.raw")]
+    merged = batch.merge_ledgers(manifest)
+    assert merged.complete
+    with open(tmp_path / "runs.ledger.jsonl") as f:
+        assert len([json.loads(line) for line in f]) == 4
+
+
+def test_run_shard_prefetches_next_input(tmp_path: Path) -> None:
+    manifest = str(_manifest(tmp_path, [10, 20, 30]))
+    events = []
+
+    with StagingArea(str(tmp_path / "scratch")) as area:
+        prefetch = area.prefetch
+
+        def record_prefetch(infile: str):
+            events.append(("prefetch", infile))
+            return prefetch(infile)
+
+        def convert(infile: str) -> list[str]:
+            events.append(("convert", infile))
+            return []
+
+        with mock.patch.object(area, "prefetch", side_effect=record_prefetch):
+            batch.run_shard(manifest, 0, 1, convert, area=area)
+        assert os.listdir(area.scratch_dir) == []
+
+    order = [path for event, path in events if event == "convert"]
+    assert len(order) == 3
+    # Input N+1 is already being copied while input N converts
+    assert events == [
+        ("prefetch", order[1]),
+        ("convert", order[0]),
+        ("prefetch", order[2]),
+        ("convert", order[1]),
+        ("convert", order[2]),
+    ]
+
+
+def test_batch_cli(tmp_path: Path) -> None:
+    manifest = str(_manifest(tmp_path, [10, 20, 30]))
+
+    def fake_convert(params, runner=None):
+        assert params["peak_picking"] == "all"
+        out = params["infile"].replace(".raw", ".mzML")
+        open(out, "w").close()
+        return out
+
+    with mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert):
+        for i in range(2):
+            argv = ["batch", "--manifest", manifest, "--shard", f"{i}/2"]
+            assert main(argv + ["--peak_picking", "all", "--no_verify"]) == 0
+    assert main(["batch", "--manifest", manifest, "--merge"]) == 0
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".mzML")) == [
+        "run0.mzML",
+        "run1.mzML",
+        "run2.mzML",
+    ]
+
+
+def test_batch_cli_scratch(tmp_path: Path) -> None:
+    manifest = str(_manifest(tmp_path, [10, 20]))
+    scratch = tmp_path / "scratch"
+    converted = []
+
+    def fake_convert(params, runner=None):
+        assert params["infile"].startswith(str(scratch))
+        converted.append(params["infile"])
+        out = params["infile"].replace(".raw", ".mzML")
+        open(out, "w").close()
+        return out
+
+    with mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert):
+        argv = ["batch", "--manifest", manifest, "--shard", "0/1"]
+        assert main(argv + ["--scratch", str(scratch), "--no_verify"]) == 0
+    assert len(converted) == 2
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".mzML")) == [
+        "run0.mzML",
+        "run1.mzML",
+    ]
+    assert os.listdir(scratch) == []
@@ -0,0 +1,104 @@
+"""Tests for reading Bruker timsTOF analysis.tdf files."""
+
+import csv
+import os
+import sqlite3
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from mzx import bruker
+from mzx.cli import main
+
+
+def _make_d(tmp_path: Path, frames: list[tuple]) -> str:
+    """
+    A .d directory whose analysis.tdf holds frames of
+    (time, ms_type, summed_intensity, max_intensity).
+    """
+    d_dir = tmp_path / "run.d"
+    d_dir.mkdir()
+    db = sqlite3.connect(d_dir / bruker.TDF_NAME)
+    db.execute(
+        "CREATE TABLE Frames (Id INTEGER PRIMARY KEY, Time REAL, Polarity TEXT, "
+        "MsMsType INTEGER, SummedIntensities INTEGER, MaxIntensity INTEGER, "
+        "NumScans INTEGER, NumPeaks INTEGER)"
+    )
+    db.executemany(
+        "INSERT INTO Frames VALUES (?, ?, '+', ?, ?, ?, 927, 1000)",
+        [(i + 1, *frame) for i, frame in enumerate(frames)],
+    )
+    db.execute("CREATE TABLE GlobalMetadata (Key TEXT PRIMARY KEY, Value TEXT)")
+    db.execute("INSERT INTO GlobalMetadata VALUES ('InstrumentName', 'timsTOF Pro')")
+    db.commit()
+    db.close()
+    return str(d_dir)
+
+
+FRAMES = [
+    (0.5, 0, 1000, 50),
+    (0.6, 8, 200, 20),
+    (0.7, 8, 300, 30),
+    (1.6, 0, 1500, 70),
+]
+
+
+def test_read_frames(tmp_path: Path) -> None:
+    d_dir = _make_d(tmp_path, FRAMES)
+    frames = bruker.read_frames(d_dir)
+    assert len(frames) == 4
+    assert frames.data["num_scans"].tolist() == [927] * 4
+    times, tics = frames.tic()
+    np.testing.assert_allclose(times, [0.5, 1.6])
+    assert tics.tolist() == [1000, 1500]
+    assert frames.bpc()[1].tolist() == [50, 70]
+    assert bruker.read_metadata(d_dir) == {"InstrumentName": "timsTOF Pro"}
+
+
+def test_missing_or_broken_tdf(tmp_path: Path) -> None:
+    (tmp_path / "empty.d").mkdir()
+    assert bruker.tdf_path(str(tmp_path / "empty.d")) is None
+    with pytest.raises(bruker.TdfError):
+        bruker.read_frames(str(tmp_path / "empty.d"))
+    (tmp_path / "empty.d" / bruker.TDF_NAME).write_bytes(b"not a database")
+    with pytest.raises(bruker.TdfError):
+        bruker.read_frames(str(tmp_path / "empty.d"))
+
+
+def test_tdf_is_opened_read_only(tmp_path: Path) -> None:
+    d_dir = _make_d(tmp_path, FRAMES)
+    db = bruker.connect(os.path.join(d_dir, bruker.TDF_NAME))
+    with pytest.raises(sqlite3.OperationalError):
+        db.execute("DELETE FROM Frames")
+    db.close()
+
+
+def test_export_chromatograms(tmp_path: Path) -> None:
+    d_dir = _make_d(tmp_path, FRAMES)
+    outputs = bruker.export_chromatograms(d_dir, decimation="minmax")
+    assert outputs == [
+        str(tmp_path / "run_TIC.csv"),
+        str(tmp_path / "run_BPC.csv"),
+        str(tmp_path / "run_BPC_minmax.csv"),
+    ]
+    with open(outputs[0]) as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [
+        {"time": "0.500000", "intensity": "1000.000000"},
+        {"time": "1.600000", "intensity": "1500.000000"},
+    ]
+    assert (tmp_path / "run_TIC_minmax.csv").exists()
+
+
+def test_cli_chromatograms_only(tmp_path: Path) -> None:
+    d_dir = _make_d(tmp_path, FRAMES)
+    with mock.patch("mzx.cli.convert_raw_file") as convert:
+        assert main([d_dir, "--chromatograms_only"]) == 0
+    convert.assert_not_called()
+    assert (tmp_path / "run_TIC.csv").exists()
+    assert (tmp_path / "run_BPC.csv").exists()
+
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "run.raw"), "--chromatograms_only"])
@@ -0,0 +1,75 @@
+"""Tests for the SQLite spectrum catalog."""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from mzml_helpers import sample_spectra, write_mzml
+
+from mzx import catalog
+from mzx.cli import main
+
+
+def _waters_spectra(precursor: float) -> list:
+    spectra = sample_spectra(6)
+    for i, s in enumerate(spectra):
+        s["id"] = f"function=1 process=0 scan={i + 1} fscan={10 + i}"
+        s["rt"] = 20.0 + i
+    spectra[3]["precursor_mz"] = precursor
+    return spectra
+
+
+def test_scan_numbers() -> None:
+    assert catalog.scan_numbers("function=2 process=0 scan=7 fscan=3") == (7, 3)
+    assert catalog.scan_numbers("controllerType=0 controllerNumber=1 scan=5") == (
+        5,
+        None,
+    )
+    assert catalog.scan_numbers("index=3") == (None, None)
+
+
+def test_query_and_open_by_offset(tmp_path: Path) -> None:
+    a = write_mzml(tmp_path / "a.mzML", _waters_spectra(785.84))
+    b = write_mzml(tmp_path / "b.mzML", _waters_spectra(785.86))
+    with catalog.Catalog(str(tmp_path / "cat.db")) as cat:
+        assert cat.add_run(a) == 6
+        assert cat.add_run(b) == 6
+        # Unchanged files are skipped
+        assert cat.add_run(a) == 0
+
+        hits = cat.query(
+            precursor_mz=785.84, ppm=10, rt_range=(20 * 60, 25 * 60), ms_level=2
+        )
+        assert [(os.path.basename(h.path), h.scan, h.fscan) for h in hits] == [
+            ("a.mzML", 4, 13)
+        ]
+        spectrum = catalog.open_spectrum(hits[0])
+        assert spectrum.id == hits[0].native_id
+        assert spectrum.precursor_mz == 785.84
+        assert spectrum.mz is not None and len(spectrum.mz) == 23
+
+        assert len(cat.query(ms_level=2, run="b")) == 3
+        assert len(cat.query(limit=4)) == 4
+
+        cat.remove_run(a)
+        assert cat.runs() == [os.path.abspath(b)]
+
+
+def test_open_spectrum_detects_stale_catalog(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "a.mzML", _waters_spectra(785.84))
+    with catalog.Catalog(str(tmp_path / "cat.db")) as cat:
+        cat.add_run(path)
+        entry = cat.query(ms_level=2)[-1]
+    write_mzml(tmp_path / "a.mzML", sample_spectra(2))
+    with pytest.raises(catalog.CatalogError):
+        catalog.open_spectrum(entry)
+
+
+def test_cli_index_subcommand(tmp_path: Path, monkeypatch) -> None:
+    path = write_mzml(tmp_path / "a.mzML", _waters_spectra(785.84))
+    db = str(tmp_path / "cat.db")
+    monkeypatch.setattr(sys, "argv", ["mzx", "index", path, "--catalog", db])
+    main()
+    with catalog.Catalog(db) as cat:
+        assert len(cat.query()) == 6
@@ -0,0 +1,93 @@
+"""Tests for native centroiding of profile mzML."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+from mzml_helpers import assert_valid_index, write_mzml
+
+from mzx import centroid, mzml
+from mzx.cli import main
+
+
+def _profile(centers, heights, width=0.01, step=0.002):
+    mz = np.arange(min(centers) - 0.1, max(centers) + 0.1, step)
+    intensity = np.zeros_like(mz)
+    for c, h in zip(centers, heights):
+        intensity += h * np.exp(-0.5 * ((mz - c) / width) ** 2)
+    return mz, intensity
+
+
+def _profile_spectra() -> list:
+    spectra = []
+    for i in range(5):
+        mz, intensity = _profile([500.0 + i, 500.5 + i], [1e5, 2e3])
+        spectra.append({"rt": 0.1 * i, "mz": mz, "intensity": intensity})
+    spectra.append(
+        {
+            "rt": 0.6,
+            "ms_level": 2,
+            "precursor_mz": 500.0,
+            "mz": np.array([100.0, 100.01, 100.02]),
+            "intensity": np.array([1.0, 5.0, 1.0]),
+        }
+    )
+    return spectra
+
+
+def test_centroid_recovers_gaussian_apex() -> None:
+    mz, intensity = _profile([400.0033, 401.2571], [1e4, 5e3])
+    peaks_mz, peaks_int = centroid.centroid(mz, intensity)
+    np.testing.assert_allclose(peaks_mz, [400.0033, 401.2571], atol=1e-6)
+    np.testing.assert_allclose(peaks_int, [1e4, 5e3], rtol=1e-6)
+
+
+def test_centroid_snr_drops_small_peaks() -> None:
+    mz, intensity = _profile([400.0, 400.5, 401.0], [1e4, 10.0, 8e3])
+    intensity += 5.0
+    peaks_mz, _ = centroid.centroid(mz, intensity, snr=20.0)
+    np.testing.assert_allclose(peaks_mz, [400.0, 401.0], atol=1e-4)
+
+
+def test_centroid_empty_and_edge_peaks() -> None:
+    assert len(centroid.centroid(np.array([]), np.array([]))[0]) == 0
+    peaks_mz, peaks_int = centroid.centroid(
+        np.array([1.0, 2.0, 3.0]), np.array([5.0, 1.0, 3.0])
+    )
+    assert peaks_mz.tolist() == [1.0, 3.0]
+    assert peaks_int.tolist() == [5.0, 3.0]
+
+
+def test_centroid_mzml_writes_indexed_centroid_file(tmp_path: Path) -> None:
+    spectra = _profile_spectra()
+    path = write_mzml(tmp_path / "run.mzML", spectra, precision=32)
+
+    out = centroid.centroid_mzml(path, peak_picking="ms1", workers=2)
+    assert out == str(tmp_path / "run_centroid.mzML")
+    assert_valid_index(out)
+
+    result = list(mzml.iter_spectra(out))
+    assert len(result) == len(spectra)
+    for i, s in enumerate(result[:5]):
+        assert s.centroided
+        np.testing.assert_allclose(s.mz, [500.0 + i, 500.5 + i], atol=1e-3)
+        assert s.mz.dtype == np.float32
+        assert s.tic == float(np.sum(s.intensity, dtype=np.float64))
+    # MS2 left in profile mode
+    assert not result[5].centroided
+    assert len(result[5].mz) == 3
+    text = Path(out).read_text()
+    assert text.count("centroid spectrum") == 5
+    assert text.count("profile spectrum") == 1
+
+
+def test_cli_centroid_subcommand(tmp_path: Path, monkeypatch) -> None:
+    path = write_mzml(tmp_path / "run.mzML", _profile_spectra(), indexed=False)
+    out = tmp_path / "out.mzML"
+    monkeypatch.setattr(
+        sys, "argv", ["mzx", "centroid", path, "--output", str(out), "--snr", "3"]
+    )
+    main()
+    result = list(mzml.iter_spectra(str(out)))
+    assert all(s.centroided for s in result)
+    assert b"<indexList" not in out.read_bytes()
@@ -1,13 +1,22 @@
 import csv
 import os
 import struct
+from unittest import mock
+
+import numpy as np
+import pytest
+from lxml import etree
+from mzml_helpers import assert_valid_index, sample_spectra, write_mzml
 
 from mzx import (
+    analog,
     export_chromatograms,
     extract_tic_from_mzml,
     get_chromatogram_info,
+    mzml,
     parse_chrodat,
     parse_chroinf,
+    verify,
     write_chrom_csv,
 )
 
@@ -225,3 +234,148 @@ class TestExtractTicFromMzml:
             reader = csv.DictReader(f)
             rows = list(reader)
         assert len(rows) == 0
+
+
+class TestEmbedAnalogChannels:
+    @staticmethod
+    def _raw_dir(tmp_path):
+        raw_dir = tmp_path / "sample.raw"
+        raw_dir.mkdir()
+        (raw_dir / "_chroms.inf").write_bytes(
+            _build_chroinf([("TUV 260", " AU"), ("System Pressure", " psi")])
+        )
+        (raw_dir / "_chro001.dat").write_bytes(
+            _build_chrodat([(0.5, 0.1), (1.0, 0.25), (1.5, 0.2)])
+        )
+        (raw_dir / "_chro002.dat").write_bytes(
+            _build_chrodat([(0.5, 5000.0), (1.0, 5100.0)])
+        )
+        return str(raw_dir)
+
+    @staticmethod
+    def _chromatograms(path):
+        root = etree.parse(path).getroot()
+        return {
+            c.get("id"): c
+            for c in root.iter("{http://psi.hupo.org/ms/mzml}chromatogram")
+        }
+
+    @pytest.mark.parametrize("existing", [True, False])
+    def test_appends_to_chromatogram_list(self, tmp_path, existing):
+        raw_dir = self._raw_dir(tmp_path)
+        path = write_mzml(
+            tmp_path / "sample.mzML", sample_spectra(4), chromatogram=existing
+        )
+        assert analog.embed_analog_channels(path, raw_dir) == 2
+
+        assert_valid_index(path)
+        assert verify.verify_mzml(path).ok
+        assert len(list(mzml.iter_spectra(path))) == 4
+        chromatograms = self._chromatograms(path)
+        ids = ["TUV 260", "System Pressure"]
+        assert list(chromatograms) == (["TIC"] if existing else []) + ids
+        assert [c.get("index") for c in chromatograms.values()] == [
+            str(i) for i in range(len(chromatograms))
+        ]
+
+        uv = chromatograms["TUV 260"]
+        assert mzml.ABSORPTION_CHROMATOGRAM in mzml.cv_params(uv)
+        arrays = mzml.binary_arrays(uv)
+        np.testing.assert_allclose(arrays[mzml.TIME_ARRAY], [30.0, 60.0, 90.0])
+        np.testing.assert_allclose(
+            arrays[mzml.INTENSITY_ARRAY], [0.1, 0.25, 0.2], rtol=1e-6
+        )
+        pressure = mzml.binary_arrays(chromatograms["System Pressure"])
+        assert pressure[mzml.PRESSURE_ARRAY].tolist() == [5000.0, 5100.0]
+
+    def test_compressed_output(self, tmp_path):
+        raw_dir = self._raw_dir(tmp_path)
+        path = write_mzml(tmp_path / "sample.mzML", sample_spectra(2))
+        out = str(tmp_path / "sample.mzML.gz")
+        analog.embed_analog_channels(path, raw_dir, output_path=out)
+        assert verify.verify_mzml(out).ok
+        assert sorted(os.listdir(tmp_path)) == [
+            "sample.mzML",
+            "sample.mzML.gz",
+            "sample.mzML.gz.gzi",
+            "sample.raw",
+        ]
+
+
+class TestChannelStore:
+    @staticmethod
+    def _raw_dir(tmp_path, name="sample.raw", n=1000):
+        raw_dir = tmp_path / name
+        raw_dir.mkdir()
+        (raw_dir / "_chroms.inf").write_bytes(
+            _build_chroinf([("TUV 260", " AU"), ("System Pressure", " psi")])
+        )
+        (raw_dir / "_chro001.dat").write_bytes(
+            _build_chrodat([(i / 100, float(i)) for i in range(n)])
+        )
+        (raw_dir / "_chro002.dat").write_bytes(_build_chrodat([(0.5, 5000.0)]))
+        return str(raw_dir)
+
+    def test_window_is_inclusive(self, tmp_path):
+        store = analog.ChannelStore(self._raw_dir(tmp_path))
+        assert store.names == ["TUV 260", "System Pressure"]
+        times, values = store.window("TUV 260", 4.2, 5.0)
+        assert times[0] == np.float32(4.2) and times[-1] == np.float32(5.0)
+        assert values.tolist() == [float(i) for i in range(420, 501)]
+        assert not times.flags.writeable
+
+        assert len(store.window("TUV 260")[0]) == 1000
+        assert store.window("TUV 260", end=0.015)[1].tolist() == [0.0, 1.0]
+        assert len(store.window("TUV 260", 20.0, 30.0)[0]) == 0
+        assert len(store.window("TUV 260", 5.0, 4.0)[0]) == 0
+
+    def test_channel_lookup(self, tmp_path):
+        store = analog.ChannelStore(self._raw_dir(tmp_path))
+        assert store.channel("system pressure").number == 2
+        assert store.channel(1).name == "TUV 260"
+        with pytest.raises(analog.ChannelError, match="TUV 260"):
+            store.channel("UV 280")
+
+    def test_windows_are_cached(self, tmp_path):
+        raw_dir = self._raw_dir(tmp_path)
+        store = analog.channel_store(raw_dir)
+        assert analog.channel_store(raw_dir) is store
+        first = store.window("TUV 260", 1.0, 2.0)
+        assert store.window(1, 1.0, 2.0) is first
+
+    def test_read_windows(self, tmp_path):
+        raw_dirs = [
+            self._raw_dir(tmp_path, "a.raw"),
+            self._raw_dir(tmp_path, "b.raw", n=300),
+            str(tmp_path / "missing.raw"),
+        ]
+        windows = analog.read_windows(raw_dirs, "TUV 260", 2.5, 3.5)
+        assert [len(w[0]) if w else None for w in windows] == [101, 50, None]
+
+    def test_export_window(self, tmp_path):
+        raw_dir = self._raw_dir(tmp_path)
+        chrom_info = get_chromatogram_info(raw_dir)
+        exported = export_chromatograms(
+            raw_dir, chrom_info, channels=["tuv 260"], window=(4.2, 5.0)
+        )
+        assert exported == [str(tmp_path / "sample.raw_TUV 260.csv")]
+        with open(exported[0]) as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == 81
+        assert abs(float(rows[0]["time"]) - 252.0) < 1e-3
+        with pytest.raises(analog.ChannelError):
+            export_chromatograms(raw_dir, chrom_info, channels=["UV 280"])
+
+    def test_export_maps_selected_channels_only(self, tmp_path):
+        raw_dir = self._raw_dir(tmp_path)
+        chrom_info = get_chromatogram_info(raw_dir)
+        with mock.patch.object(
+            analog, "read_chrodat", wraps=analog.read_chrodat
+        ) as read:
+            exported = export_chromatograms(
+                raw_dir, chrom_info, channels=["System Pressure"], decimation="lttb"
+            )
+        assert [os.path.basename(c.args[0]) for c in read.call_args_list] == [
+            "_chro002.dat"
+        ]
+        assert len(exported) == 2
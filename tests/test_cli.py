@@ -34,7 +34,7 @@ def test_cli_logs_exception_on_conversion_failure(monkeypatch) -> None:
     monkeypatch.setattr(sys, "argv", ["mzx", "/nope.raw"])
     with mock.patch("mzx.cli.convert_raw_file", side_effect=RuntimeError("boom")):
         with mock.patch("mzx.cli.logger") as log:
-            main()
+            assert main() == 1
     log.error.assert_called()
 
 
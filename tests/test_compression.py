@@ -0,0 +1,111 @@
+"""Tests for gzip mzML input and block-parallel gzip output."""
+
+import gzip
+import io
+import os
+import random
+from pathlib import Path
+
+import numpy as np
+from mzml_helpers import assert_valid_index, sample_spectra, write_mzml
+
+from mzx import compression, filters, mzml, read_tic_from_mzml, verify
+
+
+def _compressed(tmp_path: Path, n: int = 6) -> tuple[str, str]:
+    plain = write_mzml(tmp_path / "run.mzML", sample_spectra(n))
+    gz = compression.compress_file(plain, plain + ".gz", remove=False)
+    return plain, gz
+
+
+def test_splitext() -> None:
+    assert compression.splitext("a/run.mzML.gz") == ("a/run", ".mzML.gz")
+    assert compression.splitext("a/run.mzML") == ("a/run", ".mzML")
+
+
+def test_parallel_writer_round_trip(tmp_path: Path) -> None:
+    data = os.urandom(1000) * 50
+    path = str(tmp_path / "data.gz")
+    with compression.ParallelGzipWriter(path, workers=3, block_size=4096) as out:
+        for start in range(0, len(data), 777):
+            out.write(data[start : start + 777])
+    assert gzip.decompress(Path(path).read_bytes()) == data
+    points = compression.read_index(path)
+    assert points is not None
+    assert len(points) == len(data) // 4096
+    assert [u for _, u in points] == list(range(4096, len(data), 4096))
+
+
+def test_indexed_reader_seeks(tmp_path: Path) -> None:
+    data = b"".join(b"line %d\n" % i for i in range(20000))
+    path = str(tmp_path / "lines.gz")
+    with compression.ParallelGzipWriter(path, block_size=8192) as out:
+        out.write(data)
+    rng = random.Random(0)
+    with compression.open_input(path) as f:
+        assert isinstance(f, io.BufferedReader)
+        for offset in sorted(
+            rng.sample(range(len(data)), 50), key=lambda _: rng.random()
+        ):
+            f.seek(offset)
+            assert f.tell() == offset
+            assert f.readline() == data[offset : data.index(b"\n", offset) + 1]
+
+    # Without the index the file is still readable, just not seekably fast
+    os.remove(compression.index_path(path))
+    with compression.open_input(path) as f:
+        assert f.read() == data
+
+
+def test_stale_index_is_ignored(tmp_path: Path) -> None:
+    path = str(tmp_path / "data.gz")
+    with compression.ParallelGzipWriter(path, block_size=100) as out:
+        out.write(b"a" * 1000)
+    index = Path(compression.index_path(path)).read_bytes()
+    with compression.ParallelGzipWriter(path, index=False) as out:
+        out.write(b"b" * 1000)
+    Path(compression.index_path(path)).write_bytes(index)
+    assert compression.read_index(path) is None
+    with compression.open_input(path) as f:
+        assert f.read() == b"b" * 1000
+
+
+def test_read_compressed_mzml(tmp_path: Path) -> None:
+    plain, gz = _compressed(tmp_path)
+    expected = list(mzml.iter_spectra(plain))
+    result = list(mzml.iter_spectra(gz, workers=2, chunk_size=2))
+    assert [s.id for s in result] == [s.id for s in expected]
+    assert [s.offset for s in result] == [s.offset for s in expected]
+    last = mzml.read_spectrum(gz, expected[-1].offset)
+    assert last.intensity is not None and expected[-1].intensity is not None
+    np.testing.assert_array_equal(last.intensity, expected[-1].intensity)
+    assert read_tic_from_mzml(gz) == read_tic_from_mzml(plain)
+
+
+def test_verify_compressed_mzml(tmp_path: Path) -> None:
+    _plain, gz = _compressed(tmp_path)
+    result = verify.verify_mzml(gz)
+    assert result.ok, result.errors
+    assert result.indexed
+    assert result.spectra == 6
+
+    data = Path(gz).read_bytes()
+    Path(gz).write_bytes(data[: len(data) - 20])
+    assert not verify.verify_mzml(gz).ok
+
+
+def test_filter_to_compressed_output(tmp_path: Path) -> None:
+    _, gz = _compressed(tmp_path, 8)
+    out = filters.filter_mzml(gz, filters.SpectrumFilter(ms_levels=(2, None)))
+    assert out == str(tmp_path / "run_filtered.mzML.gz")
+    assert not os.path.exists(str(tmp_path / "run_filtered.mzML"))
+    assert verify.verify_mzml(out).ok
+    plain = tmp_path / "filtered.mzML"
+    plain.write_bytes(gzip.decompress(Path(out).read_bytes()))
+    assert_valid_index(str(plain))
+    assert [s.id for s in mzml.iter_spectra(out)] == [
+        "scan=2",
+        "scan=4",
+        "scan=6",
+        "scan=8",
+    ]
@@ -0,0 +1,101 @@
+"""Tests for consolidating multi-run chromatograms onto a common grid."""
+
+import sys
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from test_chromatograms import _build_chrodat, _build_chroinf, _build_mzml
+
+from mzx import consolidate
+from mzx.cli import main
+
+
+def _make_run(root: Path, name: str, samples, tic_spectra=None) -> Path:
+    raw = root / f"{name}.raw"
+    raw.mkdir()
+    (raw / "_chroms.inf").write_bytes(
+        _build_chroinf([("TUV 260", " AU"), ("BSM System Pressure", " psi")])
+    )
+    (raw / "_chro001.dat").write_bytes(_build_chrodat(samples))
+    (raw / "_chro002.dat").write_bytes(
+        _build_chrodat([(t, 1000.0 + t) for t, _v in samples])
+    )
+    if tic_spectra is not None:
+        (root / f"{name}.mzML").write_text(_build_mzml(tic_spectra))
+    return raw
+
+
+def test_consolidate_resamples_runs_onto_common_grid(tmp_path: Path) -> None:
+    a = _make_run(
+        tmp_path,
+        "a",
+        [(0.0, 0.0), (1.0, 60.0), (2.0, 120.0)],
+        tic_spectra=[{"rt": 0.5, "tic": 10.0}, {"rt": 1.5, "tic": 30.0}],
+    )
+    b = _make_run(tmp_path, "b", [(1.0, 5.0), (3.0, 5.0)])
+
+    ds = consolidate.consolidate_chromatograms([str(a), str(b)], step=30.0)
+
+    assert ds.runs == ["a", "b"]
+    assert ds.channels == ["TUV 260", "BSM System Pressure", "TIC"]
+    assert ds.units == ["AU", "psi", "counts"]
+    # Grid spans 0-180 s across both runs
+    assert ds.time[0] == 0.0
+    assert ds.time[-1] == 180.0
+    assert ds.data.shape == (2, 3, 7)
+    uv = ds.channel("TUV 260")
+    # Run a is linear in time: 1 AU per second
+    np.testing.assert_allclose(uv[0, :5], [0, 30, 60, 90, 120])
+    assert np.isnan(uv[0, 5])
+    # Run b starts at 60 s and has no TIC
+    assert np.isnan(uv[1, 0])
+    assert uv[1, 2] == 5.0
+    assert np.all(np.isnan(ds.run("b")[2]))
+    np.testing.assert_allclose(ds.channel("TIC")[0, 1:4], [10.0, 20.0, 30.0])
+    assert ds.metadata["runs"]["a"]["sources"]["TIC"] == "a.mzML"
+
+
+def test_runs_with_the_same_stem_are_kept_apart(tmp_path: Path) -> None:
+    (tmp_path / "plate1").mkdir()
+    (tmp_path / "plate2").mkdir()
+    a = _make_run(tmp_path / "plate1", "run1", [(0.0, 1.0), (1.0, 1.0)])
+    b = _make_run(tmp_path / "plate2", "run1", [(0.0, 2.0), (1.0, 2.0)])
+    c = _make_run(tmp_path, "run2", [(0.0, 3.0), (1.0, 3.0)])
+
+    ds = consolidate.consolidate_chromatograms([str(a), str(b), str(c), str(a)])
+
+    assert len(ds.runs) == len(set(ds.runs)) == 3
+    assert ds.runs[0].startswith("run1-") and ds.runs[1].startswith("run1-")
+    assert ds.runs[2] == "run2"
+    assert [ds.metadata["runs"][r]["path"] for r in ds.runs] == [
+        str(a),
+        str(b),
+        str(c),
+    ]
+    assert ds.run(ds.runs[1])[0, 0] == 2.0
+
+
+def test_save_and_load_round_trip(tmp_path: Path) -> None:
+    a = _make_run(tmp_path, "a", [(0.0, 1.0), (1.0, 2.0)])
+    ds = consolidate.consolidate_chromatograms([str(a)], points=11)
+    out = tmp_path / "study.npz"
+    consolidate.save_dataset(ds, str(out), compress=True)
+    loaded = consolidate.load_dataset(str(out))
+    assert loaded.runs == ["a"]
+    assert loaded.channels == ds.channels
+    assert loaded.units == ds.units
+    np.testing.assert_array_equal(loaded.data, ds.data)
+    assert loaded.metadata == ds.metadata
+
+
+def test_cli_consolidate_subcommand(tmp_path: Path, monkeypatch) -> None:
+    a = _make_run(tmp_path, "a", [(0.0, 1.0), (1.0, 2.0)])
+    out = tmp_path / "study.npz"
+    monkeypatch.setattr(
+        sys, "argv", ["mzx", "consolidate", str(a), "--output", str(out)]
+    )
+    with mock.patch("mzx.cli.convert_raw_file") as mock_conv:
+        main()
+    mock_conv.assert_not_called()
+    assert consolidate.load_dataset(str(out)).runs == ["a"]
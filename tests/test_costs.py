@@ -0,0 +1,143 @@
+"""Tests for the conversion cost model and cost-balanced batches."""
+
+import json
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from mzx import batch, costs
+from mzx.cli import main
+
+
+def _record(vendor: str, size: float, seconds: float, **extra) -> dict:
+    record = {
+        "input": f"/data/{vendor}-{size}",
+        "status": "done",
+        "vendor": vendor,
+        "size": int(size * 1e9),
+        "seconds": seconds,
+        "functions": 1,
+        "filters": "",
+    }
+    record.update(extra)
+    return record
+
+
+def test_fit_recovers_linear_cost() -> None:
+    records = [_record("bruker", gb, 30 + 300 * gb) for gb in (1, 2, 5, 10, 40)]
+    fit = costs.fit(records)
+    assert fit.intercept == pytest.approx(30)
+    assert fit.per_gb == pytest.approx(300)
+    job = costs.Job("/data/new.d", "bruker", int(20e9))
+    assert fit.seconds(job) == pytest.approx(6030)
+
+    # Too few records for a line: a plain rate
+    fit = costs.fit(records[:2])
+    assert fit.intercept == 0
+    assert fit.per_gb == pytest.approx((330 + 630) / 3)
+
+
+def test_model_falls_back_per_vendor_and_filters() -> None:
+    records = [
+        _record("waters", 1, 100, output_bytes=int(3e9)),
+        _record("waters", 2, 200, output_bytes=int(6e9)),
+        _record("waters", 1, 400, filters="--peak_picking all"),
+        _record("Thermo", 1, 50),
+        _record("Thermo", 1, 1e6, status="failed"),
+    ]
+    model = costs.CostModel.from_records(records)
+    plain = costs.Job("x.raw", "waters", int(4e9))
+    picked = costs.Job("x.raw", "waters", int(4e9), filters="--peak_picking all")
+    other = costs.Job("x.raw", "waters", int(4e9), filters="--gzip")
+    assert model.seconds(plain) == pytest.approx(400)
+    assert model.seconds(picked) == pytest.approx(1600)
+    # Unseen options use every run of the vendor
+    assert model.seconds(other) == pytest.approx(700 / 4 * 4)
+    assert model.output_bytes(plain) == pytest.approx(12e9)
+    # Failed runs are ignored
+    assert model.seconds(costs.Job("y.raw", "Thermo", int(1e9))) == pytest.approx(50)
+    unknown = costs.Job("z", "sciex", int(1e9))
+    assert model.seconds(unknown) == model.overall.seconds(unknown)
+    assert costs.CostModel().seconds(unknown) == costs.DEFAULT_FIT.seconds(unknown)
+
+
+def test_shards_balance_predicted_time_longest_first(tmp_path: Path) -> None:
+    manifest = tmp_path / "runs.txt"
+    # run0 is small but, as a Bruker run, slow
+    (tmp_path / "run0.d").mkdir()
+    sizes = {"run0.d": 10, "run1.raw": 40, "run2.raw": 30, "run3.raw": 20}
+    manifest.write_text("".join(f"{n}\t{s}\n" for n, s in sizes.items()))
+    model = costs.CostModel(
+        {
+            ("bruker", None): costs.Fit(0, 9e9),
+            ("Thermo", None): costs.Fit(0, 1e9),
+        }
+    )
+    entries = batch.read_manifest(str(manifest))
+    jobs = batch.describe_entries(entries)
+    weights = {path: model.seconds(job) for path, job in jobs.items()}
+    shards = [batch.shard_entries(entries, i, 2, weights) for i in range(2)]
+    names = [[Path(e.path).name for e in shard] for shard in shards]
+    assert names == [["run0.d"], ["run1.raw", "run2.raw", "run3.raw"]]
+
+    estimate = batch.estimate_batch(str(manifest), 2, model)
+    assert estimate.makespan == pytest.approx(90)
+    assert estimate.total == pytest.approx(180)
+    assert estimate.loads == [90, 90]
+
+
+def test_batch_cli_records_and_uses_history(tmp_path: Path, capsys) -> None:
+    manifest = tmp_path / "runs.txt"
+    for i in range(3):
+        (tmp_path / f"run{i}.raw").write_bytes(b"x" * (i + 1) * 100)
+    manifest.write_text("run0.raw\nrun1.raw\nrun2.raw\n")
+
+    def fake_convert(params, runner=None):
+        out = params["infile"].replace(".raw", ".mzML")
+        Path(out).write_bytes(b"y" * 1000)
+        return out
+
+    with mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert):
+        argv = ["batch", "--manifest", str(manifest), "--no_verify"]
+        assert main(argv) == 0
+    ledger = tmp_path / "runs.shard-0-of-1.jsonl"
+    records = [json.loads(line) for line in ledger.read_text().splitlines()]
+    assert [r["vendor"] for r in records] == ["Thermo"] * 3
+    assert [r["output_bytes"] for r in records] == [1000] * 3
+    assert {r["filters"] for r in records} == {"--no_verify"}
+
+    argv = ["batch", "--manifest", str(manifest), "--shard", "0/2", "--estimate"]
+    assert main(argv + ["--cost_history", str(tmp_path / "runs.shard-*.jsonl")]) == 0
+    assert "2 shard(s)" in capsys.readouterr().out
+
+
+def test_planned_manifest_spares_tasks_from_inspecting_inputs(tmp_path: Path) -> None:
+    lines = "".join(f"run{i}.raw\n" for i in range(4))
+    for i in range(4):
+        (tmp_path / f"run{i}.raw").mkdir()
+    (tmp_path / "planned.txt").write_text(lines)
+    (tmp_path / "unplanned.txt").write_text(lines)
+    counts = {f"run{i}.raw": i + 1 for i in range(4)}
+
+    def raw_directory(path):
+        return mock.Mock(function_count=counts[Path(path).name])
+
+    model = costs.CostModel({("waters", None): costs.Fit(0, 0, 10.0)})
+    with mock.patch("mzx.waters.raw_directory", side_effect=raw_directory) as inspect:
+        planned = batch.plan_manifest(str(tmp_path / "planned.txt"))
+        assert [e.functions for e in planned] == [1, 2, 3, 4]
+        assert batch.read_manifest(str(tmp_path / "planned.txt")) == planned
+        inspect.reset_mock()
+
+        records = batch.run_shard(
+            str(tmp_path / "planned.txt"), 0, 2, lambda path: [], model=model
+        )
+        assert inspect.call_count == 0
+        assert [r["functions"] for r in records] == [4, 1]
+
+        # Without a plan, a task inspects only its own inputs
+        records = batch.run_shard(
+            str(tmp_path / "unplanned.txt"), 0, 2, lambda path: [], model=model
+        )
+        assert inspect.call_count == 2
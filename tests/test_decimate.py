@@ -0,0 +1,151 @@
+"""Tests for chromatogram downsampling (LTTB and min/max envelope)."""
+
+import csv
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from test_chromatograms import _build_chrodat, _build_chroinf, _build_mzml
+
+from mzx import (
+    analog,
+    decimate,
+    export_chromatograms,
+    extract_tic_from_mzml,
+    get_chromatogram_info,
+)
+from mzx.cli import main
+
+
+def _reference_lttb(x, y, n_out):
+    """Straightforward per-point LTTB used to check the vectorized version."""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        lo = int(np.floor(i * every)) + 1
+        hi = int(np.floor((i + 1) * every)) + 1
+        nlo = hi
+        nhi = min(int(np.floor((i + 2) * every)) + 1, n)
+        if i == n_out - 3:
+            nlo, nhi = n - 1, n
+        avg_x = np.mean(x[nlo:nhi])
+        avg_y = np.mean(y[nlo:nhi])
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return np.array(selected)
+
+
+def test_lttb_matches_reference() -> None:
+    rng = np.random.default_rng(0)
+    x = np.arange(1000, dtype=np.float64)
+    y = np.cumsum(rng.normal(size=1000))
+    np.testing.assert_array_equal(decimate.lttb(x, y, 50), _reference_lttb(x, y, 50))
+
+
+def test_lttb_keeps_endpoints_and_spike() -> None:
+    x = np.arange(10_000, dtype=np.float64)
+    y = np.zeros(10_000)
+    y[4321] = 100.0
+    index = decimate.lttb(x, y, 100)
+    assert len(index) == 100
+    assert index[0] == 0
+    assert index[-1] == 9999
+    assert 4321 in index
+    assert np.all(np.diff(index) > 0)
+
+
+def test_lttb_short_trace_is_returned_whole() -> None:
+    x = np.arange(5.0)
+    np.testing.assert_array_equal(decimate.lttb(x, x, 10), np.arange(5))
+
+
+def test_minmax_keeps_envelope() -> None:
+    rng = np.random.default_rng(1)
+    y = rng.normal(size=100_003)
+    x = np.arange(len(y), dtype=np.float64)
+    index = decimate.minmax(x, y, 200)
+    assert len(index) <= 200
+    assert np.argmax(y) in index
+    assert np.argmin(y) in index
+    assert np.all(np.diff(index) > 0)
+
+
+def test_decimate_rejects_unknown_method() -> None:
+    with pytest.raises(ValueError, match="Unknown decimation method"):
+        decimate.decimate(np.arange(10.0), np.arange(10.0), 5, "mean")
+
+
+def test_cli_rejects_too_few_lttb_points(tmp_path: Path, capsys) -> None:
+    mzml_file = tmp_path / "test.mzML"
+    mzml_file.write_text(_build_mzml([{"rt": i / 10, "tic": 1.0} for i in range(10)]))
+    argv = [str(mzml_file), "--chromatograms_only", "--decimate", "lttb"]
+    with pytest.raises(SystemExit):
+        main([*argv, "--decimate_points", "2"])
+    assert "--decimate_points must be at least 3" in capsys.readouterr().err
+    assert not (tmp_path / "test_TIC.csv").exists()
+    assert main([*argv, "--decimate_points", "3"]) == 0
+
+
+def test_decimate_memory_mapped_channel(tmp_path: Path) -> None:
+    dat = tmp_path / "_chro001.dat"
+    dat.write_bytes(_build_chrodat([(i / 100, float(i % 7)) for i in range(5000)]))
+    samples = analog.read_chrodat(str(dat))
+    times, values = decimate.decimate(
+        samples["time"], samples["intensity"], 100, "minmax"
+    )
+    assert len(times) <= 100
+    assert values.max() == 6.0
+
+
+def test_export_chromatograms_with_decimation(tmp_path: Path) -> None:
+    raw_dir = tmp_path / "sample.raw"
+    raw_dir.mkdir()
+    (raw_dir / "_chroms.inf").write_bytes(_build_chroinf([("TUV 260", " AU")]))
+    (raw_dir / "_chro001.dat").write_bytes(
+        _build_chrodat([(i / 100, float(i)) for i in range(1000)])
+    )
+    chrom_info = get_chromatogram_info(str(raw_dir))
+
+    exported = export_chromatograms(
+        str(raw_dir), chrom_info, decimation="lttb", decimation_points=20
+    )
+    assert [os.path.basename(p) for p in exported] == [
+        "sample.raw_TUV 260.csv",
+        "sample.raw_TUV 260_lttb.csv",
+    ]
+    with open(exported[1]) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 20
+    assert abs(float(rows[-1]["time"]) - 9.99 * 60) < 1e-3
+
+    only = export_chromatograms(
+        str(raw_dir),
+        chrom_info,
+        decimation="minmax",
+        decimation_points=20,
+        full_resolution=False,
+    )
+    assert [os.path.basename(p) for p in only] == ["sample.raw_TUV 260_minmax.csv"]
+
+
+def test_extract_tic_with_decimation(tmp_path: Path) -> None:
+    mzml_file = tmp_path / "test.mzML"
+    mzml_file.write_text(
+        _build_mzml([{"rt": i / 10, "tic": float(i)} for i in range(100)])
+    )
+    output = extract_tic_from_mzml(
+        str(mzml_file), decimation="lttb", decimation_points=10, full_resolution=False
+    )
+    assert output == str(tmp_path / "test_TIC_lttb.csv")
+    assert not (tmp_path / "test_TIC.csv").exists()
+    with open(output) as f:
+        assert len(list(csv.DictReader(f))) == 10
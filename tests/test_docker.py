@@ -1,5 +1,7 @@
 import mock
+import os
 import subprocess
+import sys
 from mzx import docker
 
 
@@ -26,3 +28,43 @@ def test_docker_not_running(mock_run):
         ["docker", "info"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
     )
     assert result is False
+
+
+@mock.patch("mzx.docker.check_running", return_value=True)
+def test_docker_check_cached(mock_check, monkeypatch):
+    """A successful check is reused within the TTL."""
+    monkeypatch.setattr(docker, "_last_check", None)
+    assert docker.check_running_cached(ttl=60) is True
+    assert docker.check_running_cached(ttl=60) is True
+    mock_check.assert_called_once()
+
+
+@mock.patch("mzx.docker.check_running", return_value=False)
+def test_docker_check_failure_not_cached(mock_check, monkeypatch):
+    monkeypatch.setattr(docker, "_last_check", None)
+    assert docker.check_running_cached(ttl=60) is False
+    assert docker.check_running_cached(ttl=60) is False
+    assert mock_check.call_count == 2
+
+
+def test_remove_orphans():
+    """Only containers of the same input whose process is gone are removed."""
+    dead = subprocess.Popen([sys.executable, "-c", ""])
+    dead.wait()
+    name = docker.container_name("/data/run.raw")
+    prefix = name.rsplit("-", 2)[0]
+    other = docker.container_name("/data/run.raw.bak").rsplit("-", 2)[0]
+    listed = [
+        f"{prefix}-{dead.pid}-0123abcd",
+        f"{prefix}-{os.getpid()}-0123abcd",
+        f"{prefix}-manual",
+        f"{other}-{dead.pid}-0123abcd",
+    ]
+    ps = subprocess.CompletedProcess([], 0, stdout="\n".join(listed) + "\n")
+    with (
+        mock.patch("mzx.docker.subprocess.run", return_value=ps) as run,
+        mock.patch("mzx.docker.remove_container", return_value=True) as remove,
+    ):
+        assert docker.remove_orphans(name) == [listed[0]]
+    assert f"name=^{prefix}-" in run.call_args.args[0]
+    remove.assert_called_once_with(listed[0])
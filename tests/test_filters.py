@@ -0,0 +1,71 @@
+"""Tests for the streaming mzML filters."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from mzml_helpers import assert_valid_index, sample_spectra, write_mzml
+
+from mzx import filters, mzml
+from mzx.cli import main
+
+
+def test_parse_levels() -> None:
+    assert filters.parse_levels("2") == (2, 2)
+    assert filters.parse_levels("1-2") == (1, 2)
+    assert filters.parse_levels("2-") == (2, None)
+    with pytest.raises(ValueError):
+        filters.parse_levels("ms2")
+
+
+def test_nonzero_mask_keeps_flanking_zeros() -> None:
+    intensity = np.array([0, 0, 0, 5, 7, 0, 0, 0, 0, 3, 0.0])
+    assert filters.nonzero_mask(intensity).tolist() == [
+        False, False, True, True, True, True, False, False, True, True, True
+    ]  # fmt: skip
+    assert filters.nonzero_mask(intensity, keep_flanking=False).sum() == 3
+
+
+def test_filter_peaks_combines_filters() -> None:
+    mz = np.arange(100.0, 110.0)
+    intensity = np.array([0, 1, 9, 3, 0, 8, 2, 7, 5, 6.0])
+    f = filters.SpectrumFilter(mz_window=(101, 108), min_intensity=2.0, top_n=3)
+    out_mz, out_int = f.filter_peaks(mz, intensity, centroided=True)
+    assert out_mz.tolist() == [102.0, 105.0, 107.0]
+    assert out_int.tolist() == [9.0, 8.0, 7.0]
+
+
+def test_filter_mzml_selects_spectra_and_reindexes(tmp_path: Path) -> None:
+    spectra = sample_spectra(8)
+    for s in spectra:
+        s["intensity"][::3] = 0.0
+    path = write_mzml(tmp_path / "run.mzML", spectra, precision=32)
+    f = filters.SpectrumFilter(
+        ms_levels=(2, None), rt_window=(0.0, 150.0), remove_zeros=True
+    )
+
+    out = filters.filter_mzml(path, f, workers=3)
+    assert out == str(tmp_path / "run_filtered.mzML")
+    assert_valid_index(out)
+    result = list(mzml.iter_spectra(out))
+    # MS2 spectra at 30, 90 and 150 seconds
+    assert [s.id for s in result] == ["scan=2", "scan=4", "scan=6"]
+    assert [s.index for s in result] == [0, 1, 2]
+    assert b'<spectrumList count="3"' in Path(out).read_bytes()
+    for s in result:
+        assert s.intensity is not None and np.all(s.intensity > 0)
+
+
+def test_cli_filter_subcommand(tmp_path: Path, monkeypatch) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(4))
+    out = tmp_path / "out.mzML"
+    argv = ["mzx", "filter", path, "--output", str(out)]
+    argv += ["--ms_levels", "1", "--mz", "500", "1000", "--top_n", "2"]
+    monkeypatch.setattr(sys, "argv", argv)
+    main()
+    result = list(mzml.iter_spectra(str(out)))
+    assert len(result) == 2
+    for s in result:
+        assert s.mz is not None and len(s.mz) <= 2
+        assert np.all((s.mz >= 500) & (s.mz <= 1000))
@@ -0,0 +1,151 @@
+"""Tests for following an mzML file while it is written."""
+
+import _thread
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from mzml_helpers import build_mzml, sample_spectra
+
+from mzx import extract_tic_from_mzml, follow, mzml, supervisor
+from mzx.catalog import Catalog
+from mzx.cli import main
+
+
+def _write_slowly(path: str, data: bytes, seed: int = 0) -> str:
+    """Write data in uneven pieces, splitting lines and elements."""
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        pos = 0
+        while pos < len(data):
+            size = rng.randint(1, 4000)
+            f.write(data[pos : pos + size])
+            f.flush()
+            pos += size
+            time.sleep(0.001)
+    return path
+
+
+def test_tail_lines_reassembles_partial_writes(tmp_path: Path) -> None:
+    data = build_mzml(sample_spectra(20))
+    path = str(tmp_path / "run.mzML")
+    finished = threading.Event()
+
+    def writer() -> None:
+        _write_slowly(path, data)
+        finished.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    lines = list(follow.tail_lines(path, finished.is_set, poll=0.001))
+    thread.join()
+    assert b"".join(lines) == data
+    assert lines == data.splitlines(keepends=True)
+
+
+def test_stale_output_is_ignored(tmp_path: Path) -> None:
+    path = tmp_path / "run.mzML"
+    path.write_bytes(build_mzml(sample_spectra(3)))
+    os.utime(path, (0, 0))
+    data = build_mzml(sample_spectra(5, seed=1))
+
+    pipeline = follow.Pipeline([follow.TicStage()])
+    out = follow.run_following(
+        lambda: _write_slowly(str(path), data), str(path), pipeline, poll=0.001
+    )
+    assert out == str(path)
+    assert pipeline.complete
+    assert pipeline.spectra == 5
+
+
+def test_pipeline_matches_post_processing(tmp_path: Path) -> None:
+    data = build_mzml(sample_spectra(30))
+    path = str(tmp_path / "run.mzML")
+    pipeline = follow.Pipeline(
+        [
+            follow.TicStage(output_csv=str(tmp_path / "followed_TIC.csv")),
+            follow.CatalogStage(str(tmp_path / "followed.db"), path),
+        ]
+    )
+    follow.run_following(lambda: _write_slowly(path, data), path, pipeline, poll=0.001)
+    assert pipeline.complete
+    assert pipeline.finish(path) == [str(tmp_path / "followed_TIC.csv")]
+
+    expected = extract_tic_from_mzml(path)
+    assert Path(expected).read_text() == (tmp_path / "followed_TIC.csv").read_text()
+    with Catalog(str(tmp_path / "followed.db")) as followed:
+        entries = followed.query()
+        # The followed run is up to date, so it is not indexed again
+        assert followed.add_run(path) == 0
+    with Catalog(str(tmp_path / "indexed.db")) as indexed:
+        indexed.add_run(path)
+        assert entries == indexed.query()
+    assert [e.offset for e in entries] == [
+        s.offset for s in mzml.iter_spectra(path, decode=False)
+    ]
+
+
+def test_failed_conversion_aborts_stages(tmp_path: Path) -> None:
+    path = str(tmp_path / "run.mzML")
+    data = build_mzml(sample_spectra(4))
+    stage = follow.CatalogStage(str(tmp_path / "catalog.db"), path)
+
+    def convert() -> str:
+        _write_slowly(path, data[: len(data) // 2])
+        raise RuntimeError("msconvert crashed")
+
+    pipeline = follow.Pipeline([stage])
+    with pytest.raises(RuntimeError):
+        follow.run_following(convert, path, pipeline, poll=0.001)
+    assert not pipeline.complete
+    with Catalog(str(tmp_path / "catalog.db")) as catalog:
+        assert catalog.runs() == []
+
+
+def test_interrupt_removes_container(tmp_path: Path) -> None:
+    path = str(tmp_path / "run.mzML")
+    stage = follow.CatalogStage(str(tmp_path / "catalog.db"), path)
+    pipeline = follow.Pipeline([stage])
+    cmd = f'{sys.executable} -c "import time; time.sleep(30)"'
+
+    def convert() -> str:
+        supervisor.supervise(cmd, container="mzx-run-0123456789ab-1")
+        return path
+
+    # Ctrl-C arrives on the main thread while the conversion runs
+    threading.Timer(0.3, _thread.interrupt_main).start()
+    with (
+        mock.patch("mzx.docker.remove_container", return_value=True) as remove,
+        pytest.raises(KeyboardInterrupt),
+    ):
+        follow.run_following(convert, path, pipeline, poll=0.001)
+    remove.assert_called_once_with("mzx-run-0123456789ab-1")
+    assert not pipeline.complete
+    assert not any(t.name == "mzx-follow" for t in threading.enumerate())
+
+
+def test_cli_pipeline(tmp_path: Path) -> None:
+    raw = tmp_path / "run.raw"
+    raw.write_text("x")
+    data = build_mzml(sample_spectra(6))
+
+    def fake_convert(params, runner=None):
+        return _write_slowly(str(tmp_path / "run.mzML"), data)
+
+    catalog = str(tmp_path / "catalog.db")
+    with (
+        mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert),
+        mock.patch("mzx.cli.vendor.vendor_name_from_file", return_value="thermo"),
+        mock.patch("mzx.cli.extract_tic_from_mzml") as extract,
+    ):
+        argv = [str(raw), "--pipeline", "--chromatograms", "--catalog", catalog]
+        assert main(argv) == 0
+    extract.assert_not_called()
+    assert (tmp_path / "run_TIC.csv").exists()
+    with Catalog(catalog) as cat:
+        assert len(cat.query()) == 6
@@ -0,0 +1,48 @@
+"""Start-up cost of the CLI: heavy dependencies stay unloaded."""
+
+import re
+import subprocess
+import sys
+
+# Loaded only by the commands that need them
+HEAVY_MODULES = ("lxml", "numpy", "PySide6", "sqlite3")
+# Cumulative import time budget for mzx.cli, in microseconds
+IMPORT_BUDGET_US = 300_000
+
+
+def _loaded_modules(code: str) -> set:
+    script = f"import sys\n{code}\nprint(' '.join(sys.modules))"
+    r = subprocess.run(
+        [sys.executable, "-c", script], check=True, capture_output=True, text=True
+    )
+    return set(r.stdout.split())
+
+
+def test_cli_import_does_not_load_heavy_modules() -> None:
+    loaded = _loaded_modules("import mzx.cli")
+    assert not loaded & set(HEAVY_MODULES)
+
+
+def test_help_does_not_load_heavy_modules() -> None:
+    loaded = _loaded_modules(
+        "from mzx.cli import main\ntry:\n    main(['--help'])\nexcept SystemExit:\n    pass"
+    )
+    assert not loaded & set(HEAVY_MODULES)
+
+
+def test_submodules_load_on_access() -> None:
+    loaded = _loaded_modules("import mzx\nmzx.decimate")
+    assert "mzx.decimate" in loaded
+    assert "numpy" in loaded
+
+
+def test_cli_import_time_budget() -> None:
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import mzx.cli"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    match = re.search(r"\|\s*(\d+)\s*\|\s*mzx\.cli\s*$", r.stderr, re.MULTILINE)
+    assert match is not None
+    assert int(match.group(1)) < IMPORT_BUDGET_US
@@ -0,0 +1,66 @@
+"""Tests for the batched loguru sink used by the GUI."""
+
+import threading
+
+from loguru import logger
+
+from mzx.logbuffer import LogBuffer
+
+
+def test_drain_returns_batches_from_threads() -> None:
+    buf = LogBuffer(max_lines=1000)
+    buf.install()
+    try:
+
+        def work(n: int) -> None:
+            with logger.contextualize(job=f"job{n}"):
+                for i in range(50):
+                    logger.info(f"line {i}")
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        buf.uninstall()
+
+    entries = buf.drain()
+    assert len(entries) == 200
+    assert buf.drain() == []
+    assert set(buf.jobs()) == {"job0", "job1", "job2", "job3"}
+
+
+def test_pending_and_retained_are_capped() -> None:
+    buf = LogBuffer(max_lines=10)
+    buf.install()
+    try:
+        for i in range(25):
+            logger.info(f"line {i}")
+    finally:
+        buf.uninstall()
+    entries = buf.drain()
+    assert len(entries) == 10
+    assert entries[-1].message == "line 24"
+    assert buf.dropped == 15
+
+
+def test_filter_by_level_and_job() -> None:
+    buf = LogBuffer()
+    buf.install()
+    try:
+        with logger.contextualize(job="a.raw"):
+            logger.debug("debug a")
+            logger.warning("warn a")
+        with logger.contextualize(job="b.raw"):
+            logger.info("info b")
+    finally:
+        buf.uninstall()
+
+    assert [e.message for e in buf.drain()] == ["warn a", "info b"]
+    assert [e.message for e in buf.set_filter(job="a.raw")] == ["warn a"]
+    assert [e.message for e in buf.set_filter(level="DEBUG", job="a.raw")] == [
+        "debug a",
+        "warn a",
+    ]
+    assert "[b.raw] info b" in buf.set_filter(level="INFO")[-1].format()
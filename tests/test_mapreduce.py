@@ -0,0 +1,74 @@
+"""Tests for parallel map-reduce over mzML spectra."""
+
+import functools
+from pathlib import Path
+
+import numpy as np
+import pytest
+from mzml_helpers import sample_spectra, write_mzml
+
+from mzx import compression, mapreduce, mzml, read_tic_from_mzml
+
+
+def _tic(spectrum: mzml.Spectrum) -> tuple[float | None, float | None]:
+    return spectrum.rt, spectrum.tic
+
+
+def _ms2_mz(spectrum: mzml.Spectrum) -> np.ndarray | None:
+    return spectrum.mz if spectrum.ms_level == 2 else None
+
+
+def _large(scale: int, spectrum: mzml.Spectrum) -> dict:
+    return {"index": spectrum.index, "values": np.full(20000, spectrum.index * scale)}
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_offsets(tmp_path: Path, indexed: bool) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(7), indexed=indexed)
+    expected = [s.offset for s in mzml.iter_spectra(path, decode=False)]
+    assert mapreduce.spectrum_offsets(path) == expected
+    gz = compression.compress_file(path, path + ".gz", remove=False)
+    assert mapreduce.spectrum_offsets(gz) == expected
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_map_matches_sequential(tmp_path: Path, workers: int) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(25))
+    tic = list(mapreduce.map_spectra(path, _tic, workers=workers, chunk_size=4))
+    times, tics = read_tic_from_mzml(path)
+    assert tic == list(zip(times, tics))
+
+    arrays = list(mapreduce.map_spectra(path, _ms2_mz, workers=workers, chunk_size=3))
+    expected = [s.mz for s in mzml.iter_spectra(path) if s.ms_level == 2]
+    assert len(arrays) == len(expected)
+    for got, want in zip(arrays, expected):
+        np.testing.assert_array_equal(got, want)
+
+
+def test_map_reduce_shares_large_arrays(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(10))
+    results = list(
+        mapreduce.map_spectra(
+            path, functools.partial(_large, 2), workers=2, chunk_size=3
+        )
+    )
+    assert [r["index"] for r in results] == list(range(10))
+    assert [r["values"][0] for r in results] == [2 * i for i in range(10)]
+
+    total = mapreduce.map_reduce(
+        path, functools.partial(_large, 1), lambda acc, r: acc + r["values"].sum(), 0
+    )
+    assert total == 20000 * sum(range(10))
+    summed = mapreduce.map_reduce(path, _tic, lambda a, b: (None, a[1] + b[1]))
+    assert summed[1] == pytest.approx(sum(read_tic_from_mzml(path)[1]))
+    peaks = mapreduce.map_reduce(path, _ms2_mz, lambda n, mz: n + len(mz), 0, workers=1)
+    assert peaks == sum(len(s.mz) for s in mzml.iter_spectra(path) if s.ms_level == 2)
+
+
+def test_stopping_early(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(40))
+    results = mapreduce.map_spectra(
+        path, functools.partial(_large, 1), workers=2, chunk_size=2
+    )
+    assert next(results)["index"] == 0
+    results.close()
@@ -0,0 +1,74 @@
+"""Tests for the streaming mzML reader and native MGF export."""
+
+import sys
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from mzml_helpers import sample_spectra, write_mzml
+
+from mzx import mgf, mzml
+from mzx.cli import main
+
+
+def test_iter_spectra_decodes_arrays_and_offsets(tmp_path: Path) -> None:
+    spectra = sample_spectra(4)
+    path = write_mzml(tmp_path / "run.mzML", spectra, precision=32)
+    data = Path(path).read_bytes()
+
+    read = list(mzml.iter_spectra(path))
+    assert [s.index for s in read] == [0, 1, 2, 3]
+    for s, expected in zip(read, spectra):
+        assert data[s.offset : s.offset + 9] == b"<spectrum"
+        assert s.ms_level == expected["ms_level"]
+        assert s.rt == 60.0 * expected["rt"]
+        np.testing.assert_allclose(s.mz, expected["mz"], rtol=1e-6)
+        np.testing.assert_allclose(s.intensity, expected["intensity"], rtol=1e-6)
+    assert read[1].precursor_mz == 401.0
+    assert read[1].charge == 2
+    assert read[0].mz is not None and read[0].mz.dtype == np.float32
+
+
+def test_mzml_to_mgf_writes_msms_spectra_only(tmp_path: Path) -> None:
+    spectra = sample_spectra(6)
+    spectra[3]["negative"] = True
+    path = write_mzml(tmp_path / "run.mzML", spectra)
+
+    out = mgf.mzml_to_mgf(path)
+    assert out == str(tmp_path / "run.mgf")
+    text = Path(out).read_text()
+    blocks = [b for b in text.split("END IONS\n") if b.strip()]
+    assert len(blocks) == 3
+    first = blocks[0].strip().splitlines()
+    assert first[:5] == [
+        "BEGIN IONS",
+        "TITLE=run.1 NativeID:scan=2",
+        "RTINSECONDS=30.000000",
+        "PEPMASS=401.000000",
+        "CHARGE=2+",
+    ]
+    peaks = np.loadtxt(first[5:])
+    np.testing.assert_allclose(peaks[:, 0], spectra[1]["mz"], atol=1e-6)
+    np.testing.assert_allclose(peaks[:, 1], spectra[1]["intensity"], rtol=1e-5)
+    assert "CHARGE=2-" in blocks[1]
+
+
+def test_cli_mgf_from_mzml_skips_docker(tmp_path: Path, monkeypatch) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(4))
+    monkeypatch.setattr(sys, "argv", ["mzx", path, "--type", "mgf"])
+    with mock.patch("mzx.cli.convert_raw_file") as mock_conv:
+        main()
+    mock_conv.assert_not_called()
+    assert (tmp_path / "run.mgf").exists()
+
+
+def test_cli_mzml_and_mgf_converts_once(tmp_path: Path, monkeypatch) -> None:
+    raw = tmp_path / "run.raw"
+    raw.write_bytes(b"")
+    mzml_path = write_mzml(tmp_path / "run.mzML", sample_spectra(4))
+    monkeypatch.setattr(sys, "argv", ["mzx", str(raw), "--type", "mzml,mgf"])
+    with mock.patch("mzx.cli.convert_raw_file", return_value=mzml_path) as conv:
+        main()
+    conv.assert_called_once()
+    assert conv.call_args[0][0]["type"] == "mzml"
+    assert (tmp_path / "run.mgf").exists()
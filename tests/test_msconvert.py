@@ -163,3 +163,39 @@ def test_msconvert_lockmass_and_scan_event_exclude(mock_run, tmp_path: Path) ->
     assert "mz=500.0" in cmd
     assert "scanEvent" in cmd
     assert "1-2 4-" in cmd  # exclusion_string(3)
+
+
+@mock.patch("mzx.run_cmd", return_value="")
+def test_msconvert_verbose_reports_progress(mock_run, tmp_path: Path) -> None:
+    f = tmp_path / "x.raw"
+    f.write_text("x")
+    msconvert(_base_params(str(f), verbose=True))
+    assert " -v" in mock_run.call_args[0][0]
+
+
+@mock.patch("mzx.run_cmd", return_value="")
+def test_msconvert_custom_runner(mock_run, tmp_path: Path) -> None:
+    f = tmp_path / "x.raw"
+    f.write_text("x")
+    runner = mock.Mock(return_value="")
+    msconvert(_base_params(str(f)), runner=runner)
+    runner.assert_called_once()
+    mock_run.assert_not_called()
+
+
+def test_msconvert_reports_progress_to_idle_watchdog(tmp_path: Path) -> None:
+    import functools
+
+    from mzx import supervisor
+
+    f = tmp_path / "x.raw"
+    f.write_text("x")
+    for limits, verbose in (
+        (supervisor.Limits(idle_timeout=60), True),
+        (supervisor.Limits(timeout=60), False),
+    ):
+        runner = supervisor.Supervisor(limits)
+        with mock.patch.object(supervisor.Supervisor, "__call__", return_value=""):
+            msconvert(_base_params(str(f)), runner=functools.partial(runner))
+            cmd = supervisor.Supervisor.__call__.call_args[0][0]  # type: ignore[attr-defined]
+        assert (" -v" in cmd.split("wine msconvert")[1]) == verbose
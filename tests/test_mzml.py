@@ -0,0 +1,34 @@
+"""Tests for the mzML spectrum reader."""
+
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from mzml_helpers import sample_spectra, write_mzml
+
+from mzx import mzml
+
+
+def test_threaded_iter_spectra_matches_sequential(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(11))
+    sequential = list(mzml.iter_spectra(path))
+    threaded = list(mzml.iter_spectra(path, workers=3, chunk_size=2))
+    assert [s.offset for s in threaded] == [s.offset for s in sequential]
+    for a, b in zip(threaded, sequential):
+        np.testing.assert_array_equal(a.mz, b.mz)
+        np.testing.assert_array_equal(a.intensity, b.intensity)
+
+
+def test_iter_spectra_select_decodes_selected_only(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(6))
+    with mock.patch("mzx.mzml.decode_spectrum", wraps=mzml.decode_spectrum) as decode:
+        selected = list(
+            mzml.iter_spectra(path, workers=2, select=lambda s: s.ms_level == 2)
+        )
+    assert [s.id for s in selected] == ["scan=2", "scan=4", "scan=6"]
+    assert sorted(c.args[0].id for c in decode.call_args_list) == [
+        "scan=2",
+        "scan=4",
+        "scan=6",
+    ]
+    assert all(s.mz is not None and not s.mz.flags.writeable for s in selected)
@@ -0,0 +1,124 @@
+"""Tests for retention time by m/z heatmap previews."""
+
+import struct
+import zlib
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pytest
+from mzml_helpers import build_mzml, sample_spectra, write_mzml
+
+from mzx import follow, mzml, preview
+from mzx.cli import main
+
+
+def _read_png(path: Path) -> np.ndarray:
+    data = path.read_bytes()
+    assert data.startswith(preview.PNG_SIGNATURE)
+    pos = len(preview.PNG_SIGNATURE)
+    chunks = {}
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        tag, body = data[pos + 4 : pos + 8], data[pos + 8 : pos + 8 + length]
+        (crc,) = struct.unpack(">I", data[pos + 8 + length : pos + 12 + length])
+        assert crc == zlib.crc32(tag + body)
+        chunks[tag] = body
+        pos += 12 + length
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), np.uint8)
+    rows = rows.reshape(height, 1 + 3 * width)
+    assert (rows[:, 0] == 0).all()
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+def test_grid_matches_histogram() -> None:
+    rng = np.random.default_rng(0)
+    heatmap = preview.Heatmap(rt_bins=8, mz_bins=10, mz_range=(100, 200))
+    times, mzs, weights = [], [], []
+    for i in range(50):
+        mz = rng.uniform(50, 250, 30)
+        intensity = rng.uniform(0, 100, 30)
+        heatmap.add(10.0 + 3 * i, mz, intensity)
+        times.append(np.full(30, 3.0 * i))
+        mzs.append(mz)
+        weights.append(intensity)
+    grid, rt_edges, mz_edges = heatmap.result()
+    # 147 s do not fit 8 rows of 1, 2, 4 or 16 s, so rows are 32 s wide
+    assert heatmap.rt_step == 32
+    assert len(grid) == 5
+    expected, _, _ = np.histogram2d(
+        np.concatenate(times),
+        np.concatenate(mzs),
+        bins=[np.arange(6) * 32.0, mz_edges],
+        weights=np.concatenate(weights),
+    )
+    np.testing.assert_allclose(grid, expected, rtol=1e-5)
+    np.testing.assert_allclose(rt_edges, 10 + np.arange(6) * 32.0)
+
+
+def test_batches_do_not_change_result(monkeypatch) -> None:
+    spectra = [
+        (float(i), np.linspace(100, 2000, 100), np.full(100, float(i)))
+        for i in range(100)
+    ]
+    whole = preview.Heatmap(rt_bins=16, mz_bins=32)
+    for spectrum in spectra:
+        whole.add(*spectrum)
+    monkeypatch.setattr(preview, "BATCH_PEAKS", 150)
+    batched = preview.Heatmap(rt_bins=16, mz_bins=32)
+    for spectrum in spectra:
+        batched.add(*spectrum)
+    np.testing.assert_array_equal(whole.result()[0], batched.result()[0])
+
+
+def test_write_preview(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(12))
+    outputs = preview.write_preview(path, rt_bins=8, mz_bins=16)
+    assert outputs == [
+        str(tmp_path / "run_preview.npz"),
+        str(tmp_path / "run_preview.png"),
+    ]
+    with np.load(outputs[0]) as saved:
+        intensity = saved["intensity"]
+        assert intensity.shape[1] == 16
+        ms1 = [s for s in mzml.iter_spectra(path) if s.ms_level == 1]
+        assert intensity.sum() == pytest.approx(
+            sum(float(s.intensity.sum()) for s in ms1), rel=1e-5
+        )
+    image = _read_png(tmp_path / "run_preview.png")
+    assert image.shape == (16, len(intensity), 3)
+
+
+def test_preview_stage_matches(tmp_path: Path) -> None:
+    data = build_mzml(sample_spectra(10))
+    path = tmp_path / "run.mzML"
+    path.write_bytes(data)
+    stage = follow.PreviewStage()
+    for offset, block in mzml.scan_blocks(data.splitlines(keepends=True)):
+        stage.feed(mzml.parse_spectrum(block, offset))
+    with np.load(stage.finish(str(path))[0]) as streamed:
+        intensity = streamed["intensity"]
+    with np.load(preview.write_preview(str(path))[0]) as direct:
+        np.testing.assert_array_equal(intensity, direct["intensity"])
+
+
+def test_cli(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(4))
+    assert main(["preview", path, "--rt_bins", "4", "--mz", "100", "2000"]) is None
+    assert (tmp_path / "run_preview.png").exists()
+    with pytest.raises(SystemExit):
+        main(["preview", path, "--rt_bins", "3"])
+
+    raw = tmp_path / "other.raw"
+    raw.write_text("x")
+
+    def fake_convert(params, runner=None):
+        return write_mzml(tmp_path / "other.mzML", sample_spectra(4))
+
+    with (
+        mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert),
+        mock.patch("mzx.cli.vendor.vendor_name_from_file", return_value="thermo"),
+    ):
+        assert main([str(raw), "--preview", "--no_verify"]) == 0
+    assert (tmp_path / "other_preview.npz").exists()
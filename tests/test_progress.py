@@ -0,0 +1,36 @@
+"""Tests for msconvert progress parsing and queue throughput estimates."""
+
+import pytest
+
+from mzx import progress
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("writing spectra: 50/200\n", 0.25),
+        ("[SpectrumList_PeakPicker] writing spectra: 200/200", 1.0),
+        ("writing chromatograms: 1/4", None),
+        ("processing file: run.raw", None),
+        ("writing spectra: 0/0", None),
+    ],
+)
+def test_parse_progress(line: str, expected) -> None:
+    assert progress.parse_progress(line) == expected
+
+
+def test_throughput_and_eta() -> None:
+    now = [0.0]
+    meter = progress.ThroughputMeter(clock=lambda: now[0])
+    assert meter.eta(4, 2) is None
+    meter.record(30.0)
+    meter.record(90.0)
+    now[0] = 120.0
+    assert meter.throughput() == pytest.approx(1.0)
+    # Mean 60 s per file, 4 files on 2 workers
+    assert meter.eta(4, 2) == pytest.approx(120.0)
+
+
+def test_format_duration() -> None:
+    assert progress.format_duration(None) == "--"
+    assert progress.format_duration(3725.4) == "1:02:05"
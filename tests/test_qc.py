@@ -0,0 +1,135 @@
+"""Tests for per-run QC metrics."""
+
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pytest
+from mzml_helpers import build_mzml, sample_spectra, write_mzml
+from test_chromatograms import _build_chrodat, _build_chroinf
+from test_waters import _make_raw
+
+from mzx import follow, mzml, qc
+from mzx.cli import main
+
+
+def _waters_run(tmp_path: Path) -> str:
+    raw = _make_raw(tmp_path, "run.raw")
+    (raw / "_chroms.inf").write_bytes(
+        _build_chroinf([("TUV 260", " AU"), ("System Pressure", " psi")])
+    )
+    (raw / "_CHRO001.DAT").write_bytes(_build_chrodat([(0.5, 0.1), (1.0, 0.3)]))
+    (raw / "_CHRO002.DAT").write_bytes(
+        _build_chrodat([(0.5, 5000.0), (1.0, 5100.0), (1.5, 5200.0)])
+    )
+    return str(raw)
+
+
+def test_spectrum_metrics(tmp_path: Path) -> None:
+    spectra = sample_spectra(10)
+    path = write_mzml(tmp_path / "run.mzML", spectra)
+    with open(qc.run_qc(path)) as f:
+        record = json.load(f)
+    assert record["run"] == "run"
+    assert record["spectra"] == 10
+    assert (record["ms1"], record["ms2"]) == (5, 5)
+    assert record["ms_levels"] == {"1": 5, "2": 5}
+    assert record["rt_span"] == pytest.approx(4.5 * 60)
+    assert record["scan_rate"] == pytest.approx(9 / 270)
+    assert record["ms1_cycle_time"] == pytest.approx(60)
+    tics = np.array([s.tic for s in mzml.iter_spectra(path) if s.ms_level == 1])
+    assert record["tic_cv"] == pytest.approx(tics.std() / tics.mean())
+    assert record["raw"] is None and "lockmass" not in record
+
+
+def test_missing_tic_is_skipped() -> None:
+    collector = qc.QcCollector()
+    for rt, tic in ((0.0, 100.0), (1.0, None), (2.0, 300.0)):
+        collector.feed(SimpleNamespace(ms_level=1, rt=rt, tic=tic))
+    metrics = collector.metrics()
+    assert metrics["ms1"] == 3
+    assert metrics["tic_median"] == 200.0
+    assert metrics["tic_cv"] == pytest.approx(0.5)
+
+
+def test_concurrent_appends_write_one_header(tmp_path: Path) -> None:
+    table = str(tmp_path / "batch_qc.tsv")
+    records = [{"run": f"run{i}", "spectra": i} for i in range(16)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda r: qc.append_table(table, r), records))
+    with open(table) as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    assert sorted(r["run"] for r in rows) == sorted(r["run"] for r in records)
+
+
+def test_waters_metrics_and_table(tmp_path: Path) -> None:
+    raw_dir = _waters_run(tmp_path)
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(4))
+    table = str(tmp_path / "batch_qc.tsv")
+    qc.run_qc(path, raw_dir, table=table)
+    qc.run_qc(path, raw_dir, table=table)
+    with open(tmp_path / "run_qc.json") as f:
+        record = json.load(f)
+    assert record["lockmass"] == "_FUNC003"
+    assert record["lockmass_present"]
+    pressure = record["analog"]["System Pressure"]
+    assert pressure["pressure"] and pressure["unit"] == "psi"
+    assert (pressure["min"], pressure["max"], pressure["mean"]) == (5000, 5200, 5100)
+    assert not record["analog"]["TUV 260"]["pressure"]
+
+    with open(table) as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    assert len(rows) == 2
+    assert list(rows[0]) == qc.TABLE_COLUMNS
+    assert rows[0]["pressure_max"] == "5200.0"
+    assert rows[0]["lockmass"] == "_FUNC003"
+
+
+def test_stage_matches_run_qc(tmp_path: Path) -> None:
+    data = build_mzml(sample_spectra(8))
+    path = tmp_path / "run.mzML"
+    path.write_bytes(data)
+    stage = follow.QcStage()
+    for offset, block in mzml.scan_blocks(data.splitlines(keepends=True)):
+        stage.feed(mzml.parse_spectrum(block, offset, decode=False))
+    with open(stage.finish(str(path))[0]) as f:
+        streamed = json.load(f)
+    with open(qc.run_qc(str(path))) as f:
+        direct = json.load(f)
+    streamed.pop("created")
+    direct.pop("created")
+    assert streamed == direct
+
+
+def test_cli(tmp_path: Path) -> None:
+    raw_dir = _waters_run(tmp_path)
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(4))
+    table = str(tmp_path / "qc.tsv")
+    assert main(["qc", path, "--table", table]) == 0
+    with open(tmp_path / "run_qc.json") as f:
+        assert json.load(f)["raw"] == raw_dir
+    # An output left by an earlier conversion
+    os.utime(path, (0, 0))
+
+    data = build_mzml(sample_spectra(6))
+
+    def fake_convert(params, runner=None):
+        (tmp_path / "run.mzML").write_bytes(data)
+        return str(tmp_path / "run.mzML")
+
+    with (
+        mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert),
+        mock.patch("mzx.qc.mzml.iter_spectra") as reread,
+    ):
+        argv = [raw_dir, "--pipeline", "--qc_table", table, "--no_verify"]
+        assert main(argv) == 0
+    # The QC came from the followed pass, not a second read
+    reread.assert_not_called()
+    with open(table) as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    assert [row["spectra"] for row in rows] == ["4", "6"]
@@ -34,3 +34,23 @@ def test_run_cmd_accumulates_multiple_lines() -> None:
         out = run_cmd("dummy")
 
     assert out == "first\nsecond\n"
+
+
+def test_run_cmd_callbacks() -> None:
+    remaining = ["writing spectra: 1/2\n", ""]
+
+    class FakeStdout:
+        def readline(self):
+            return remaining.pop(0)
+
+    class FakeProc:
+        stdout = FakeStdout()
+
+    started = []
+    lines = []
+    proc = FakeProc()
+    with mock.patch("mzx.subprocess.Popen", return_value=proc):
+        run_cmd("dummy", on_start=started.append, on_line=lines.append)
+
+    assert started == [proc]
+    assert lines == ["writing spectra: 1/2\n"]
@@ -0,0 +1,195 @@
+"""Tests for the mzx serve conversion service (fake msconvert backend)."""
+
+import gzip
+import json
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from threading import Thread
+
+import pytest
+from mzml_helpers import sample_spectra, write_mzml
+
+from mzx import server
+
+
+@pytest.fixture
+def service(tmp_path: Path):
+    service = server.ConversionService(
+        str(tmp_path / "service"), workers=1, runner=server.fake_runner
+    )
+    httpd = server.make_server(service, port=0)
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    service.start()
+    service.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield service
+    httpd.shutdown()
+    httpd.server_close()
+    service.stop()
+
+
+def _request(url: str, data: dict | None = None, method: str | None = None):
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(url, data=body, method=method)
+    request.add_header("Content-Type", "application/json")
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status, dict(response.headers), response.read()
+
+
+def _wait(service, job_id: int) -> dict:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        _, _, body = _request(f"{service.url}/jobs/{job_id}")
+        job = json.loads(body)
+        if job["state"] in server.FINISHED_STATES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_convert_job(service, tmp_path: Path) -> None:
+    raw = tmp_path / "run.raw"
+    raw.write_text("x")
+    status, _, body = _request(
+        f"{service.url}/jobs", {"kind": "convert", "params": {"infile": str(raw)}}
+    )
+    assert status == 201
+    job = _wait(service, json.loads(body)["id"])
+    assert job["state"] == "done"
+    assert job["progress"] == 1
+    assert job["artifacts"] == ["run.mzML"]
+
+    _, _, data = _request(f"{service.url}/jobs/{job['id']}/artifacts/run.mzML")
+    assert data == (tmp_path / "run.mzML").read_bytes()
+
+    _, headers, log = _request(f"{service.url}/jobs/{job['id']}/log")
+    assert b"writing spectra" in log
+    assert int(headers["X-Log-Offset"]) == len(log)
+    _, _, followed = _request(f"{service.url}/jobs/{job['id']}/log?follow=1")
+    assert followed == log
+
+
+def test_chromatogram_job(service, tmp_path: Path) -> None:
+    mzml = write_mzml(str(tmp_path / "run.mzML"), sample_spectra(4))
+    _, _, body = _request(
+        f"{service.url}/jobs",
+        {"kind": "chromatograms", "params": {"infile": mzml}},
+    )
+    job = _wait(service, json.loads(body)["id"])
+    assert job["state"] == "done"
+    assert job["artifacts"] == ["run_TIC.csv"]
+
+    gzipped = tmp_path / "gz" / "run.mzML.gz"
+    gzipped.parent.mkdir()
+    with open(mzml, "rb") as f, gzip.open(gzipped, "wb") as out:
+        out.write(f.read())
+    _, _, body = _request(
+        f"{service.url}/jobs",
+        {"kind": "chromatograms", "params": {"infile": str(gzipped)}},
+    )
+    job = _wait(service, json.loads(body)["id"])
+    assert job["state"] == "done"
+    assert job["artifacts"] == ["run_TIC.csv"]
+
+
+def test_invalid_jobs_are_rejected(service, tmp_path: Path) -> None:
+    for request in (
+        {"kind": "unknown", "params": {"infile": str(tmp_path)}},
+        {"kind": "convert", "params": {"infile": str(tmp_path / "missing.raw")}},
+        {"kind": "convert", "params": {"infile": str(tmp_path), "bogus": 1}},
+    ):
+        with pytest.raises(urllib.error.HTTPError) as e:
+            _request(f"{service.url}/jobs", request)
+        assert e.value.code == 400
+        e.value.close()
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _request(f"{service.url}/jobs/999")
+    assert e.value.code == 404
+    e.value.close()
+
+
+def test_validate_checks_types_and_choices(tmp_path: Path) -> None:
+    infile = str(tmp_path)
+    server.validate(
+        "convert",
+        {"infile": infile, "peak_picking": "ms1", "neg_lockmass": 554, "outfile": None},
+    )
+    server.validate("chromatograms", {"infile": infile, "decimation": "lttb"})
+    for params in (
+        {"peak_picking": "everything"},
+        {"type": "mzML"},
+        {"remove_zeros": "true"},
+        {"verify": 1},
+        {"neg_lockmass": "554.26"},
+        {"lockmass_tolerance": True},
+        {"outfile": 3},
+        {"decimation": "mean"},
+        {"decimation": "lttb", "points": 2},
+    ):
+        with pytest.raises(server.JobError):
+            server.validate("convert", {"infile": infile, **params})
+
+
+def test_queue_survives_restart(tmp_path: Path) -> None:
+    raw = tmp_path / "run.raw"
+    raw.write_text("x")
+    root = str(tmp_path / "service")
+    first = server.ConversionService(root, workers=1, runner=server.fake_runner)
+    queued = first.submit("convert", {"infile": str(raw)})
+    cancelled = first.submit("convert", {"infile": str(raw)})
+    assert first.cancel(cancelled.id)
+    # Simulate a crash while the job was running
+    assert first.queue.claim() is not None
+    first.stop()
+
+    second = server.ConversionService(root, workers=1, runner=server.fake_runner)
+    assert second.queue.state(queued.id) == "queued"
+    second.start()
+    deadline = time.monotonic() + 10
+    while second.queue.state(queued.id) != "done" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    second.stop()
+    reopened = server.JobQueue(str(tmp_path / "service" / "jobs.db"))
+    assert reopened.state(queued.id) == "done"
+    assert reopened.state(cancelled.id) == "cancelled"
+    reopened.close()
+
+
+def test_service_stages_next_input(tmp_path: Path) -> None:
+    raws = []
+    for name in ("first.raw", "second.raw"):
+        raw = tmp_path / name
+        raw.write_text("x")
+        raws.append(raw)
+    scratch = tmp_path / "scratch"
+    staged_meanwhile = []
+
+    def runner(cmd: str, on_start=None, on_line=None) -> str:
+        assert str(scratch) in cmd
+        if "first" in cmd:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if list(scratch.glob("*/second.raw")):
+                    staged_meanwhile.append(True)
+                    break
+                time.sleep(0.01)
+        return server.fake_runner(cmd, on_start=on_start, on_line=on_line)
+
+    service = server.ConversionService(
+        str(tmp_path / "service"), workers=1, runner=runner, scratch=str(scratch)
+    )
+    jobs = [service.submit("convert", {"infile": str(raw)}) for raw in raws]
+    service.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and any(
+        service.queue.state(job.id) != "done" for job in jobs
+    ):
+        time.sleep(0.05)
+    service.stop()
+    # The second input was copied to scratch while the first one converted
+    assert staged_meanwhile == [True]
+    assert (tmp_path / "first.mzML").exists()
+    assert (tmp_path / "second.mzML").exists()
+    assert list(scratch.iterdir()) == []
@@ -0,0 +1,118 @@
+"""Tests for local scratch staging of conversion inputs."""
+
+import os
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from mzml_helpers import build_mzml, sample_spectra, write_mzml
+
+from mzx import staging
+from mzx.cli import main
+
+
+def _make_waters_dir(root: Path, name: str = "sample.raw", size: int = 1000) -> Path:
+    raw = root / name
+    raw.mkdir()
+    (raw / "_extern.inf").write_text("header\n")
+    (raw / "_FUNC001.DAT").write_bytes(os.urandom(size))
+    (raw / "sub").mkdir()
+    (raw / "sub" / "_CHRO001.DAT").write_bytes(os.urandom(size // 2))
+    return raw
+
+
+def test_copy_tree_copies_directory(tmp_path: Path) -> None:
+    raw = _make_waters_dir(tmp_path)
+    dst = tmp_path / "scratch" / "sample.raw"
+    copied = staging.copy_tree(str(raw), str(dst), workers=2)
+    assert copied == 1507
+    assert (dst / "_FUNC001.DAT").read_bytes() == (raw / "_FUNC001.DAT").read_bytes()
+    assert (dst / "sub" / "_CHRO001.DAT").exists()
+
+
+def test_copy_file_detects_corruption(tmp_path: Path) -> None:
+    src = tmp_path / "a.bin"
+    src.write_bytes(b"abc")
+    with (
+        mock.patch("mzx.staging.file_checksum", return_value="bad"),
+        pytest.raises(staging.StagingError, match="Checksum mismatch"),
+    ):
+        staging.copy_file(str(src), str(tmp_path / "b.bin"))
+
+
+def test_publish_moves_file(tmp_path: Path) -> None:
+    src = tmp_path / "scratch" / "out.mzML"
+    src.parent.mkdir()
+    src.write_text("<mzML/>")
+    dest = tmp_path / "share"
+    dest.mkdir()
+    final = staging.publish(str(src), str(dest))
+    assert final == str(dest / "out.mzML")
+    assert (dest / "out.mzML").read_text() == "<mzML/>"
+    assert not src.exists()
+    assert os.listdir(dest) == ["out.mzML"]
+
+
+def test_stage_and_prefetch(tmp_path: Path) -> None:
+    a = _make_waters_dir(tmp_path, "a.raw")
+    b = _make_waters_dir(tmp_path, "b.raw")
+    with staging.StagingArea(str(tmp_path / "scratch")) as area:
+        staged_a = area.stage(str(a))
+        future = area.prefetch(str(b))
+        staged_b = area.stage(str(b))
+        assert future.result() == staged_b
+        assert os.path.basename(staged_a) == "a.raw"
+        assert os.path.isdir(staged_b)
+        assert os.path.dirname(staged_a) != os.path.dirname(staged_b)
+    assert os.listdir(tmp_path / "scratch") == []
+
+
+def test_budget_evicts_idle_inputs(tmp_path: Path) -> None:
+    a = _make_waters_dir(tmp_path, "a.raw")
+    b = _make_waters_dir(tmp_path, "b.raw")
+    area = staging.StagingArea(str(tmp_path / "scratch"), budget_bytes=2000)
+    staged_a = area.stage(str(a))
+    area.release(str(a))
+    area.stage(str(b))
+    assert not os.path.exists(staged_a)
+    area.close()
+
+
+def test_input_larger_than_budget_is_rejected(tmp_path: Path) -> None:
+    a = _make_waters_dir(tmp_path, "a.raw")
+    area = staging.StagingArea(str(tmp_path / "scratch"), budget_bytes=100)
+    with pytest.raises(staging.StagingError, match="budget"):
+        area.stage(str(a))
+    area.close()
+
+
+def test_staged_inputs_removes_previous_job(tmp_path: Path) -> None:
+    inputs = [str(_make_waters_dir(tmp_path, f"{n}.raw")) for n in "abc"]
+    seen = []
+    with staging.StagingArea(str(tmp_path / "scratch")) as area:
+        for infile, staged in staging.staged_inputs(area, inputs):
+            assert os.path.isdir(staged)
+            seen.append(infile)
+        assert os.listdir(tmp_path / "scratch") == []
+    assert seen == inputs
+
+
+def test_cli_scratch_converts_staged_copy(tmp_path: Path, monkeypatch) -> None:
+    share = tmp_path / "share"
+    share.mkdir()
+    raw = share / "run.raw"
+    raw.write_text("x")
+    scratch = tmp_path / "scratch"
+
+    def fake_convert(params, runner=None):
+        assert params["infile"] != str(raw)
+        assert params["infile"].startswith(str(scratch))
+        out = os.path.join(os.path.dirname(params["infile"]), "run.mzML")
+        return write_mzml(out, sample_spectra(2))
+
+    monkeypatch.setattr(sys, "argv", ["mzx", str(raw), "--scratch", str(scratch)])
+    with mock.patch("mzx.cli.convert_raw_file", side_effect=fake_convert):
+        main()
+    assert (share / "run.mzML").read_bytes() == build_mzml(sample_spectra(2))
+    assert os.listdir(scratch) == []
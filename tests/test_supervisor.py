@@ -0,0 +1,161 @@
+"""Tests for supervised conversion commands."""
+
+import shlex
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from mzx import docker, supervisor
+
+
+def _python(code: str) -> str:
+    return f"{shlex.quote(sys.executable)} -u -c {shlex.quote(code)}"
+
+
+@pytest.fixture(autouse=True)
+def no_docker():
+    with (
+        mock.patch("mzx.supervisor.docker.remove_container", return_value=False),
+        mock.patch("mzx.supervisor.docker.remove_orphans", return_value=[]),
+    ):
+        yield
+
+
+def test_output_and_exit_status() -> None:
+    lines = []
+    result = supervisor.supervise(
+        _python("import sys; print('writing spectra: 1/2'); sys.exit(3)"),
+        on_line=lines.append,
+    )
+    assert result.returncode == 3
+    assert result.reason == supervisor.EXITED
+    assert not result.ok and not result.retryable
+    assert lines == ["writing spectra: 1/2\n"]
+    assert result.output == "writing spectra: 1/2\n"
+
+
+def test_idle_watchdog_stops_silent_command() -> None:
+    started = time.monotonic()
+    result = supervisor.supervise(
+        _python("import time; print('reading'); time.sleep(60)"),
+        supervisor.Limits(idle_timeout=0.5),
+    )
+    assert time.monotonic() - started < 10
+    assert result.reason == supervisor.IDLE
+    assert result.retryable
+    assert result.output == "reading\n"
+
+
+def test_wall_clock_limit_stops_chatty_command() -> None:
+    code = "import time\nwhile True:\n    print('x', flush=True)\n    time.sleep(0.05)"
+    result = supervisor.supervise(
+        _python(code), supervisor.Limits(timeout=0.5, idle_timeout=5)
+    )
+    assert result.reason == supervisor.TIMED_OUT
+    assert "timed out" in result.describe()
+
+
+def test_container_is_removed() -> None:
+    assert (
+        supervisor.container_of(
+            ["docker", "run", "--rm", "--name", "mzx-run", "image", "wine"]
+        )
+        == "mzx-run"
+    )
+    assert supervisor.container_of(["echo", "--name", "x"]) is None
+    with mock.patch(
+        "mzx.supervisor.docker.remove_container", return_value=True
+    ) as remove:
+        supervisor.supervise(
+            _python("import time; time.sleep(60)"),
+            supervisor.Limits(idle_timeout=0.3),
+            container="mzx-run",
+        )
+    # Only when the watchdog fired, never before the start: a container of
+    # that name belongs to another job
+    assert [c.args for c in remove.call_args_list] == [("mzx-run",)]
+
+
+def test_cancel_removes_container() -> None:
+    cancelled = threading.Event()
+    threading.Timer(0.3, cancelled.set).start()
+    with mock.patch(
+        "mzx.supervisor.docker.remove_container", return_value=True
+    ) as remove:
+        result = supervisor.supervise(
+            _python("import time; time.sleep(60)"),
+            container="mzx-cancel",
+            cancelled=cancelled,
+        )
+    assert result.reason == supervisor.CANCELLED
+    assert not result.retryable
+    assert [c.args for c in remove.call_args_list] == [("mzx-cancel",)]
+
+    runner = supervisor.Supervisor(supervisor.Limits(idle_timeout=0.2), retries=3)
+    threading.Timer(0.5, runner.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(supervisor.CommandError) as e:
+        runner(_python("import time; time.sleep(60)"))
+    # The backoff after the first attempt is cut short
+    assert time.monotonic() - started < 10
+    assert e.value.result.reason == supervisor.CANCELLED
+
+
+def test_container_name_is_unique_per_job() -> None:
+    name = docker.container_name("/data/My Run (1).raw/")
+    other = docker.container_name("/data/My Run (1).raw")
+    assert name.startswith("mzx-My_Run__1_.raw-")
+    assert name != other
+    assert name.rsplit("-", 2)[0] == other.rsplit("-", 2)[0]
+    assert docker.container_name("/data/x.raw", "1") == docker.container_name(
+        "/data/x.raw/", "1"
+    )
+    assert (
+        name.rsplit("-", 2)[0]
+        != docker.container_name("/other/My Run (1).raw").rsplit("-", 2)[0]
+    )
+
+
+def test_supervisor_removes_orphans_first() -> None:
+    name = docker.container_name("/data/run.raw")
+    cmd = f"docker run --rm --name {name} image"
+    result = supervisor.RunResult(cmd, 0, "", 0.0, supervisor.EXITED)
+    with (
+        mock.patch("mzx.supervisor.supervise", return_value=result),
+        mock.patch("mzx.supervisor.docker.remove_orphans") as remove_orphans,
+    ):
+        supervisor.Supervisor()(cmd)
+    remove_orphans.assert_called_once_with(name)
+
+
+def test_retries_with_backoff(tmp_path: Path) -> None:
+    marker = tmp_path / "attempts"
+    code = (
+        f"import sys, pathlib; p = pathlib.Path({str(marker)!r}); "
+        "n = len(p.read_text()) if p.exists() else 0; p.write_text('x' * (n + 1)); "
+        "sys.exit(125 if n < 2 else 0)"
+    )
+    runner = supervisor.Supervisor(retries=2, backoff=0.01)
+    assert runner(_python(code)) == ""
+    assert runner.results[-1].attempts == 3
+
+    runner = supervisor.Supervisor(retries=1, backoff=0.01)
+    with pytest.raises(supervisor.CommandError) as e:
+        runner(_python("import sys; sys.exit(1)"))
+    # A plain failure is not retried
+    assert e.value.result.attempts == 1
+
+
+def test_limits_scale_with_input_size(tmp_path: Path) -> None:
+    small = tmp_path / "small.raw"
+    small.write_bytes(b"x")
+    limits = supervisor.Limits.for_input(str(small), timeout=100, idle_timeout=0)
+    assert limits.timeout == pytest.approx(100, abs=0.01)
+    assert limits.idle_timeout is None
+    with mock.patch("mzx.supervisor.disk_usage", return_value=2e9):
+        limits = supervisor.Limits.for_input(str(small))
+    assert limits.timeout == supervisor.TIMEOUT + 2 * supervisor.TIMEOUT_PER_GB
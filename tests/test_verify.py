@@ -0,0 +1,91 @@
+"""Tests for the mzML integrity check."""
+
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from mzml_helpers import build_mzml, sample_spectra, write_mzml
+
+from mzx import verify
+from mzx.cli import main
+
+
+def test_valid_indexed_file(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(5))
+    result = verify.verify_mzml(path)
+    assert result.ok, result.errors
+    assert result.indexed
+    assert result.spectra == 5
+
+
+def test_valid_plain_file(tmp_path: Path) -> None:
+    path = write_mzml(tmp_path / "run.mzML", sample_spectra(3), indexed=False)
+    result = verify.verify_mzml(path)
+    assert result.ok, result.errors
+    assert not result.indexed
+    assert result.spectra == 3
+
+
+def test_truncated_file(tmp_path: Path) -> None:
+    data = build_mzml(sample_spectra(5))
+    path = tmp_path / "run.mzML"
+    path.write_bytes(data[: len(data) // 2])
+    result = verify.verify_mzml(str(path))
+    assert not result.ok
+    assert "truncated" in result.errors[0]
+
+
+def test_shifted_offsets_and_checksum(tmp_path: Path) -> None:
+    # Rewriting an id in place, as a header rewrite would, shifts every
+    # following element and invalidates the checksum
+    data = build_mzml(sample_spectra(5))
+    data = data.replace(b'id="scan=2"', b'id="scan=2 fscan=7"', 1)
+    path = tmp_path / "run.mzML"
+    path.write_bytes(data)
+    result = verify.verify_mzml(str(path))
+    assert not result.ok
+    assert any("does not point at scan=3" in e for e in result.errors)
+    assert any("indexListOffset" in e for e in result.errors)
+    assert any("SHA-1 mismatch" in e for e in result.errors)
+    unchecked = verify.verify_mzml(str(path), checksum=False)
+    assert not any("SHA-1" in e for e in unchecked.errors)
+
+
+def test_count_mismatch(tmp_path: Path) -> None:
+    data = build_mzml(sample_spectra(3), indexed=False)
+    path = tmp_path / "run.mzML"
+    path.write_bytes(
+        data.replace(b'<spectrumList count="3"', b'<spectrumList count="4"')
+    )
+    result = verify.verify_mzml(str(path))
+    assert result.errors == ["spectrumList count is 4 but 3 spectra were found"]
+
+
+def test_cli_verify_exit_code(tmp_path: Path) -> None:
+    good = write_mzml(tmp_path / "good.mzML", sample_spectra(2))
+    bad = tmp_path / "bad.mzML"
+    bad.write_bytes(build_mzml(sample_spectra(2))[:-40])
+    assert main(["verify", good]) == 0
+    assert main(["verify", good, str(bad)]) == 1
+
+
+def test_conversion_output_is_verified(tmp_path: Path, monkeypatch) -> None:
+    raw = tmp_path / "run.raw"
+    raw.write_bytes(b"")
+    out = tmp_path / "run.mzML"
+    out.write_bytes(build_mzml(sample_spectra(2))[:100])
+    monkeypatch.setattr(sys, "argv", ["mzx", str(raw)])
+    with (
+        mock.patch("mzx.cli.convert_raw_file", return_value=str(out)),
+        mock.patch("mzx.cli.logger") as log,
+    ):
+        main()
+    log.error.assert_any_call("Raw file conversion failed!")
+
+
+def test_check_output_raises(tmp_path: Path) -> None:
+    path = tmp_path / "run.mzML"
+    path.write_bytes(b"")
+    with pytest.raises(verify.VerificationError):
+        verify.check_output(str(path))
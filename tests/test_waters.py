@@ -0,0 +1,107 @@
+"""Tests for the Waters .raw directory model and mzx preflight."""
+
+import json
+import os
+from pathlib import Path
+from unittest import mock
+
+from mzx import get_chromatogram_info, waters
+from mzx.cli import main
+
+EXTERN = """\
+Function Parameters - Function 1 - TOF PARENT FUNCTION
+Polarity\t\t\t\tES+
+Scan Time (sec)\t\t\t0.5
+Function Parameters - Function 2 - TOF PARENT FUNCTION
+Polarity\t\t\t\tES+
+Function Parameters - Function 3 - TOF REFERENCE FUNCTION
+Polarity\t\t\t\tES+
+"""
+
+HEADER = """\
+$$ Acquired Name: run1
+$$ Acquired Date: 07-Jun-2019
+$$ Acquired Time: 14:22:31
+$$ Instrument: XEVO-G2XSQTOF
+"""
+
+
+def _make_raw(root: Path, name: str = "run1.raw", functions: int = 3) -> Path:
+    raw = root / name
+    raw.mkdir()
+    (raw / "_extern.inf").write_text(EXTERN, encoding="latin-1")
+    (raw / "_HEADER.TXT").write_text(HEADER, encoding="latin-1")
+    (raw / "_FUNCTNS.INF").write_bytes(b"\0" * 416 * functions)
+    for n in range(1, functions + 1):
+        (raw / f"_FUNC{n:03d}.DAT").write_bytes(b"\0" * 16)
+        (raw / f"_FUNC{n:03d}.IDX").write_bytes(b"\0" * 16)
+    (raw / "_CHRO001.DAT").write_bytes(b"\0" * 0x80)
+    (raw / "_CHRO002.DAT").write_bytes(b"\0" * 0x80)
+    return raw
+
+
+def test_metadata(tmp_path: Path) -> None:
+    raw = waters.WatersRawDirectory(_make_raw(tmp_path))
+    assert raw.name == "run1"
+    assert list(raw.function_files) == [1, 2, 3]
+    assert raw.function_count == 3
+    assert list(raw.analog_files) == [1, 2]
+    assert raw.lockmass_function == ("_FUNC003", 3)
+    assert raw.polarities == {1: "positive", 2: "positive", 3: "positive"}
+    assert raw.polarity == "positive"
+    assert raw.header["Instrument"] == "XEVO-G2XSQTOF"
+    assert raw.acquired is not None
+    assert raw.acquired.isoformat() == "2019-06-07T14:22:31"
+    assert raw.functions_path is not None
+    assert raw.chromatogram_info == []
+    assert raw.problems() == []
+
+
+def test_mixed_polarity_and_missing_lockmass_function(tmp_path: Path) -> None:
+    path = _make_raw(tmp_path, functions=2)
+    extern = EXTERN.replace(
+        "Function 2 - TOF PARENT FUNCTION\nPolarity\t\t\t\tES+",
+        "Function 2 - TOF PARENT FUNCTION\nPolarity\t\t\t\tES-",
+    )
+    (path / "_extern.inf").write_text(extern, encoding="latin-1")
+    raw = waters.WatersRawDirectory(path)
+    assert raw.polarity == "mixed"
+    assert raw.problems() == ["lockmass function _FUNC003 is missing"]
+
+
+def test_directory_is_listed_once(tmp_path: Path) -> None:
+    raw = waters.WatersRawDirectory(_make_raw(tmp_path))
+    with mock.patch("mzx.waters.os.listdir", wraps=os.listdir) as listdir:
+        raw.summary()
+        raw.summary()
+        assert raw.chromatogram_info == []
+    listdir.assert_called_once()
+
+
+def test_raw_directory_is_shared_until_the_directory_changes(tmp_path: Path) -> None:
+    path = _make_raw(tmp_path)
+    first = waters.raw_directory(path)
+    assert waters.raw_directory(str(path)) is first
+    (path / "_FUNC004.DAT").write_bytes(b"")
+    os.utime(path, ns=(0, 0))
+    assert waters.raw_directory(path) is not first
+    assert get_chromatogram_info(str(path)) == []
+
+
+def test_preflight_cli(tmp_path: Path, capsys) -> None:
+    good = _make_raw(tmp_path, "a.raw")
+    empty = tmp_path / "b.raw"
+    empty.mkdir()
+    missing = tmp_path / "c.raw"
+    assert main(["preflight", "--json", str(good), str(empty), str(missing)]) == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [s["name"] for s in lines] == ["a", "b", "c"]
+    assert lines[0]["functions"] == 3
+    assert lines[0]["lockmass_function"] == 3
+    assert lines[0]["acquired"] == "2019-06-07T14:22:31"
+    assert lines[1]["problems"] == ["no _extern.inf file", "no _FUNC*.DAT files"]
+    assert lines[2]["problems"]
+
+    assert main(["preflight", str(good)]) == 0
+    table = capsys.readouterr().out.splitlines()
+    assert table[1].split("\t")[:4] == ["a", "3", "3", "positive"]